@@ -14,8 +14,13 @@
 #    under the License.
 
 
+import collections
+import hashlib
+import mmap
+import multiprocessing
 import os
 import re
+import struct
 
 from oslo.config import cfg
 import six.moves.urllib.parse as urlparse
@@ -25,6 +30,7 @@ from cinder.api.openstack import wsgi
 from cinder.api import xmlutil
 from cinder.openstack.common.gettextutils import _
 from cinder.openstack.common import log as logging
+from cinder.openstack.common import strutils
 from cinder import utils
 
 
@@ -362,3 +368,87 @@ class MetadataTemplate(xmlutil.TemplateBuilder):
         elem.set('key', 0)
         elem.text = 1
         return xmlutil.MasterTemplate(root, 1, nsmap=metadata_nsmap)
+
+
+def build_limit_routes(limits):
+    """Return the rate limits to check for every HTTP verb.
+
+    @param limits: List of limits, with their regexes
+    @return: Dict of verb to a list of (index in limits, compiled regex)
+    """
+    routes = collections.defaultdict(list)
+    for index, limit in enumerate(limits):
+        routes[limit.verb].append((index, re.compile(limit.regex)))
+    return dict(routes)
+
+
+class UserLevels(object):
+    """The limits of every user, with their levels.
+
+    Only the max_users most recently seen users are kept, the others start
+    over with empty buckets.  Users with their own limits are never
+    forgotten, as their limits can't be rebuilt.
+    """
+
+    def __init__(self, limits, max_users):
+        self._limits = limits
+        self._max_users = max_users
+        self._user_limits = {}
+        self._levels = collections.OrderedDict()
+
+    def __setitem__(self, username, limits):
+        self._user_limits[username] = limits
+
+    def __getitem__(self, username):
+        if username in self._user_limits:
+            return self._user_limits[username]
+        levels = self._levels.pop(username, None)
+        if levels is None:
+            levels = [limit.copy() for limit in self._limits]
+            if len(self._levels) >= self._max_users:
+                self._levels.popitem(last=False)
+        self._levels[username] = levels
+        return levels
+
+    def __contains__(self, username):
+        return username in self._user_limits or username in self._levels
+
+    def __len__(self):
+        return len(self._user_limits) + len(self._levels)
+
+
+class SharedLevels(object):
+    """Water levels kept in memory shared by the forked API workers.
+
+    The levels are kept in a table of slots indexed by a hash of the user
+    and limit, so that every worker sees the requests of the others.  Two
+    buckets hashing to the same slot evict each other, starting over empty.
+    The table must be created before the workers are forked.
+    """
+
+    # Bucket hash, water level and last request time.
+    SLOT = struct.Struct('=Qdd')
+
+    def __init__(self, slots):
+        self.slots = slots
+        self._table = mmap.mmap(-1, slots * self.SLOT.size)
+        self._lock = multiprocessing.Lock()
+
+    def update(self, key, fill):
+        """Update the level of bucket key with fill.
+
+        @param fill: Function of the water level and last request time,
+                     returning them updated and a value to return
+        """
+        key = strutils.safe_encode(key)
+        digest = struct.unpack('=Q', hashlib.md5(key).digest()[:8])[0]
+        offset = (digest % self.slots) * self.SLOT.size
+        with self._lock:
+            bucket, water_level, last_request = self.SLOT.unpack_from(
+                self._table, offset)
+            if bucket != digest:
+                water_level, last_request = 0, None
+            level = fill(water_level, last_request)
+            self.SLOT.pack_into(self._table, offset, digest, level[0],
+                                level[1])
+        return level
@@ -17,8 +17,7 @@
 Module dedicated functions/classes dealing with rate limiting requests.
 """
 
-import collections
-import copy
+import functools
 import httplib
 import math
 import re
@@ -27,6 +26,7 @@ import time
 import webob.dec
 import webob.exc
 
+from cinder.api import common
 from cinder.api.openstack import wsgi
 from cinder.api.views import limits as limits_views
 from cinder.api import xmlutil
@@ -148,24 +148,49 @@ class Limit(object):
         """
         if self.verb != verb or not re.match(self.regex, url):
             return
+        return self.record()
 
-        now = self._get_time()
+    def copy(self):
+        """Return a new `Limit` like this one, with no requests made."""
+        return Limit(self.verb, self.uri, self.regex, self.value, self.unit)
 
-        if self.last_request is None:
-            self.last_request = now
+    def _fill(self, water_level, last_request, now):
+        """Add a request to the water level of the bucket.
 
-        leak_value = now - self.last_request
+        @return: Tuple of the new water level and last request time, and
+                 the delay if the request is over the limit (or None)
+        """
+        if last_request is None:
+            last_request = now
 
-        self.water_level -= leak_value
-        self.water_level = max(self.water_level, 0)
-        self.water_level += self.request_value
+        leak_value = now - last_request
 
-        difference = self.water_level - self.capacity
+        water_level -= leak_value
+        water_level = max(water_level, 0)
+        water_level += self.request_value
 
-        self.last_request = now
+        difference = water_level - self.capacity
 
         if difference > 0:
-            self.water_level -= self.request_value
+            return water_level - self.request_value, now, difference
+        return water_level, now, None
+
+    def record(self, store=None, key=None):
+        """Record a request matching this limit.
+
+        @param store: `common.SharedLevels` keeping the water level, if any
+        @param key: string identifying the bucket in the store
+        @return: Delay in seconds if the request is over the limit
+        """
+        now = self._get_time()
+
+        if store is None:
+            level = self._fill(self.water_level, self.last_request, now)
+        else:
+            level = store.update(key, functools.partial(self._fill, now=now))
+        self.water_level, self.last_request, difference = level
+
+        if difference:
             self.next_request = now + difference
             return difference
 
@@ -271,21 +296,42 @@ class RateLimitingMiddleware(base_wsgi.Middleware):
 
 
 class Limiter(object):
-    """Rate-limit checking class which handles limits in memory."""
+    """Rate-limit checking class which handles limits in memory.
+
+    Extra parameters, from the middleware configuration:
+
+    limits.<username>: limits of that user, see parse_limits
+    max_users: number of users whose levels are kept, the least recently
+               seen are forgotten
+    shared_slots: size of a table of levels shared by the API workers,
+                  so that the limits hold across them; 0 keeps the levels
+                  in every worker
+    """
 
     def __init__(self, limits, **kwargs):
         """Initialize the new `Limiter`.
 
         @param limits: List of `Limit` objects
         """
-        self.limits = copy.deepcopy(limits)
-        self.levels = collections.defaultdict(lambda: copy.deepcopy(limits))
+        self.limits = [limit.copy() for limit in limits]
+        max_users = int(kwargs.get('max_users', 10000))
+        self.levels = common.UserLevels(self.limits, max_users)
+        # The limits to check for every verb, for users with their own.
+        self._default_routes = common.build_limit_routes(self.limits)
+        self._routes = {}
+
+        shared_slots = int(kwargs.get('shared_slots', 0))
+        self._shared = None
+        if shared_slots:
+            self._shared = common.SharedLevels(shared_slots)
 
         # Pick up any per-user limit information
         for key, value in kwargs.items():
             if key.startswith(LIMITS_PREFIX):
                 username = key[len(LIMITS_PREFIX):]
                 self.levels[username] = self.parse_limits(value)
+                self._routes[username] = common.build_limit_routes(
+                    self.levels[username])
 
     def get_limits(self, username=None):
         """Return the limits for a given user."""
@@ -298,8 +344,17 @@ class Limiter(object):
         """
         delays = []
 
-        for limit in self.levels[username]:
-            delay = limit(verb, url)
+        routes = self._routes.get(username, self._default_routes)
+        levels = self.levels[username]
+        for index, regex in routes.get(verb, ()):
+            if not regex.match(url):
+                continue
+            limit = levels[index]
+            if self._shared is None:
+                delay = limit.record()
+            else:
+                key = '%s/%d' % (username, index)
+                delay = limit.record(self._shared, key)
             if delay:
                 delays.append((delay, limit.error_message))
 
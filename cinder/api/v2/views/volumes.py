@@ -38,6 +38,9 @@ class ViewBuilder(common.ViewBuilder):
         return self._list_view(self.detail, request, volumes,
                                coll_name=self._collection_name + '/detail')
 
+    # The volume fields that summary() uses.
+    summary_columns = ('id', 'display_name')
+
     def summary(self, request, volume):
         """Generic, non-detailed view of an volume."""
         return {
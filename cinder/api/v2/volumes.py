@@ -227,9 +227,12 @@ class VolumeController(wsgi.Controller):
         if 'metadata' in filters:
             filters['metadata'] = ast.literal_eval(filters['metadata'])
 
+        # The summary view only needs a few columns of each volume.
+        columns = None if is_detail else self._view_builder.summary_columns
         volumes = self.volume_api.get_all(context, marker, limit, sort_key,
                                           sort_dir, filters,
-                                          viewable_admin_meta=True)
+                                          viewable_admin_meta=True,
+                                          columns=columns)
 
         volumes = [dict(vol.iteritems()) for vol in volumes]
 
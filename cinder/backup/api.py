@@ -67,6 +67,12 @@ class API(base.Base):
             msg = _('Backup status must be available or error')
             raise exception.InvalidBackup(reason=msg)
 
+        children = self.db.backup_get_all(context.elevated(),
+                                          filters={'parent_id': backup_id})
+        if children:
+            msg = _('Incremental backups exist for this backup')
+            raise exception.InvalidBackup(reason=msg)
+
         self.db.backup_update(context, backup_id, {'status': 'deleting'})
         self.backup_rpcapi.delete_backup(context,
                                          backup['host'],
@@ -110,8 +116,12 @@ class API(base.Base):
         return [srv['host'] for srv in services if not srv['disabled']]
 
     def create(self, context, name, description, volume_id,
-               container, availability_zone=None):
-        """Make the RPC call to create a volume backup."""
+               container, availability_zone=None, incremental=False):
+        """Make the RPC call to create a volume backup.
+
+        An incremental backup is based on the most recent available backup
+        of the volume and only stores the data that changed since then.
+        """
         check_policy(context, 'create')
         volume = self.volume_api.get(context, volume_id)
         if volume['status'] != "available":
@@ -121,6 +131,16 @@ class API(base.Base):
         if not self._is_backup_service_enabled(volume, volume_host):
             raise exception.ServiceNotFound(service_id='cinder-backup')
 
+        parent_id = None
+        if incremental:
+            backups = self.db.backup_get_all_by_project(
+                context, context.project_id,
+                filters={'volume_id': volume_id, 'status': 'available'})
+            if not backups:
+                msg = _('No backups available to do an incremental backup')
+                raise exception.InvalidBackup(reason=msg)
+            parent_id = max(backups, key=lambda b: b['created_at'])['id']
+
         self.db.volume_update(context, volume_id, {'status': 'backing-up'})
 
         options = {'user_id': context.user_id,
@@ -131,7 +151,8 @@ class API(base.Base):
                    'status': 'creating',
                    'container': container,
                    'size': volume['size'],
-                   'host': volume_host, }
+                   'host': volume_host,
+                   'parent_id': parent_id, }
 
         backup = self.db.backup_create(context, options)
 
@@ -0,0 +1,112 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compressors for backup data.
+
+A compressor is any object with ``compress(data)`` and ``decompress(data)``
+methods that are safe to call from several threads at once.  zlib, bz2,
+lz4 and zstd are available by name, the latter two only if the lz4 and
+zstandard libraries are installed.  Any other algorithm name is taken as
+the import path of a compressor class, unless the name comes from data
+that is not trusted.
+"""
+
+import bz2
+import zlib
+
+from cinder.openstack.common.gettextutils import _
+from cinder.openstack.common import importutils
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ZlibCompressor(object):
+    """zlib, through (de)compression objects.
+
+    Unlike zlib.compress() and zlib.decompress() these release the GIL
+    while they work, so independent chunks can be compressed in parallel.
+    The output is the same.
+    """
+
+    def compress(self, data):
+        compressor = zlib.compressobj()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = zlib.decompressobj()
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class LZ4Compressor(object):
+    """LZ4 frame format, much faster than zlib at a lower ratio."""
+
+    def compress(self, data):
+        return lz4_frame.compress(data)
+
+    def decompress(self, data):
+        return lz4_frame.decompress(data)
+
+
+class ZstdCompressor(object):
+    """Zstandard, about as fast as LZ4 with a ratio close to zlib."""
+
+    def __init__(self, level=3):
+        self.level = level
+
+    def compress(self, data):
+        # Compression contexts are not thread safe, so use one per call.
+        return zstandard.ZstdCompressor(level=self.level).compress(data)
+
+    def decompress(self, data):
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+def get_compressor(algorithm, allow_import=True):
+    """Return the compressor for algorithm, or None for no compression.
+
+    Import paths are only resolved if allow_import is set.  Raises
+    ValueError if the algorithm is unknown or its library is not
+    installed.
+    """
+    name = algorithm.lower()
+    try:
+        if name in ('none', 'off', 'no'):
+            return None
+        elif name in ('zlib', 'gzip'):
+            return ZlibCompressor()
+        elif name in ('bz2', 'bzip2'):
+            # bz2 releases the GIL on its own.
+            return bz2
+        elif name == 'lz4':
+            if lz4_frame is not None:
+                return LZ4Compressor()
+        elif name in ('zstd', 'zstandard'):
+            if zstandard is not None:
+                return ZstdCompressor()
+        elif '.' in algorithm and allow_import:
+            return importutils.import_object(algorithm)
+    except ImportError:
+        pass
+
+    err = _('unsupported compression algorithm: %s') % algorithm
+    raise ValueError(unicode(err))
@@ -27,18 +27,34 @@
                                     failed Swift operations (default: 10).
 :backup_compression_algorithm: Compression algorithm to use for volume
                                backups. Supported options are:
-                               None (to disable), zlib and bz2 (default: zlib)
+                               None (to disable), zlib, bz2, lz4, zstd or
+                               the import path of a compressor class
+                               (default: zlib)
+:backup_compression_min_ratio: Chunks that do not compress by at least this
+                               ratio are stored uncompressed (default: 1.0).
+:backup_swift_concurrency: The number of Swift objects transferred in
+                           parallel during a backup or restore (default: 1).
 """
 
+import collections
+import ctypes
+import ctypes.util
+import fcntl
 import hashlib
+import itertools
 import json
 import os
 import six
 import socket
+import stat
+import struct
 
 import eventlet
+from eventlet import pools
+from eventlet import tpool
 from oslo.config import cfg
 
+from cinder.backup import compression
 from cinder.backup.driver import BackupDriver
 from cinder import exception
 from cinder.openstack.common import excutils
@@ -78,34 +94,75 @@ swiftbackup_service_opts = [
                help='The backoff time in seconds between Swift retries'),
     cfg.StrOpt('backup_compression_algorithm',
                default='zlib',
-               help='Compression algorithm (None to disable)'),
+               help='Compression algorithm (None to disable). One of zlib, '
+                    'bz2, lz4, zstd or the import path of a class with '
+                    'compress and decompress methods'),
+    cfg.FloatOpt('backup_compression_min_ratio',
+                 default=1.0,
+                 help='Store a chunk uncompressed unless compressing it '
+                      'reduces its size by at least this ratio (original '
+                      'size / compressed size)'),
+    cfg.IntOpt('backup_swift_concurrency',
+               default=1,
+               help='The number of Swift objects uploaded or downloaded in '
+                    'parallel during a backup or restore. Reading and '
+                    'compressing the volume overlaps with the transfers, '
+                    'and at most this many objects are held in memory '
+                    'waiting for a transfer to complete'),
 ]
 
 CONF = cfg.CONF
 CONF.register_opts(swiftbackup_service_opts)
 
+# From linux/falloc.h and linux/fs.h
+FALLOC_FL_KEEP_SIZE = 0x01
+FALLOC_FL_PUNCH_HOLE = 0x02
+BLKZEROOUT = 0x127f
+
+_libc = None
+
+
+def _punch_hole(fileno, offset, length):
+    """Deallocate a range of a regular file so that it reads as zeros."""
+    global _libc
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        _libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int,
+                                    ctypes.c_int64, ctypes.c_int64]
+    size = os.fstat(fileno).st_size
+    if offset < size:
+        ret = _libc.fallocate(fileno,
+                              FALLOC_FL_PUNCH_HOLE | FALLOC_FL_KEEP_SIZE,
+                              offset, min(length, size - offset))
+        if ret != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+    if offset + length > size:
+        os.ftruncate(fileno, offset + length)
+
 
 class SwiftBackupDriver(BackupDriver):
     """Provides backup, restore and delete of backup objects within Swift."""
 
-    DRIVER_VERSION = '1.0.0'
-    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1'}
+    DRIVER_VERSION = '1.2.0'
+    DRIVER_VERSION_MAPPING = {'1.0.0': '_restore_v1', '1.1.0': '_restore_v1',
+                              '1.2.0': '_restore_v1'}
 
     def _get_compressor(self, algorithm):
+        return compression.get_compressor(algorithm)
+
+    def _get_decompressor(self, algorithm):
+        """Returns the compressor named in the metadata of a backup.
+
+        The metadata is kept in the tenant's container, so of the import
+        paths only the configured algorithm is trusted.
+        """
         try:
-            if algorithm.lower() in ('none', 'off', 'no'):
-                return None
-            elif algorithm.lower() in ('zlib', 'gzip'):
-                import zlib as compressor
-                return compressor
-            elif algorithm.lower() in ('bz2', 'bzip2'):
-                import bz2 as compressor
-                return compressor
-        except ImportError:
-            pass
-
-        err = _('unsupported compression algorithm: %s') % algorithm
-        raise ValueError(unicode(err))
+            return compression.get_compressor(
+                algorithm,
+                allow_import=(algorithm == self.compression_algorithm))
+        except ValueError as err:
+            raise exception.InvalidBackup(reason=err)
 
     def __init__(self, context, db_driver=None):
         super(SwiftBackupDriver, self).__init__(context, db_driver)
@@ -113,10 +170,15 @@ class SwiftBackupDriver(BackupDriver):
                                    self.context.project_id)
         self.az = CONF.storage_availability_zone
         self.data_block_size_bytes = CONF.backup_swift_object_size
+        self._zero_chunk = None
         self.swift_attempts = CONF.backup_swift_retry_attempts
         self.swift_backoff = CONF.backup_swift_retry_backoff
-        self.compressor = \
-            self._get_compressor(CONF.backup_compression_algorithm)
+        self.concurrency = max(CONF.backup_swift_concurrency, 1)
+        self.compression_algorithm = CONF.backup_compression_algorithm
+        if '.' not in self.compression_algorithm:
+            self.compression_algorithm = self.compression_algorithm.lower()
+        self.compressor = self._get_compressor(self.compression_algorithm)
+        self.min_compression_ratio = CONF.backup_compression_min_ratio
         LOG.debug('Connect to %s in "%s" mode' % (CONF.backup_swift_url,
                                                   CONF.backup_swift_auth))
         if CONF.backup_swift_auth == 'single_user':
@@ -125,16 +187,52 @@ class SwiftBackupDriver(BackupDriver):
                             "but %(param)s not set")
                           % {'param': 'backup_swift_user'})
                 raise exception.ParameterNotFound(param='backup_swift_user')
-            self.conn = swift.Connection(authurl=CONF.backup_swift_url,
-                                         user=CONF.backup_swift_user,
-                                         key=CONF.backup_swift_key,
-                                         retries=self.swift_attempts,
-                                         starting_backoff=self.swift_backoff)
-        else:
-            self.conn = swift.Connection(retries=self.swift_attempts,
-                                         preauthurl=self.swift_url,
-                                         preauthtoken=self.context.auth_token,
-                                         starting_backoff=self.swift_backoff)
+        self.conn = self._get_connection()
+
+    def _get_connection(self):
+        if CONF.backup_swift_auth == 'single_user':
+            return swift.Connection(authurl=CONF.backup_swift_url,
+                                    user=CONF.backup_swift_user,
+                                    key=CONF.backup_swift_key,
+                                    retries=self.swift_attempts,
+                                    starting_backoff=self.swift_backoff)
+        return swift.Connection(retries=self.swift_attempts,
+                                preauthurl=self.swift_url,
+                                preauthtoken=self.context.auth_token,
+                                starting_backoff=self.swift_backoff)
+
+    def _transfer(self, func, args_list):
+        """Call func(conn, *args) for each args and yield the results in
+        order.
+
+        Up to backup_swift_concurrency calls run at once, each on its own
+        Swift connection since a connection cannot be shared between
+        greenthreads.  args_list is only advanced when a slot is free, so
+        no more than that many items are pending at any time.
+        """
+        if self.concurrency == 1:
+            for args in args_list:
+                yield func(self.conn, *args)
+            return
+
+        conn_pool = pools.Pool(max_size=self.concurrency,
+                               create=self._get_connection)
+
+        def _call(args):
+            with conn_pool.item() as conn:
+                return func(conn, *args)
+
+        pending = collections.deque()
+        try:
+            for args in args_list:
+                pending.append(eventlet.spawn(_call, args))
+                if len(pending) >= self.concurrency:
+                    yield pending.popleft().wait()
+            while pending:
+                yield pending.popleft().wait()
+        finally:
+            for thread in pending:
+                thread.kill()
 
     def _create_container(self, context, backup):
         backup_id = backup['id']
@@ -246,43 +344,115 @@ class SwiftBackupDriver(BackupDriver):
                       'availability_zone': availability_zone,
                   })
         object_meta = {'id': 1, 'list': [], 'prefix': object_prefix,
-                       'volume_meta': None}
+                       'volume_meta': None,
+                       'parent_objects': self._get_parent_objects(backup)}
         return object_meta, container
 
-    def _backup_chunk(self, backup, container, data, data_offset, object_meta):
-        """Backup data chunk based on the object metadata and offset."""
+    def _get_parent_objects(self, backup):
+        """Return the fingerprinted objects of the parent backup by offset.
+
+        Each entry records the container and backup its object belongs to,
+        so that it can be referenced from an incremental backup.
+        """
+        parent_objects = {}
+        if not backup.get('parent_id'):
+            return parent_objects
+        parent = self.db.backup_get(self.context, backup['parent_id'])
+        try:
+            metadata = self._read_metadata(parent)
+        except socket.error as err:
+            raise exception.SwiftConnectionFailed(reason=err)
+        for metadata_object in metadata['objects']:
+            object_name = metadata_object.keys()[0]
+            entry = dict(metadata_object[object_name])
+            if 'sha256' not in entry:
+                continue
+            entry.setdefault('container', parent['container'])
+            entry.setdefault('backup_id', parent['id'])
+            parent_objects[entry['offset']] = {object_name: entry}
+        LOG.debug('incremental backup %(backup_id)s based on backup '
+                  '%(parent_id)s, %(count)d objects can be reused' %
+                  {'backup_id': backup['id'],
+                   'parent_id': parent['id'],
+                   'count': len(parent_objects)})
+        return parent_objects
+
+    def _prepare_chunk(self, data, data_offset, object_meta):
+        """Name and fingerprint a chunk of volume data.
+
+        Returns the object name, its metadata entry and the data to upload.
+        """
         object_prefix = object_meta['prefix']
-        object_list = object_meta['list']
         object_id = object_meta['id']
         object_name = '%s-%05d' % (object_prefix, object_id)
         obj = {}
         obj[object_name] = {}
         obj[object_name]['offset'] = data_offset
         obj[object_name]['length'] = len(data)
+        obj[object_name]['sha256'] = hashlib.sha256(data).hexdigest()
         LOG.debug('reading chunk of data from volume')
-        if self.compressor is not None:
-            algorithm = CONF.backup_compression_algorithm.lower()
-            obj[object_name]['compression'] = algorithm
-            data_size_bytes = len(data)
-            data = self.compressor.compress(data)
-            comp_size_bytes = len(data)
-            LOG.debug('compressed %(data_size_bytes)d bytes of data '
-                      'to %(comp_size_bytes)d bytes using '
-                      '%(algorithm)s' %
+        object_meta['id'] = object_id + 1
+        return object_name, obj, data
+
+    def _run(self, func, *args):
+        """Run a CPU bound function.
+
+        With parallel transfers it runs in a native thread so that several
+        chunks can be (de)compressed at once; the compressors release the
+        GIL.
+        """
+        if self.concurrency > 1:
+            return tpool.execute(func, *args)
+        return func(*args)
+
+    def _compress_chunk(self, entry, data):
+        """Compress data and record the algorithm used in entry.
+
+        Data that does not compress by at least backup_compression_min_ratio
+        is returned uncompressed.
+        """
+        if self.compressor is None:
+            LOG.debug('not compressing data')
+            entry['compression'] = 'none'
+            return data
+        algorithm = self.compression_algorithm
+        data_size_bytes = len(data)
+        compressed = self._run(self.compressor.compress, data)
+        comp_size_bytes = len(compressed)
+        if data_size_bytes < comp_size_bytes * self.min_compression_ratio:
+            LOG.debug('%(algorithm)s compressed %(data_size_bytes)d bytes '
+                      'of data to %(comp_size_bytes)d bytes only, storing '
+                      'them uncompressed' %
                       {
                           'data_size_bytes': data_size_bytes,
                           'comp_size_bytes': comp_size_bytes,
                           'algorithm': algorithm,
                       })
-        else:
-            LOG.debug('not compressing data')
-            obj[object_name]['compression'] = 'none'
-
+            entry['compression'] = 'none'
+            return data
+        LOG.debug('compressed %(data_size_bytes)d bytes of data '
+                  'to %(comp_size_bytes)d bytes using '
+                  '%(algorithm)s' %
+                  {
+                      'data_size_bytes': data_size_bytes,
+                      'comp_size_bytes': comp_size_bytes,
+                      'algorithm': algorithm,
+                  })
+        entry['compression'] = algorithm
+        return compressed
+
+    def _put_chunk(self, conn, container, object_name, obj, data):
+        """Upload a prepared chunk and return its metadata entry."""
+        if data is None:
+            # An all-zero chunk or one that is unchanged since the parent
+            # backup, whose object is reused.
+            return obj
+        data = self._compress_chunk(obj[object_name], data)
         reader = six.StringIO(data)
         LOG.debug('About to put_object')
         try:
-            etag = self.conn.put_object(container, object_name, reader,
-                                        content_length=len(data))
+            etag = conn.put_object(container, object_name, reader,
+                                   content_length=len(data))
         except socket.error as err:
             raise exception.SwiftConnectionFailed(reason=err)
         LOG.debug('swift MD5 for %(object_name)s: %(etag)s' %
@@ -296,12 +466,64 @@ class SwiftBackupDriver(BackupDriver):
                     'swift %(etag)s is not the same as MD5 of object sent '
                     'to swift %(md5)s') % {'etag': etag, 'md5': md5}
             raise exception.InvalidBackup(reason=err)
-        object_list.append(obj)
-        object_id += 1
-        object_meta['list'] = object_list
-        object_meta['id'] = object_id
-        LOG.debug('Calling eventlet.sleep(0)')
-        eventlet.sleep(0)
+        return obj
+
+    def _zeros(self, length):
+        """Return length zero bytes, up to the size of a chunk."""
+        if self._zero_chunk is None:
+            self._zero_chunk = '\0' * self.data_block_size_bytes
+        return self._zero_chunk[:length]
+
+    def _read_chunks(self, container, volume_file, object_meta):
+        """Read and prepare the volume data one chunk at a time.
+
+        Yields the arguments of _put_chunk for each chunk.  Chunks that
+        have the same fingerprint as the parent backup's chunk at the same
+        offset are yielded without data and refer to the parent's object.
+        All-zero chunks are yielded without data either and are recorded
+        as holes that have no object at all.
+        """
+        object_prefix = object_meta['prefix']
+        parent_objects = object_meta['parent_objects']
+        while True:
+            data = volume_file.read(self.data_block_size_bytes)
+            data_offset = volume_file.tell()
+            if data == '':
+                break
+            if data == self._zeros(len(data)):
+                object_name = '%s-zero-%d' % (object_prefix, data_offset)
+                LOG.debug('chunk at offset %d is all zeros, not uploading '
+                          'it' % data_offset)
+                obj = {object_name: {'offset': data_offset,
+                                     'length': len(data),
+                                     'compression': 'none',
+                                     'zero': True}}
+                yield container, object_name, obj, None
+                continue
+            parent_obj = parent_objects.get(data_offset)
+            if parent_obj is not None:
+                object_name, entry = parent_obj.items()[0]
+                if (entry['length'] == len(data) and
+                        entry['sha256'] == hashlib.sha256(data).hexdigest()):
+                    LOG.debug('chunk at offset %(offset)d unchanged, '
+                              'reusing %(object_name)s' %
+                              {'offset': data_offset,
+                               'object_name': object_name})
+                    yield container, object_name, parent_obj, None
+                    continue
+            object_name, obj, data = self._prepare_chunk(data, data_offset,
+                                                         object_meta)
+            yield container, object_name, obj, data
+
+    def _backup_chunks(self, container, volume_file, object_meta):
+        """Upload the volume data, keeping the object list in offset order
+        regardless of the order in which the uploads complete.
+        """
+        chunks = self._read_chunks(container, volume_file, object_meta)
+        for obj in self._transfer(self._put_chunk, chunks):
+            object_meta['list'].append(obj)
+            LOG.debug('Calling eventlet.sleep(0)')
+            eventlet.sleep(0)
 
     def _finalize_backup(self, backup, container, object_meta):
         """Finalize the backup by updating its metadata on Swift."""
@@ -339,13 +561,7 @@ class SwiftBackupDriver(BackupDriver):
         """Backup the given volume to Swift."""
 
         object_meta, container = self._prepare_backup(backup)
-        while True:
-            data = volume_file.read(self.data_block_size_bytes)
-            data_offset = volume_file.tell()
-            if data == '':
-                break
-            self._backup_chunk(backup, container, data,
-                               data_offset, object_meta)
+        self._backup_chunks(container, volume_file, object_meta)
 
         if backup_metadata:
             try:
@@ -365,8 +581,14 @@ class SwiftBackupDriver(BackupDriver):
         LOG.debug('v1 swift volume backup restore of %s started', backup_id)
         container = backup['container']
         metadata_objects = metadata['objects']
-        metadata_object_names = sum((obj.keys() for obj in metadata_objects),
-                                    [])
+        # Objects of an incremental backup that were unchanged since its
+        # parent belong to an earlier backup in the chain.
+        metadata_object_names = [
+            object_name
+            for obj in metadata_objects
+            for (object_name, entry) in obj.iteritems()
+            if (entry.get('backup_id', backup_id) == backup_id and
+                not entry.get('zero'))]
         LOG.debug('metadata_object_names = %s' % metadata_object_names)
         prune_list = [self._metadata_filename(backup)]
         swift_object_names = [swift_object_name for swift_object_name in
@@ -377,30 +599,44 @@ class SwiftBackupDriver(BackupDriver):
                     'swift does not match object list stored in metadata')
             raise exception.InvalidBackup(reason=err)
 
-        for metadata_object in metadata_objects:
+        def _get_chunk(conn, metadata_object):
             object_name = metadata_object.keys()[0]
+            if metadata_object[object_name].get('zero'):
+                return None
+            object_container = metadata_object[object_name].get('container',
+                                                                container)
             LOG.debug('restoring object from swift. backup: %(backup_id)s, '
                       'container: %(container)s, swift object name: '
                       '%(object_name)s, volume: %(volume_id)s' %
                       {
                           'backup_id': backup_id,
-                          'container': container,
+                          'container': object_container,
                           'object_name': object_name,
                           'volume_id': volume_id,
                       })
             try:
-                (resp, body) = self.conn.get_object(container, object_name)
+                (resp, body) = conn.get_object(object_container, object_name)
             except socket.error as err:
                 raise exception.SwiftConnectionFailed(reason=err)
             compression_algorithm = metadata_object[object_name]['compression']
-            decompressor = self._get_compressor(compression_algorithm)
+            decompressor = self._get_decompressor(compression_algorithm)
             if decompressor is not None:
                 LOG.debug('decompressing data using %s algorithm' %
                           compression_algorithm)
-                decompressed = decompressor.decompress(body)
-                volume_file.write(decompressed)
+                return self._run(decompressor.decompress, body)
+            return body
+
+        # The objects are fetched in parallel but written in the order they
+        # appear in the metadata.
+        chunks = self._transfer(_get_chunk,
+                                ((metadata_object,) for metadata_object
+                                 in metadata_objects))
+        for metadata_object, data in itertools.izip(metadata_objects, chunks):
+            if data is None:
+                length = metadata_object.values()[0]['length']
+                self._restore_zeros(volume_file, length)
             else:
-                volume_file.write(body)
+                volume_file.write(data)
 
             # force flush every write to avoid long blocking write on close
             volume_file.flush()
@@ -421,6 +657,36 @@ class SwiftBackupDriver(BackupDriver):
         LOG.debug('v1 swift volume backup restore of %s finished',
                   backup_id)
 
+    def _restore_zeros(self, volume_file, length):
+        """Make the next length bytes of volume_file read as zeros.
+
+        Holes are punched into regular files and block devices are zeroed
+        with BLKZEROOUT, which thin provisioned devices can usually do
+        without writing anything.  Zeros are written if neither works.
+        """
+        volume_file.flush()
+        try:
+            fileno = volume_file.fileno()
+            offset = volume_file.tell()
+            mode = os.fstat(fileno).st_mode
+            if stat.S_ISREG(mode):
+                _punch_hole(fileno, offset, length)
+                volume_file.seek(offset + length)
+                return
+            elif stat.S_ISBLK(mode):
+                fcntl.ioctl(fileno, BLKZEROOUT,
+                            struct.pack('QQ', offset, length))
+                volume_file.seek(offset + length)
+                return
+        except (AttributeError, IOError, OSError) as err:
+            LOG.debug('unable to zero %(length)d bytes of the volume '
+                      'without writing them: %(err)s' %
+                      {'length': length, 'err': err})
+        while length > 0:
+            data = self._zeros(min(length, self.data_block_size_bytes))
+            volume_file.write(data)
+            length -= len(data)
+
     def restore(self, backup, volume_id, volume_file):
         """Restore the given volume backup from swift."""
         backup_id = backup['id']
@@ -69,6 +69,10 @@ class TargetAdmin(executor.Executor):
         """Query the given target ID."""
         raise NotImplementedError()
 
+    def get_targets(self):
+        """Return the IQNs of all targets."""
+        raise NotImplementedError()
+
     def _new_logicalunit(self, tid, lun, path, **kwargs):
         """Create a new LUN on a target using the supplied path."""
         raise NotImplementedError()
@@ -113,6 +117,18 @@ class TgtAdm(TargetAdmin):
 
         return None
 
+    def get_targets(self):
+        """Return a dict of the LUN numbers of all targets, by IQN."""
+        (out, err) = self._execute('tgt-admin', '--show', run_as_root=True)
+        targets = {}
+        luns = None
+        for line in out.split('\n'):
+            if line.startswith('Target '):
+                luns = targets.setdefault(line.split()[2], set())
+            elif luns is not None and line.strip().startswith('LUN:'):
+                luns.add(int(line.split(':')[1]))
+        return targets
+
     def _verify_backing_lun(self, iqn, tid):
         backing_lun = True
         capture = False
@@ -506,6 +522,12 @@ class LioAdm(TargetAdmin):
 
         return None
 
+    def get_targets(self):
+        (out, err) = self._execute('cinder-rtstool',
+                                   'get-targets',
+                                   run_as_root=True)
+        return set(line.strip() for line in out.split('\n') if line.strip())
+
     def create_iscsi_target(self, name, tid, lun, path,
                             chap_auth=None, **kwargs):
         # tid and lun are not used
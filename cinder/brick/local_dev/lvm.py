@@ -20,8 +20,6 @@ LVM class for performing LVM operations.
 import math
 import re
 
-import itertools
-
 from cinder.brick import exception
 from cinder.brick import executor
 from cinder.openstack.common.gettextutils import _
@@ -34,6 +32,9 @@ LOG = logging.getLogger(__name__)
 class LVM(executor.Executor):
     """LVM object to enable various LVM related operations."""
 
+    # Refreshes of the VG info after which its LVs are reloaded anyway.
+    RELOAD_REFRESHES = 10
+
     def __init__(self, vg_name, root_helper, create_vg=False,
                  physical_volumes=None, lvm_type='default',
                  executor=putils.execute):
@@ -63,6 +64,15 @@ class LVM(executor.Executor):
         self.vg_thin_pool = None
         self.vg_thin_pool_size = 0.0
         self.vg_thin_pool_free_space = 0.0
+        # Inventory of the LVs in the VG by name, loaded on first use.  A
+        # name mapped to None is known to exist but has to be re-read.
+        self._lvs = None
+        # What update_volume_group_info() last saw of the VG, whether this
+        # object changed LVs since, and the refreshes since the inventory
+        # was last loaded.
+        self._vg_state = None
+        self._lvs_changed = False
+        self._refreshes = 0
         self._supports_snapshot_lv_activation = None
         self._supports_lvchange_ignoreskipactivation = None
 
@@ -131,6 +141,17 @@ class LVM(executor.Executor):
         :param thin_pool_name: the thin pool to gather info for
         :returns: Free space in GB (float), calculated using data_percent
 
+        """
+        return self._get_thin_pool_info(vg_name, thin_pool_name)[1]
+
+    def _get_thin_pool_info(self, vg_name, thin_pool_name):
+        """Returns the size and available free space of a thin pool.
+
+        :param vg_name: the vg where the pool is placed
+        :param thin_pool_name: the thin pool to gather info for
+        :returns: Tuple of size and free space in GB (float), the latter
+                  calculated using data_percent
+
         """
         cmd = ['env', 'LC_ALL=C', 'lvs', '--noheadings', '--unit=g',
                '-o', 'size,data_percent', '--separator', ':', '--nosuffix']
@@ -139,6 +160,7 @@ class LVM(executor.Executor):
         # make sure to append the actual thin pool name
         cmd.append("/dev/%s/%s" % (vg_name, thin_pool_name))
 
+        pool_size = 0.0
         free_space = 0.0
 
         try:
@@ -159,7 +181,7 @@ class LVM(executor.Executor):
             LOG.error(_('StdOut  :%s') % err.stdout)
             LOG.error(_('StdErr  :%s') % err.stderr)
 
-        return free_space
+        return pool_size, free_space
 
     @staticmethod
     def get_lvm_version(root_helper):
@@ -233,52 +255,91 @@ class LVM(executor.Executor):
         return self._supports_lvchange_ignoreskipactivation
 
     @staticmethod
-    def get_all_volumes(root_helper, vg_name=None):
+    def get_all_volumes(root_helper, vg_name=None, lv_name=None):
         """Static method to get all LV's on a system.
 
         :param root_helper: root_helper to use for execute
         :param vg_name: optional, gathers info for only the specified VG
+        :param lv_name: optional, gathers info for only the specified LV
+                        of vg_name
         :returns: List of Dictionaries with LV info
 
         """
 
         cmd = ['env', 'LC_ALL=C', 'lvs', '--noheadings', '--unit=g',
-               '-o', 'vg_name,name,size', '--nosuffix']
+               '-o', 'vg_name,name,size', '--separator', ':', '--nosuffix']
 
-        if vg_name is not None:
+        if lv_name is not None:
+            cmd.append('%s/%s' % (vg_name, lv_name))
+        elif vg_name is not None:
             cmd.append(vg_name)
 
-        (out, err) = putils.execute(*cmd,
-                                    root_helper=root_helper,
-                                    run_as_root=True)
+        try:
+            (out, err) = putils.execute(*cmd,
+                                        root_helper=root_helper,
+                                        run_as_root=True)
+        except putils.ProcessExecutionError as err:
+            # NOTE: lvs exits with ECMD_FAILED if the LV does not exist.
+            if lv_name is not None and err.exit_code == 5:
+                return []
+            raise
 
         lv_list = []
         if out is not None:
-            volumes = out.split()
-            for vg, name, size in itertools.izip(*[iter(volumes)] * 3):
-                lv_list.append({"vg": vg, "name": name, "size": size})
+            for lv in out.split():
+                fields = lv.split(':')
+                lv_list.append({'vg': fields[0],
+                                'name': fields[1],
+                                'size': fields[2]})
 
         return lv_list
 
     def get_volumes(self):
         """Get all LV's associated with this instantiation (VG).
 
+        This reloads the inventory of LVs that get_volume() looks
+        volumes up in.
+
         :returns: List of Dictionaries with LV info
 
         """
         self.lv_list = self.get_all_volumes(self._root_helper, self.vg_name)
+        self._lvs = dict((lv['name'], lv) for lv in self.lv_list)
+        self._refreshes = 0
         return self.lv_list
 
     def get_volume(self, name):
         """Get reference object of volume specified by name.
 
+        LVs are looked up in the inventory, which is loaded on first use.
+        Only LVs missing from it or changed since they were read are
+        queried, one at a time.
+
         :returns: dict representation of Logical Volume if exists
 
         """
-        ref_list = self.get_volumes()
-        for r in ref_list:
-            if r['name'] == name:
-                return r
+        if self._lvs is None:
+            self.get_volumes()
+
+        if self._lvs.get(name) is None:
+            self._lvs.pop(name, None)
+            for lv in self.get_all_volumes(self._root_helper, self.vg_name,
+                                           name):
+                if lv['name'] == name:
+                    self._lvs[name] = lv
+        return self._lvs.get(name)
+
+    def _lv_changed(self, name):
+        """Record that an LV was created or changed by this object."""
+        self._lvs_changed = True
+        if self._lvs is not None:
+            self._lvs[name] = None
+
+    def _lv_removed(self, name):
+        """Record that an LV was removed or renamed by this object."""
+        self._lvs_changed = True
+        if self._lvs is not None:
+            self._lvs.pop(name, None)
 
     @staticmethod
     def get_all_physical_volumes(root_helper, vg_name=None):
@@ -376,12 +437,41 @@ class LVM(executor.Executor):
         self.vg_uuid = vg_list[0]['uuid']
 
         if self.vg_thin_pool is not None:
-            for lv in self.get_all_volumes(self._root_helper, self.vg_name):
-                if lv['name'] == self.vg_thin_pool:
-                    self.vg_thin_pool_size = lv['size']
-                    tpfs = self._get_thin_pool_free_space(self.vg_name,
-                                                          self.vg_thin_pool)
-                    self.vg_thin_pool_free_space = tpfs
+            (self.vg_thin_pool_size,
+             self.vg_thin_pool_free_space) = self._get_thin_pool_info(
+                self.vg_name, self.vg_thin_pool)
+
+        self._reconcile_lvs()
+
+    def _reconcile_lvs(self):
+        """Reload the inventory if LVs were changed outside this object.
+
+        LVs created or removed elsewhere change the LV count.  Resized
+        ones change the free space of the VG or thin pool, which is only
+        taken as a sign when this object did not change LVs itself since
+        the last refresh.  Renames change neither, so the inventory is
+        also reloaded every RELOAD_REFRESHES refreshes.
+        """
+        vg_state = (self.vg_lv_count, self.vg_free_space,
+                    self.vg_thin_pool_free_space)
+        previous_state, self._vg_state = self._vg_state, vg_state
+        lvs_changed, self._lvs_changed = self._lvs_changed, False
+        if self._lvs is None:
+            return
+
+        self._refreshes += 1
+        if len(self._lvs) != self.vg_lv_count:
+            reason = 'LV count changed'
+        elif (previous_state is not None and previous_state != vg_state and
+                not lvs_changed):
+            reason = 'free space changed'
+        elif self._refreshes >= self.RELOAD_REFRESHES:
+            reason = 'periodic reload'
+        else:
+            return
+        LOG.debug('Reloading the LVs of %(vg)s: %(reason)s' %
+                  {'vg': self.vg_name, 'reason': reason})
+        self.get_volumes()
 
     def _calculate_thin_pool_size(self):
         """Calculates the correct size for a thin pool.
@@ -439,6 +529,7 @@ class LVM(executor.Executor):
         self._execute(*cmd,
                       root_helper=self._root_helper,
                       run_as_root=True)
+        self._lv_changed(name)
 
         self.vg_thin_pool = name
         return size_str
@@ -479,6 +570,7 @@ class LVM(executor.Executor):
             LOG.error(_('StdOut  :%s') % err.stdout)
             LOG.error(_('StdErr  :%s') % err.stderr)
             raise
+        self._lv_changed(name)
 
     def create_lv_snapshot(self, name, source_lv_name, lv_type='default'):
         """Creates a snapshot of a logical volume.
@@ -509,6 +601,7 @@ class LVM(executor.Executor):
             LOG.error(_('StdOut  :%s') % err.stdout)
             LOG.error(_('StdErr  :%s') % err.stderr)
             raise
+        self._lv_changed(name)
 
     def _mangle_lv_name(self, name):
         # Linux LVM reserves name that starts with snapshot, so that
@@ -569,6 +662,8 @@ class LVM(executor.Executor):
         # some cases (see LP #1270192), so we enable retry deactivation
         LVM_CONFIG = 'activation { retry_deactivation = 1} '
 
+        # If lvremove fails the LV may or may not be left behind.
+        self._lv_changed(name)
         try:
             self._execute(
                 'lvremove',
@@ -597,6 +692,7 @@ class LVM(executor.Executor):
                 '-f',
                 '%s/%s' % (self.vg_name, name),
                 root_helper=self._root_helper, run_as_root=True)
+        self._lv_removed(name)
 
     def revert(self, snapshot_name):
         """Revert an LV from snapshot.
@@ -607,6 +703,8 @@ class LVM(executor.Executor):
         self._execute('lvconvert', '--merge',
                       snapshot_name, root_helper=self._root_helper,
                       run_as_root=True)
+        # The snapshot is merged into its origin and then removed.
+        self._lvs = None
 
     def lv_has_snapshot(self, name):
         out, err = self._execute(
@@ -633,6 +731,7 @@ class LVM(executor.Executor):
             LOG.error(_('StdOut  :%s') % err.stdout)
             LOG.error(_('StdErr  :%s') % err.stderr)
             raise
+        self._lv_changed(lv_name)
 
     def vg_mirror_free_space(self, mirror_count):
         free_capacity = 0.0
@@ -671,3 +770,5 @@ class LVM(executor.Executor):
             LOG.error(_('StdOut  :%s') % err.stdout)
             LOG.error(_('StdErr  :%s') % err.stderr)
             raise
+        self._lv_removed(lv_name)
+        self._lv_changed(new_name)
@@ -164,6 +164,11 @@ global_opts = [
                default='/etc/cinder/rootwrap.conf',
                help='Path to the rootwrap configuration file to use for '
                     'running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run the commands that need root privileges through '
+                     'a long-lived cinder-rootwrap-daemon instead of '
+                     'starting sudo cinder-rootwrap for every command'),
     cfg.BoolOpt('monkey_patch',
                 default=False,
                 help='Enable monkey patching'),
@@ -215,11 +215,18 @@ def volume_create(context, values):
     return IMPL.volume_create(context, values)
 
 
-def volume_data_get_for_host(context, host, count_only=False):
-    """Get (volume_count, gigabytes) for project."""
+def volume_data_get_for_host(context, host, count_only=False,
+                             statuses=None):
+    """Get (volume_count, gigabytes) for host, optionally by status."""
     return IMPL.volume_data_get_for_host(context,
                                          host,
-                                         count_only)
+                                         count_only,
+                                         statuses=statuses)
+
+
+def volume_count_get_for_hosts(context, hosts):
+    """Get a dict of {host: volume_count} for the given hosts."""
+    return IMPL.volume_count_get_for_hosts(context, hosts)
 
 
 def volume_data_get_for_project(context, project_id):
@@ -248,10 +255,10 @@ def volume_get(context, volume_id):
 
 
 def volume_get_all(context, marker, limit, sort_key, sort_dir,
-                   filters=None):
+                   filters=None, columns=None):
     """Get all volumes."""
     return IMPL.volume_get_all(context, marker, limit, sort_key, sort_dir,
-                               filters=filters)
+                               filters=filters, columns=columns)
 
 
 def volume_get_all_by_host(context, host):
@@ -260,10 +267,11 @@ def volume_get_all_by_host(context, host):
 
 
 def volume_get_all_by_project(context, project_id, marker, limit, sort_key,
-                              sort_dir, filters=None):
+                              sort_dir, filters=None, columns=None):
     """Get all volumes belonging to a project."""
     return IMPL.volume_get_all_by_project(context, project_id, marker, limit,
-                                          sort_key, sort_dir, filters=filters)
+                                          sort_key, sort_dir, filters=filters,
+                                          columns=columns)
 
 
 def volume_get_iscsi_target_num(context, volume_id):
@@ -329,12 +337,17 @@ def snapshot_data_get_for_project(context, project_id, volume_type_id=None):
                                               volume_type_id)
 
 
-def snapshot_get_active_by_window(context, begin, end=None, project_id=None):
+def snapshot_get_active_by_window(context, begin, end=None, project_id=None,
+                                  marker=None, limit=None, columns=None):
     """Get all the snapshots inside the window.
 
-    Specifying a project_id will filter for a certain project.
+    Specifying a project_id will filter for a certain project.  Snapshots
+    are ordered by id; marker and limit select a page of them, and
+    columns the only snapshot columns to load.
     """
-    return IMPL.snapshot_get_active_by_window(context, begin, end, project_id)
+    return IMPL.snapshot_get_active_by_window(context, begin, end, project_id,
+                                              marker=marker, limit=limit,
+                                              columns=columns)
 
 
 ####################
@@ -449,12 +462,17 @@ def volume_type_destroy(context, id):
     return IMPL.volume_type_destroy(context, id)
 
 
-def volume_get_active_by_window(context, begin, end=None, project_id=None):
+def volume_get_active_by_window(context, begin, end=None, project_id=None,
+                                marker=None, limit=None, columns=None):
     """Get all the volumes inside the window.
 
-    Specifying a project_id will filter for a certain project.
+    Specifying a project_id will filter for a certain project.  Volumes
+    are ordered by id; marker and limit select a page of them, and
+    columns the only volume columns to load.
     """
-    return IMPL.volume_get_active_by_window(context, begin, end, project_id)
+    return IMPL.volume_get_active_by_window(context, begin, end, project_id,
+                                            marker=marker, limit=limit,
+                                            columns=columns)
 
 
 ####################
@@ -728,10 +746,18 @@ def quota_usage_get_all_by_project(context, project_id):
 
 
 def quota_reserve(context, resources, quotas, deltas, expire,
-                  until_refresh, max_age, project_id=None):
+                  until_refresh, max_age, project_id=None,
+                  defer_refresh=False):
     """Check quotas and create appropriate reservations."""
     return IMPL.quota_reserve(context, resources, quotas, deltas, expire,
-                              until_refresh, max_age, project_id=project_id)
+                              until_refresh, max_age, project_id=project_id,
+                              defer_refresh=defer_refresh)
+
+
+def quota_usage_refresh(context, resources, until_refresh, max_age):
+    """Refresh the usages that are due for a refresh."""
+    return IMPL.quota_usage_refresh(context, resources, until_refresh,
+                                    max_age)
 
 
 def reservation_commit(context, reservations, project_id=None):
@@ -829,3 +855,19 @@ def transfer_destroy(context, transfer_id):
 def transfer_accept(context, transfer_id, user_id, project_id):
     """Accept a volume transfer."""
     return IMPL.transfer_accept(context, transfer_id, user_id, project_id)
+
+
+###################
+
+
+def archive_deleted_rows(context, before=None, batch_size=1000,
+                         max_rows=None, purge=False):
+    """Move rows deleted before the given time to the shadow tables.
+
+    Rows are moved batch_size at a time, up to max_rows in all.  With
+    purge they are deleted instead.  Returns the number of rows moved
+    from every table.
+    """
+    return IMPL.archive_deleted_rows(context, before=before,
+                                     batch_size=batch_size,
+                                     max_rows=max_rows, purge=purge)
@@ -19,17 +19,25 @@
 """Implementation of SQLAlchemy backend."""
 
 
+import datetime
 import sys
 import threading
 import uuid
 import warnings
 
 from oslo.config import cfg
+from sqlalchemy import and_
+from sqlalchemy import case
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy import MetaData
 from sqlalchemy import or_
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlalchemy.orm import joinedload, joinedload_all
+from sqlalchemy.orm import load_only
 from sqlalchemy.orm import RelationshipProperty
+from sqlalchemy.sql.expression import exists
 from sqlalchemy.sql.expression import literal_column
+from sqlalchemy.sql.expression import select
 from sqlalchemy.sql import func
 
 from cinder.common import sqlalchemyutils
@@ -687,28 +695,168 @@ def _reservation_create(context, uuid, usage, project_id, resource, delta,
 # code always acquires the lock on quota_usages before acquiring the lock
 # on reservations.
 
-def _get_quota_usages(context, session, project_id):
+def _get_quota_usages(context, session, project_id, resources=None,
+                      lock=True):
     # Broken out for testability
-    rows = model_query(context, models.QuotaUsage,
-                       read_deleted="no",
-                       session=session).\
-        filter_by(project_id=project_id).\
-        with_lockmode('update').\
-        all()
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+        filter_by(project_id=project_id)
+    if resources is not None:
+        query = query.filter(models.QuotaUsage.resource.in_(resources))
+    if lock:
+        # Always lock usages in the same order.
+        query = query.order_by(models.QuotaUsage.id).\
+            with_lockmode('update')
+    rows = query.all()
     return dict((row.resource, row) for row in rows)
 
 
+def _quota_usage_sync(context, session, project_id, resources, resource,
+                      usages, until_refresh):
+    """Refresh the usage of resource with its sync routine.
+
+    The usages that the sync routine refreshes are updated in usages,
+    locking or creating their rows as needed, and their names returned.
+    """
+    # Grab the sync routine
+    sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
+    volume_type_id = getattr(resources[resource], 'volume_type_id', None)
+    volume_type_name = getattr(resources[resource], 'volume_type_name', None)
+    updates = sync(context, project_id,
+                   volume_type_id=volume_type_id,
+                   volume_type_name=volume_type_name,
+                   session=session)
+    for res, in_use in updates.items():
+        # Make sure we have a destination for the usage!
+        if res not in usages:
+            usages.update(_get_quota_usages(context, session, project_id,
+                                            resources=[res]))
+        if res not in usages:
+            usages[res] = _quota_usage_create(context,
+                                              project_id,
+                                              res,
+                                              0, 0,
+                                              until_refresh or None,
+                                              session=session)
+
+        # Update the usage, marking it as refreshed even if it did not
+        # change so that max_age starts over.
+        usages[res].in_use = in_use
+        usages[res].until_refresh = until_refresh or None
+        usages[res].updated_at = timeutils.utcnow()
+
+        # NOTE(Vek): We make the assumption that the sync
+        #            routine actually refreshes the
+        #            resources that it is the sync routine
+        #            for.  We don't check, because this is
+        #            a best-effort mechanism.
+    return set(updates)
+
+
+def _quota_usage_reserve(context, session, project_id, resource, delta,
+                         quota, max_age, defer_refresh):
+    """Apply a reservation of delta to a usage with a conditional UPDATE.
+
+    The usage is only updated if it does not have to be refreshed first
+    and a delta that is not negative keeps it within quota, so it does
+    not need to be locked beforehand.  Returns True if it was updated.
+    """
+    values = {'until_refresh': models.QuotaUsage.until_refresh - 1}
+    query = model_query(context, models.QuotaUsage,
+                        read_deleted="no",
+                        session=session).\
+        filter_by(project_id=project_id).\
+        filter_by(resource=resource)
+    if not defer_refresh:
+        query = query.\
+            filter(models.QuotaUsage.in_use >= 0).\
+            filter(or_(models.QuotaUsage.until_refresh == None,  # noqa
+                       models.QuotaUsage.until_refresh > 1))
+        if max_age:
+            oldest = timeutils.utcnow() - datetime.timedelta(seconds=max_age)
+            query = query.filter(models.QuotaUsage.updated_at > oldest)
+    if delta > 0:
+        values['reserved'] = models.QuotaUsage.reserved + delta
+    if delta >= 0 and quota >= 0:
+        query = query.filter(models.QuotaUsage.in_use +
+                             models.QuotaUsage.reserved + delta <= quota)
+    return query.update(values, synchronize_session=False) == 1
+
+
+class _QuotaReserveLocked(Exception):
+    """The reservation has to be made with the usages locked."""
+
+
+def _quota_reserve_unlocked(context, resources, quotas, deltas, expire,
+                            max_age, project_id, defer_refresh):
+    """Reserve deltas with conditional updates of the usages, if possible.
+
+    Returns the reservations, or None if a usage has to be created or
+    refreshed, the reservation would go over quota or the updates
+    deadlocked.  quota_reserve() then retries with the usages locked.
+    """
+    elevated = context.elevated()
+    session = get_session()
+    try:
+        with session.begin():
+            usages = _get_quota_usages(context, session, project_id,
+                                       resources=deltas.keys(), lock=False)
+            if set(deltas) - set(usages):
+                raise _QuotaReserveLocked()
+
+            # Update the usages in the order of their ids, the order in
+            # which the locked path and the reservation commit, rollback
+            # and expiry lock them, so that they can't deadlock.
+            for resource in sorted(deltas, key=lambda r: usages[r].id):
+                if not _quota_usage_reserve(elevated, session, project_id,
+                                            resource, deltas[resource],
+                                            quotas[resource], max_age,
+                                            defer_refresh):
+                    raise _QuotaReserveLocked()
+
+            reservations = []
+            for resource, delta in deltas.items():
+                reservation = _reservation_create(elevated,
+                                                  str(uuid.uuid4()),
+                                                  usages[resource],
+                                                  project_id,
+                                                  resource, delta, expire,
+                                                  session=session)
+                reservations.append(reservation.uuid)
+    except (_QuotaReserveLocked, db_exc.DBDeadlock):
+        return None
+
+    unders = [r for r, delta in deltas.items()
+              if delta < 0 and delta + usages[r].in_use < 0]
+    if unders:
+        LOG.warning(_("Change will make usage less than 0 for the following "
+                      "resources: %s") % unders)
+    return reservations
+
+
 @require_context
 def quota_reserve(context, resources, quotas, deltas, expire,
-                  until_refresh, max_age, project_id=None):
+                  until_refresh, max_age, project_id=None,
+                  defer_refresh=False):
+    if project_id is None:
+        project_id = context.project_id
+
+    # Most reservations are against usages that exist and are within
+    # quota, so first try to reserve with conditional updates of the
+    # usage rows, without locking them beforehand.
+    reservations = _quota_reserve_unlocked(context, resources, quotas,
+                                           deltas, expire, max_age,
+                                           project_id, defer_refresh)
+    if reservations is not None:
+        return reservations
+
     elevated = context.elevated()
     session = get_session()
     with session.begin():
-        if project_id is None:
-            project_id = context.project_id
-
         # Get the current usages
-        usages = _get_quota_usages(context, session, project_id)
+        usages = _get_quota_usages(context, session, project_id,
+                                   resources=deltas.keys())
 
         # Handle usage refresh
         work = set(deltas.keys())
@@ -725,6 +873,11 @@ def quota_reserve(context, resources, quotas, deltas, expire,
                                                        until_refresh or None,
                                                        session=session)
                 refresh = True
+            elif defer_refresh:
+                # Usages that are due for a refresh are left to
+                # quota_usage_refresh().
+                if usages[resource].until_refresh is not None:
+                    usages[resource].until_refresh -= 1
             elif usages[resource].in_use < 0:
                 # Negative in_use count indicates a desync, so try to
                 # heal from that...
@@ -740,43 +893,13 @@ def quota_reserve(context, resources, quotas, deltas, expire,
 
             # OK, refresh the usage
             if refresh:
-                # Grab the sync routine
-                sync = QUOTA_SYNC_FUNCTIONS[resources[resource].sync]
-                volume_type_id = getattr(resources[resource],
-                                         'volume_type_id', None)
-                volume_type_name = getattr(resources[resource],
-                                           'volume_type_name', None)
-                updates = sync(elevated, project_id,
-                               volume_type_id=volume_type_id,
-                               volume_type_name=volume_type_name,
-                               session=session)
-                for res, in_use in updates.items():
-                    # Make sure we have a destination for the usage!
-                    if res not in usages:
-                        usages[res] = _quota_usage_create(
-                            elevated,
-                            project_id,
-                            res,
-                            0, 0,
-                            until_refresh or None,
-                            session=session
-                        )
-
-                    # Update the usage
-                    usages[res].in_use = in_use
-                    usages[res].until_refresh = until_refresh or None
-
-                    # Because more than one resource may be refreshed
-                    # by the call to the sync routine, and we don't
-                    # want to double-sync, we make sure all refreshed
-                    # resources are dropped from the work set.
-                    work.discard(res)
-
-                    # NOTE(Vek): We make the assumption that the sync
-                    #            routine actually refreshes the
-                    #            resources that it is the sync routine
-                    #            for.  We don't check, because this is
-                    #            a best-effort mechanism.
+                # Because more than one resource may be refreshed
+                # by the call to the sync routine, and we don't
+                # want to double-sync, we make sure all refreshed
+                # resources are dropped from the work set.
+                work -= _quota_usage_sync(elevated, session, project_id,
+                                          resources, resource, usages,
+                                          until_refresh)
 
         # Check for deltas that would go negative
         unders = [r for r, delta in deltas.items()
@@ -837,45 +960,106 @@ def quota_reserve(context, resources, quotas, deltas, expire,
     return reservations
 
 
+@require_admin_context
+def quota_usage_refresh(context, resources, until_refresh, max_age):
+    """Refresh the usages that quota_reserve() left due for a refresh."""
+    query = model_query(context, models.QuotaUsage.project_id,
+                        models.QuotaUsage.resource, read_deleted="no").\
+        filter(models.QuotaUsage.resource.in_(resources.keys()))
+    conditions = [models.QuotaUsage.in_use < 0,
+                  models.QuotaUsage.until_refresh <= 0]
+    if max_age:
+        oldest = timeutils.utcnow() - datetime.timedelta(seconds=max_age)
+        conditions.append(models.QuotaUsage.updated_at <= oldest)
+    due = {}
+    for project_id, resource in query.filter(or_(*conditions)).all():
+        due.setdefault(project_id, set()).add(resource)
+
+    for project_id, project_resources in due.items():
+        session = get_session()
+        with session.begin():
+            usages = _get_quota_usages(context, session, project_id,
+                                       resources=project_resources)
+            work = set(usages)
+            while work:
+                resource = work.pop()
+                work -= _quota_usage_sync(context, session, project_id,
+                                          resources, resource, usages,
+                                          until_refresh)
+        LOG.debug('Refreshed quota usages %(resources)s of project '
+                  '%(project_id)s' % {'resources': sorted(project_resources),
+                                      'project_id': project_id})
+
+
 def _quota_reservations(session, context, reservations):
-    """Return the relevant reservations."""
+    """Lock the relevant reservations, return the condition selecting them."""
 
-    # Get the listed reservations
-    return model_query(context, models.Reservation,
-                       read_deleted="no",
-                       session=session).\
+    # Lock the listed reservations
+    model_query(context, models.Reservation.id,
+                read_deleted="no",
+                session=session).\
         filter(models.Reservation.uuid.in_(reservations)).\
         with_lockmode('update').\
         all()
+    return models.Reservation.uuid.in_(reservations)
+
+
+def _reservations_release(context, session, condition, commit):
+    """Take the reservations matching condition off their usages.
+
+    The deltas are summed per usage in the database and each usage is
+    updated with a single UPDATE, rather than loading every reservation
+    and its usage.  Committed deltas are added to in_use.  The
+    reservations are then deleted with one more UPDATE.  The usages are
+    expected to be locked already.
+    """
+    reservation = models.Reservation
+    # NOTE(Vek): Only positive deltas were added to reserved.
+    reserved = func.sum(case([(reservation.delta >= 0, reservation.delta)],
+                             else_=0))
+    deltas = model_query(context, reservation.usage_id, reserved,
+                         func.sum(reservation.delta),
+                         read_deleted="no", session=session).\
+        filter(condition).\
+        group_by(reservation.usage_id).\
+        all()
+    for usage_id, usage_reserved, usage_delta in deltas:
+        values = {'reserved': models.QuotaUsage.reserved - usage_reserved}
+        if commit:
+            values['in_use'] = models.QuotaUsage.in_use + usage_delta
+        model_query(context, models.QuotaUsage, read_deleted="no",
+                    session=session).\
+            filter_by(id=usage_id).\
+            update(values, synchronize_session=False)
+
+    if deltas:
+        model_query(context, reservation, read_deleted="no",
+                    session=session).\
+            filter(condition).\
+            update({'deleted': True, 'deleted_at': timeutils.utcnow()},
+                   synchronize_session=False)
 
 
 @require_context
 def reservation_commit(context, reservations, project_id=None):
     session = get_session()
     with session.begin():
-        usages = _get_quota_usages(context, session, project_id)
-
-        for reservation in _quota_reservations(session, context, reservations):
-            usage = usages[reservation.resource]
-            if reservation.delta >= 0:
-                usage.reserved -= reservation.delta
-            usage.in_use += reservation.delta
-
-            reservation.delete(session=session)
+        _get_quota_usages(context, session, project_id)
+        _reservations_release(context, session,
+                              _quota_reservations(session, context,
+                                                  reservations),
+                              commit=True)
 
 
 @require_context
 def reservation_rollback(context, reservations, project_id=None):
     session = get_session()
     with session.begin():
-        usages = _get_quota_usages(context, session, project_id)
-
-        for reservation in _quota_reservations(session, context, reservations):
-            usage = usages[reservation.resource]
-            if reservation.delta >= 0:
-                usage.reserved -= reservation.delta
-
-            reservation.delete(session=session)
+        _get_quota_usages(context, session, project_id)
+        _reservations_release(context, session,
+                              _quota_reservations(session, context,
+                                                  reservations),
+                              commit=False)
 
 
 @require_admin_context
@@ -907,23 +1091,51 @@ def quota_destroy_all_by_project(context, project_id):
             reservation_ref.delete(session=session)
 
 
+# Number of expired reservations released in each transaction.
+_RESERVATION_EXPIRE_BATCH = 1000
+
+
 @require_admin_context
 def reservation_expire(context):
-    session = get_session()
-    with session.begin():
-        current_time = timeutils.utcnow()
-        results = model_query(context, models.Reservation, session=session,
-                              read_deleted="no").\
-            filter(models.Reservation.expire < current_time).\
-            all()
+    current_time = timeutils.utcnow()
+    expired = models.Reservation.expire < current_time
+    marker = None
+    while True:
+        # Batches are ranges of ids, which are cheaper to select with than
+        # lists of ids.
+        conditions = [expired]
+        if marker is not None:
+            conditions.append(models.Reservation.id > marker)
+        last = model_query(context, models.Reservation.id,
+                           read_deleted="no").\
+            filter(and_(*conditions)).\
+            order_by(models.Reservation.id).\
+            offset(_RESERVATION_EXPIRE_BATCH - 1).\
+            first()
+        if last is not None:
+            conditions.append(models.Reservation.id <= last.id)
+        condition = and_(*conditions)
 
-        if results:
-            for reservation in results:
-                if reservation.delta >= 0:
-                    reservation.usage.reserved -= reservation.delta
-                    reservation.usage.save(session=session)
+        session = get_session()
+        with session.begin():
+            # Lock the usages before the reservations, like the other
+            # quota code.  Reservations committed or rolled back
+            # meanwhile are deleted and left out.
+            usage_ids = model_query(context, models.Reservation.usage_id,
+                                    read_deleted="no", session=session).\
+                filter(condition).\
+                distinct()
+            model_query(context, models.QuotaUsage.id, read_deleted="no",
+                        session=session).\
+                filter(models.QuotaUsage.id.in_(usage_ids.subquery())).\
+                order_by(models.QuotaUsage.id).\
+                with_lockmode('update').\
+                all()
+            _reservations_release(context, session, condition, commit=False)
 
-                reservation.delete(session=session)
+        if last is None:
+            break
+        marker = last.id
 
 
 ###################
@@ -991,23 +1203,34 @@ def volume_create(context, values):
 
 
 @require_admin_context
-def volume_data_get_for_host(context, host, count_only=False):
+def volume_data_get_for_host(context, host, count_only=False,
+                             statuses=None):
+    columns = [func.count(models.Volume.id)]
+    if not count_only:
+        columns.append(func.sum(models.Volume.size))
+    query = model_query(context, *columns, read_deleted="no").\
+        filter_by(host=host)
+    if statuses:
+        query = query.filter(models.Volume.status.in_(statuses))
+    result = query.first()
     if count_only:
-        result = model_query(context,
-                             func.count(models.Volume.id),
-                             read_deleted="no").\
-            filter_by(host=host).\
-            first()
         return result[0] or 0
-    else:
-        result = model_query(context,
-                             func.count(models.Volume.id),
-                             func.sum(models.Volume.size),
-                             read_deleted="no").\
-            filter_by(host=host).\
-            first()
-        # NOTE(vish): convert None to 0
-        return (result[0] or 0, result[1] or 0)
+    # NOTE(vish): convert None to 0
+    return (result[0] or 0, result[1] or 0)
+
+
+@require_admin_context
+def volume_count_get_for_hosts(context, hosts):
+    if not hosts:
+        return {}
+    rows = model_query(context,
+                       models.Volume.host,
+                       func.count(models.Volume.id),
+                       read_deleted="no").\
+        filter(models.Volume.host.in_(hosts)).\
+        group_by(models.Volume.host).\
+        all()
+    return dict(rows)
 
 
 @require_admin_context
@@ -1139,7 +1362,7 @@ def volume_get(context, volume_id):
 
 @require_admin_context
 def volume_get_all(context, marker, limit, sort_key, sort_dir,
-                   filters=None):
+                   filters=None, columns=None):
     """Retrieves all volumes.
 
     :param context: context to query under
@@ -1152,17 +1375,14 @@ def volume_get_all(context, marker, limit, sort_key, sort_dir,
                     'no_migration_targets'=True causes volumes with either
                     a NULL 'migration_status' or a 'migration_status' that
                     does not start with 'target:' to be retrieved.
+    :param columns: if given, only these columns of the volumes are
+                    retrieved, as dicts
     :returns: list of matching volumes
     """
     session = get_session()
     with session.begin():
-        # Generate the query
-        query = _generate_paginate_query(context, session, marker, limit,
-                                         sort_key, sort_dir, filters)
-        # No volumes would match, return empty list
-        if query == None:
-            return []
-        return query.all()
+        return _volume_get_page(context, session, marker, limit, sort_key,
+                                sort_dir, filters, columns)
 
 
 @require_admin_context
@@ -1172,7 +1392,7 @@ def volume_get_all_by_host(context, host):
 
 @require_context
 def volume_get_all_by_project(context, project_id, marker, limit, sort_key,
-                              sort_dir, filters=None):
+                              sort_dir, filters=None, columns=None):
     """"Retrieves all volumes in a project.
 
     :param context: context to query under
@@ -1186,6 +1406,8 @@ def volume_get_all_by_project(context, project_id, marker, limit, sort_key,
                     'no_migration_targets'=True causes volumes with either
                     a NULL 'migration_status' or a 'migration_status' that
                     does not start with 'target:' to be retrieved.
+    :param columns: if given, only these columns of the volumes are
+                    retrieved, as dicts
     :returns: list of matching volumes
     """
     session = get_session()
@@ -1194,21 +1416,82 @@ def volume_get_all_by_project(context, project_id, marker, limit, sort_key,
         # Add in the project filter without modifying the given filters
         filters = filters.copy() if filters else {}
         filters['project_id'] = project_id
-        # Generate the query
-        query = _generate_paginate_query(context, session, marker, limit,
-                                         sort_key, sort_dir, filters)
-        # No volumes would match, return empty list
-        if query == None:
-            return []
-        return query.all()
+        return _volume_get_page(context, session, marker, limit, sort_key,
+                                sort_dir, filters, columns)
+
+
+# Volume ids per IN query when loading metadata, within SQLite's limit
+# on the number of bound parameters.
+_VOLUME_METADATA_BATCH = 500
+
+
+def _volumes_load_metadata(context, session, volumes):
+    """Load the metadata of a page of volumes with IN queries.
+
+    Joined loads repeat every volume row for each of its metadata items,
+    so the metadata of all volumes is fetched separately and attached to
+    the volumes instead.
+    """
+    relationships = [('volume_metadata', models.VolumeMetadata)]
+    if is_admin_context(context):
+        relationships.append(('volume_admin_metadata',
+                              models.VolumeAdminMetadata))
+    ids = [volume.id for volume in volumes]
+    for name, model in relationships:
+        items = {}
+        for i in xrange(0, len(ids), _VOLUME_METADATA_BATCH):
+            query = model_query(context, model, session=session,
+                                read_deleted="no").\
+                filter(model.volume_id.in_(ids[i:i +
+                                               _VOLUME_METADATA_BATCH]))
+            for item in query:
+                items.setdefault(item.volume_id, []).append(item)
+        for volume in volumes:
+            set_committed_value(volume, name, items.get(volume.id, []))
+
+
+def _volume_get_page(context, session, marker, limit, sort_key, sort_dir,
+                     filters, columns):
+    query = _generate_paginate_query(context, session, marker, limit,
+                                     sort_key, sort_dir, filters,
+                                     columns=columns)
+    # No volumes would match, return empty list
+    if query is None:
+        return []
+    volumes = query.all()
+    if not volumes and marker is not None:
+        # The marker is only looked up within the page query, make sure
+        # an empty page is not down to a marker that does not exist.
+        _volume_get(context, marker, session)
+    if columns:
+        return [dict(zip(columns, row)) for row in volumes]
+    _volumes_load_metadata(context, session, volumes)
+    return volumes
+
+
+class _MarkerSubquery(object):
+    """Stands in for the marker volume in paginate_query().
+
+    Its attributes are subqueries selecting the values of the marker
+    volume, so paginate_query() compares against them in the page query
+    itself and the marker volume is not loaded beforehand.
+    """
+
+    def __init__(self, query):
+        self._query = query
+
+    def __getattr__(self, key):
+        return self._query.with_entities(getattr(models.Volume, key)).\
+            as_scalar()
 
 
 def _generate_paginate_query(context, session, marker, limit, sort_key,
-                             sort_dir, filters):
+                             sort_dir, filters, columns=None):
     """Generate the query to include the filters and the paginate options.
 
     Returns a query with sorting / pagination criteria added or None
-    if the given filters will not yield any results.
+    if the given filters will not yield any results.  The query loads
+    volumes without their metadata, or only the given columns.
 
     :param context: context to query under
     :param session: the session to use
@@ -1221,9 +1504,19 @@ def _generate_paginate_query(context, session, marker, limit, sort_key,
                     tuples, sets, or frozensets cause an 'IN' test to
                     be performed, while exact matching ('==' operator)
                     is used for other values
+    :param columns: names of the volume columns to select, or None to
+                    select volumes
     :returns: updated query or None
     """
-    query = _volume_get_query(context, session=session)
+    if columns:
+        try:
+            entities = [getattr(models.Volume, column) for column in columns]
+        except AttributeError:
+            raise exception.InvalidInput(reason=_('Invalid column'))
+        query = model_query(context, *entities, session=session)
+    else:
+        query = model_query(context, models.Volume, session=session).\
+            options(joinedload('volume_type'))
 
     if filters:
         filters = filters.copy()
@@ -1296,7 +1589,9 @@ def _generate_paginate_query(context, session, marker, limit, sort_key,
 
     marker_volume = None
     if marker is not None:
-        marker_volume = _volume_get(context, marker, session)
+        marker_volume = _MarkerSubquery(
+            model_query(context, models.Volume, session=session,
+                        project_only=True).filter_by(id=marker))
 
     return sqlalchemyutils.paginate_query(query, models.Volume, limit,
                                           [sort_key, 'created_at', 'id'],
@@ -1627,19 +1922,25 @@ def snapshot_data_get_for_project(context, project_id, volume_type_id=None):
 
 
 @require_context
-def snapshot_get_active_by_window(context, begin, end=None, project_id=None):
+def snapshot_get_active_by_window(context, begin, end=None, project_id=None,
+                                  marker=None, limit=None, columns=None):
     """Return snapshots that were active during window."""
 
     query = model_query(context, models.Snapshot, read_deleted="yes")
     query = query.filter(or_(models.Snapshot.deleted_at == None,
                              models.Snapshot.deleted_at > begin))
-    query = query.options(joinedload(models.Snapshot.volume))
+    if columns:
+        query = query.options(load_only(*columns),
+                              joinedload(models.Snapshot.volume).
+                              load_only('id', 'availability_zone'))
+    else:
+        query = query.options(joinedload(models.Snapshot.volume))
     if end:
         query = query.filter(models.Snapshot.created_at < end)
     if project_id:
         query = query.filter_by(project_id=project_id)
 
-    return query.all()
+    return _get_window_page(query, models.Snapshot, marker, limit)
 
 
 @require_context
@@ -1950,16 +2251,35 @@ def volume_type_destroy(context, id):
 def volume_get_active_by_window(context,
                                 begin,
                                 end=None,
-                                project_id=None):
+                                project_id=None,
+                                marker=None,
+                                limit=None,
+                                columns=None):
     """Return volumes that were active during window."""
     query = model_query(context, models.Volume, read_deleted="yes")
     query = query.filter(or_(models.Volume.deleted_at == None,
                              models.Volume.deleted_at > begin))
+    if columns:
+        query = query.options(load_only(*columns))
     if end:
         query = query.filter(models.Volume.created_at < end)
     if project_id:
         query = query.filter_by(project_id=project_id)
 
+    return _get_window_page(query, models.Volume, marker, limit)
+
+
+def _get_window_page(query, model, marker, limit):
+    """Returns the rows of query after the marker id, ordered by id.
+
+    Pages are found with the primary key index rather than an offset,
+    so that every page of a large window costs the same.
+    """
+    if marker is not None:
+        query = query.filter(model.id > marker)
+    query = query.order_by(model.id)
+    if limit is not None:
+        query = query.limit(limit)
     return query.all()
 
 
@@ -2799,3 +3119,82 @@ def transfer_accept(context, transfer_id, user_id, project_id):
             update({'deleted': True,
                     'deleted_at': timeutils.utcnow(),
                     'updated_at': literal_column('updated_at')})
+
+
+###############################
+
+
+# Prefix of the tables that deleted rows are archived to.
+_SHADOW_TABLE_PREFIX = 'shadow_'
+
+
+def _archive_deleted_rows_for_table(engine, metadata, table, before,
+                                    batch_size, max_rows, purge):
+    """Archives or purges up to max_rows deleted rows of table.
+
+    Each batch is moved in a transaction of its own, so that locks are
+    only held briefly.  Rows that other rows still refer to are left.
+    """
+    shadow_table = None
+    if not purge:
+        shadow_table = metadata.tables[_SHADOW_TABLE_PREFIX + table.name]
+    key = list(table.primary_key.columns)[0]
+    conditions = [table.c.deleted == True]
+    if before is not None:
+        conditions.append(table.c.deleted_at < before)
+    for other in metadata.sorted_tables:
+        for fk in other.foreign_keys:
+            if fk.column.table is table:
+                # An alias, in case the table refers to itself.
+                referring = other.alias()
+                conditions.append(~exists().where(
+                    referring.c[fk.parent.name] == fk.column))
+    query = select([key]).where(and_(*conditions)).order_by(key)
+
+    rows = 0
+    while max_rows is None or rows < max_rows:
+        limit = batch_size
+        if max_rows is not None:
+            limit = min(limit, max_rows - rows)
+        with engine.begin() as conn:
+            ids = [row[0] for row in conn.execute(query.limit(limit))]
+            if not ids:
+                break
+            if shadow_table is not None:
+                columns = [column.name for column in table.c]
+                conn.execute(shadow_table.insert().from_select(
+                    columns, table.select().where(key.in_(ids))))
+            conn.execute(table.delete().where(key.in_(ids)))
+        rows += len(ids)
+        if len(ids) < limit:
+            break
+    return rows
+
+
+@require_admin_context
+def archive_deleted_rows(context, before=None, batch_size=1000,
+                         max_rows=None, purge=False):
+    """Moves deleted rows to the shadow tables, or purges them.
+
+    Tables are done in order of their foreign keys, rows that refer to
+    others before the rows they refer to.
+    """
+    engine = get_engine()
+    metadata = MetaData(bind=engine)
+    metadata.reflect()
+    archived = {}
+    for table in reversed(metadata.sorted_tables):
+        if (table.name.startswith(_SHADOW_TABLE_PREFIX) or
+                'deleted' not in table.c):
+            continue
+        remaining = None
+        if max_rows is not None:
+            remaining = max_rows - sum(archived.values())
+            if remaining <= 0:
+                break
+        archived[table.name] = _archive_deleted_rows_for_table(
+            engine, metadata, table, before, batch_size, remaining, purge)
+        LOG.debug('%(action)s %(rows)d rows of %(table)s' %
+                  {'action': 'Purged' if purge else 'Archived',
+                   'rows': archived[table.name], 'table': table.name})
+    return archived
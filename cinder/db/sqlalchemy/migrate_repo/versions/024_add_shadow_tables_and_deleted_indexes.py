@@ -0,0 +1,82 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Column, Index, MetaData, Table
+
+from cinder.openstack.common.gettextutils import _
+from cinder.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+SHADOW_TABLE_PREFIX = 'shadow_'
+
+# Indexes for the lookups of rows that are not deleted by project and
+# host, and of reservations that expired.
+INDEXES = (
+    ('volumes', 'volumes_deleted_project_id_idx', ('deleted', 'project_id')),
+    ('volumes', 'volumes_deleted_host_idx', ('deleted', 'host')),
+    ('snapshots', 'snapshots_deleted_project_id_idx',
+     ('deleted', 'project_id')),
+    ('quota_usages', 'quota_usages_deleted_project_id_idx',
+     ('deleted', 'project_id')),
+    ('reservations', 'reservations_deleted_expire_idx',
+     ('deleted', 'expire')),
+)
+
+
+def _soft_deleted_tables(meta):
+    """Returns the tables whose rows are soft deleted."""
+    meta.reflect()
+    return [table for name, table in sorted(meta.tables.items())
+            if 'deleted' in table.c and
+            not name.startswith(SHADOW_TABLE_PREFIX)]
+
+
+def upgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    # Deleted rows are archived to shadow tables with the same columns,
+    # but without constraints so that any row can be moved there, even
+    # one whose id was reused after an earlier row was archived.
+    for table in _soft_deleted_tables(meta):
+        columns = [Column(column.name, column.type) for column in table.c]
+        shadow_table = Table(SHADOW_TABLE_PREFIX + table.name, meta,
+                             *columns, mysql_engine='InnoDB',
+                             mysql_charset='utf8')
+        try:
+            shadow_table.create()
+        except Exception:
+            LOG.error(_("Table |%s| not created!"), repr(shadow_table))
+            raise
+
+    for table_name, index_name, columns in INDEXES:
+        table = meta.tables[table_name]
+        Index(index_name, *[table.c[column] for column in columns]).create()
+
+
+def downgrade(migrate_engine):
+    meta = MetaData()
+    meta.bind = migrate_engine
+
+    for table_name, index_name, columns in INDEXES:
+        table = Table(table_name, meta, autoload=True)
+        Index(index_name, *[table.c[column] for column in columns]).drop()
+
+    meta.reflect()
+    for name, table in meta.tables.items():
+        if name.startswith(SHADOW_TABLE_PREFIX):
+            try:
+                table.drop()
+            except Exception:
+                LOG.error(_("%s table not dropped"), name)
+                raise
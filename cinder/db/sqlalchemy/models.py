@@ -71,6 +71,11 @@ class Service(BASE, CinderBase):
 class Volume(BASE, CinderBase):
     """Represents a block storage device that can be attached to a vm."""
     __tablename__ = 'volumes'
+    __table_args__ = (schema.Index('volumes_deleted_project_id_idx',
+                                   'deleted', 'project_id'),
+                      schema.Index('volumes_deleted_host_idx',
+                                   'deleted', 'host'),
+                      {'mysql_engine': 'InnoDB'})
     id = Column(String(36), primary_key=True)
     _name_id = Column(String(36))  # Don't access/modify this directly!
 
@@ -297,6 +302,9 @@ class QuotaUsage(BASE, CinderBase):
     """Represents the current usage for a given resource."""
 
     __tablename__ = 'quota_usages'
+    __table_args__ = (schema.Index('quota_usages_deleted_project_id_idx',
+                                   'deleted', 'project_id'),
+                      {'mysql_engine': 'InnoDB'})
     id = Column(Integer, primary_key=True)
 
     project_id = Column(String(255), index=True)
@@ -316,6 +324,9 @@ class Reservation(BASE, CinderBase):
     """Represents a resource reservation for quotas."""
 
     __tablename__ = 'reservations'
+    __table_args__ = (schema.Index('reservations_deleted_expire_idx',
+                                   'deleted', 'expire'),
+                      {'mysql_engine': 'InnoDB'})
     id = Column(Integer, primary_key=True)
     uuid = Column(String(36), nullable=False)
 
@@ -337,6 +348,9 @@ class Reservation(BASE, CinderBase):
 class Snapshot(BASE, CinderBase):
     """Represents a snapshot of volume."""
     __tablename__ = 'snapshots'
+    __table_args__ = (schema.Index('snapshots_deleted_project_id_idx',
+                                   'deleted', 'project_id'),
+                      {'mysql_engine': 'InnoDB'})
     id = Column(String(36), primary_key=True)
 
     @property
@@ -424,6 +438,7 @@ class Backup(BASE, CinderBase):
     service = Column(String(255))
     size = Column(Integer)
     object_count = Column(Integer)
+    parent_id = Column(String(36))
 
 
 class Encryption(BASE, CinderBase):
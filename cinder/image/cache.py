@@ -0,0 +1,194 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Local cache of images converted to raw.
+
+Images are kept as raw files named after the image id and checksum, so
+that an image that is changed in the image service is fetched again.
+The least recently used images are evicted when the cache grows over its
+size, except those that are being copied to a volume.  Requests for an
+image that is being fetched wait for that fetch instead of starting
+their own.
+"""
+
+import collections
+import math
+import os
+
+from eventlet import event
+
+from cinder import exception
+from cinder.image import image_utils
+from cinder.openstack.common import fileutils
+from cinder.openstack.common.gettextutils import _
+from cinder.openstack.common import log as logging
+from cinder.openstack.common import units
+from cinder.volume import utils as volume_utils
+
+
+LOG = logging.getLogger(__name__)
+
+PART_SUFFIX = '.part'
+
+
+def _disk_usage(path):
+    """Returns the bytes allocated to path, which is usually sparse."""
+    return os.stat(path).st_blocks * 512
+
+
+class ImageCache(object):
+    """Raw images cached in a directory.
+
+    :param path: directory to keep the images in
+    :param max_size: bytes of disk the images may use
+    """
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Disk usage of every image by key, least recently used first.
+        self._entries = None
+        self._users = collections.defaultdict(int)
+        self._fetching = {}
+
+    def _image_path(self, key):
+        return os.path.join(self.path, key)
+
+    def _load(self):
+        """Finds the images cached before the service started."""
+        fileutils.ensure_tree(self.path)
+        images = []
+        for name in os.listdir(self.path):
+            path = self._image_path(name)
+            if name.endswith(PART_SUFFIX):
+                # A fetch that did not finish.
+                fileutils.delete_if_exists(path)
+                continue
+            images.append((os.path.getmtime(path), name, _disk_usage(path)))
+        self._entries = collections.OrderedDict()
+        for mtime, name, usage in sorted(images):
+            self._entries[name] = usage
+            self.size += usage
+        self._evict()
+
+    def _evict(self):
+        for key in list(self._entries):
+            if self.size <= self.max_size:
+                break
+            if self._users[key]:
+                continue
+            LOG.debug('Evicting image %s from the cache' % key)
+            fileutils.delete_if_exists(self._image_path(key))
+            self.size -= self._entries.pop(key)
+            self.evictions += 1
+
+    def _fetch(self, key, context, image_service, image_id, blocksize,
+               user_id, project_id, size):
+        path = self._image_path(key)
+        tmp = path + PART_SUFFIX
+        with fileutils.remove_path_on_error(tmp):
+            # Create the file so that this process owns it.
+            open(tmp, 'wb').close()
+            # Images that do not fit in the volume are rejected before
+            # they are converted into the cache.
+            image_utils.fetch_to_raw(context, image_service, image_id, tmp,
+                                     blocksize, user_id, project_id, size)
+            os.rename(tmp, path)
+        os.utime(path, None)
+        usage = _disk_usage(path)
+        self._entries[key] = usage
+        self.size += usage
+        LOG.info(_('Cached image %(image_id)s in %(path)s') %
+                 {'image_id': image_id, 'path': path})
+
+    def _acquire(self, key, *fetch_args):
+        """Returns the path of the cached image, fetching it if needed.
+
+        The image is not evicted until it is released.
+        """
+        if self._entries is None:
+            self._load()
+        while key not in self._entries:
+            fetching = self._fetching.get(key)
+            if fetching is None:
+                self.misses += 1
+                fetching = self._fetching[key] = event.Event()
+                try:
+                    self._fetch(key, *fetch_args)
+                finally:
+                    del self._fetching[key]
+                    fetching.send()
+                break
+            # Wait for the fetch in progress, then try it again if it failed.
+            fetching.wait()
+        else:
+            self.hits += 1
+            self._entries[key] = self._entries.pop(key)
+            os.utime(self._image_path(key), None)
+        self._users[key] += 1
+        return self._image_path(key)
+
+    def _release(self, key):
+        self._users[key] -= 1
+        if not self._users[key]:
+            del self._users[key]
+        self._evict()
+
+    def fetch_to_raw(self, context, image_service, image_id, dest, blocksize,
+                     user_id=None, project_id=None, size=None):
+        """Writes the image to dest in raw format, like the image_utils one.
+
+        Images without a checksum are not cached.
+        """
+        image_meta = image_service.show(context, image_id)
+        checksum = image_meta.get('checksum')
+        if not checksum:
+            return image_utils.fetch_to_raw(context, image_service, image_id,
+                                            dest, blocksize, user_id,
+                                            project_id, size)
+
+        key = '%s-%s' % (image_id, checksum)
+        path = self._acquire(key, context, image_service, image_id,
+                             blocksize, user_id, project_id, size)
+        try:
+            virtual_size = os.path.getsize(path)
+            # NOTE(xqueralt): If the image virtual size doesn't fit in the
+            # requested volume there is no point on resizing it because it
+            # will generate an unusable image.
+            if size is not None and virtual_size > size * units.Gi:
+                params = {'image_size': virtual_size / units.Gi,
+                          'volume_size': size}
+                reason = _("Size is %(image_size)dGB and doesn't fit in a "
+                           "volume of size %(volume_size)dGB.") % params
+                raise exception.ImageUnacceptable(image_id=image_id,
+                                                  reason=reason)
+            volume_utils.copy_volume(
+                path, dest, int(math.ceil(float(virtual_size) / units.Mi)),
+                blocksize)
+        finally:
+            self._release(key)
+
+    def get_stats(self):
+        """Returns the hits, misses, evictions and size of the cache."""
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'images': len(self._entries or ()),
+                'size_gb': float(self.size) / units.Gi,
+                'max_size_gb': float(self.max_size) / units.Gi}
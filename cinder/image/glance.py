@@ -20,14 +20,19 @@
 from __future__ import absolute_import
 
 import copy
+import hashlib
 import itertools
+import os
 import random
 import shutil
+import stat
 import sys
 import time
 
+from eventlet import greenpool
 import glanceclient.exc
 from oslo.config import cfg
+import requests
 import six.moves.urllib.parse as urlparse
 
 from cinder import exception
@@ -35,6 +40,7 @@ from cinder.openstack.common.gettextutils import _
 from cinder.openstack.common import jsonutils
 from cinder.openstack.common import log as logging
 from cinder.openstack.common import timeutils
+from cinder.openstack.common import units
 
 glance_opts = [
     cfg.ListOpt('allowed_direct_url_schemes',
@@ -42,6 +48,15 @@ glance_opts = [
                 help='A list of url schemes that can be downloaded directly '
                      'via the direct_url.  Currently supported schemes: '
                      '[file].'),
+    cfg.IntOpt('glance_download_workers',
+               default=1,
+               help='Number of byte ranges of an image downloaded at the '
+                    'same time from the glance API servers. 1 downloads '
+                    'images in a single stream'),
+    cfg.IntOpt('glance_download_range_size',
+               default=64,
+               help='Size in MiB of the byte ranges of images downloaded '
+                    'with several workers'),
 ]
 glance_core_properties = [
     cfg.ListOpt('glance_core_properties',
@@ -113,6 +128,145 @@ def get_api_servers():
     return itertools.cycle(api_servers)
 
 
+def _image_data_url(netloc, use_ssl, image_id):
+    scheme = 'https' if use_ssl else 'http'
+    if CONF.glance_api_version >= 2:
+        return '%s://%s/v2/images/%s/file' % (scheme, netloc, image_id)
+    return '%s://%s/v1/images/%s' % (scheme, netloc, image_id)
+
+
+class RangedDownload(object):
+    """Downloads an image in byte ranges over several connections.
+
+    The ranges are requested from the glance API servers in turn and
+    written at their offsets in the file open as fd, each through a
+    descriptor of its own.  The checksum of the file is computed as the
+    ranges complete in order.
+    """
+
+    CHUNK_SIZE = units.Mi
+
+    def __init__(self, context, image_id, size, fd):
+        self.image_id = image_id
+        self.size = size
+        self.fd = fd
+        self.range_size = CONF.glance_download_range_size * units.Mi
+        self.checksum = hashlib.md5()
+        self._error = None
+        self.headers = {}
+        if CONF.auth_strategy == 'keystone':
+            self.headers['X-Auth-Token'] = context.auth_token
+        self._api_servers = get_api_servers()
+
+    def _get(self, start, end):
+        netloc, use_ssl = self._api_servers.next()
+        headers = dict(self.headers, Range='bytes=%d-%d' % (start, end))
+        return requests.get(_image_data_url(netloc, use_ssl, self.image_id),
+                            headers=headers, stream=True,
+                            verify=not CONF.glance_api_insecure,
+                            timeout=CONF.glance_request_timeout)
+
+    def _open(self, flags):
+        """Opens the file again, with an offset of its own."""
+        return os.open('/proc/self/fd/%d' % self.fd, flags)
+
+    def _write(self, fd, response, start, end):
+        os.lseek(fd, start, os.SEEK_SET)
+        offset = start
+        for chunk in response.iter_content(self.CHUNK_SIZE):
+            written = 0
+            while written < len(chunk):
+                written += os.write(fd, buffer(chunk, written))
+            offset += len(chunk)
+        if offset != end + 1:
+            raise IOError(_('Got %(count)d bytes of range %(start)d-%(end)d '
+                            'of image %(image_id)s') %
+                          {'count': offset - start, 'start': start,
+                           'end': end, 'image_id': self.image_id})
+
+    def _fetch(self, start, end):
+        num_attempts = 1 + CONF.glance_num_retries
+        for attempt in xrange(1, num_attempts + 1):
+            try:
+                response = self._get(start, end)
+                try:
+                    if response.status_code != 206:
+                        raise IOError(_('Got status %(status)d for a range '
+                                        'of image %(image_id)s') %
+                                      {'status': response.status_code,
+                                       'image_id': self.image_id})
+                    fd = self._open(os.O_WRONLY)
+                    try:
+                        self._write(fd, response, start, end)
+                    finally:
+                        os.close(fd)
+                finally:
+                    response.close()
+                return start, end
+            except (IOError, requests.RequestException) as e:
+                if attempt == num_attempts:
+                    raise
+                LOG.warning(_('Error downloading range %(start)d-%(end)d of '
+                              'image %(image_id)s, retrying: %(error)s') %
+                            {'start': start, 'end': end,
+                             'image_id': self.image_id, 'error': e})
+
+    def _fetch_range(self, byte_range):
+        # After an error the other ranges are skipped, not left running.
+        if self._error is not None:
+            return None
+        try:
+            return self._fetch(*byte_range)
+        except Exception as e:
+            self._error = self._error or e
+            return None
+
+    def _update_checksum(self, read_fd, start, end):
+        os.lseek(read_fd, start, os.SEEK_SET)
+        remaining = end + 1 - start
+        while remaining:
+            data = os.read(read_fd, min(remaining, self.CHUNK_SIZE))
+            if not data:
+                break
+            self.checksum.update(data)
+            remaining -= len(data)
+
+    def run(self):
+        """Downloads the image, returns False if ranges are not served."""
+        first = (0, min(self.range_size, self.size) - 1)
+        try:
+            response = self._get(*first)
+        except requests.RequestException as e:
+            LOG.warning(_('Error downloading a range of image %(image_id)s: '
+                          '%(error)s') % {'image_id': self.image_id,
+                                          'error': e})
+            return False
+        if response.status_code != 206:
+            response.close()
+            return False
+
+        # The file is only open for writing, open it again to read it back.
+        read_fd = self._open(os.O_RDONLY)
+        try:
+            try:
+                self._write(self.fd, response, *first)
+            finally:
+                response.close()
+            self._update_checksum(read_fd, *first)
+            ranges = [(start, min(start + self.range_size, self.size) - 1)
+                      for start in xrange(self.range_size, self.size,
+                                          self.range_size)]
+            pool = greenpool.GreenPool(CONF.glance_download_workers)
+            for byte_range in pool.imap(self._fetch_range, ranges):
+                if byte_range is not None:
+                    self._update_checksum(read_fd, *byte_range)
+        finally:
+            os.close(read_fd)
+        if self._error is not None:
+            raise self._error
+        return True
+
+
 class GlanceClientWrapper(object):
     """Glance client wrapper class that implements retries."""
 
@@ -260,6 +414,40 @@ class GlanceImageService(object):
         return (getattr(image_meta, 'direct_url', None),
                 getattr(image_meta, 'locations', None))
 
+    def _download_ranges(self, context, image_id, data):
+        """Downloads the image with several connections if possible.
+
+        Returns whether the image was downloaded.
+        """
+        try:
+            fd = data.fileno()
+        except (AttributeError, IOError, ValueError):
+            return False
+        mode = os.fstat(fd).st_mode
+        if not (stat.S_ISREG(mode) or stat.S_ISBLK(mode)):
+            return False
+        image_meta = self.show(context, image_id)
+        size = image_meta.get('size') or 0
+        if size <= CONF.glance_download_range_size * units.Mi:
+            return False
+
+        data.flush()
+        download = RangedDownload(context, image_id, size, fd)
+        if not download.run():
+            LOG.info(_('Byte ranges of image %s are not served, downloading '
+                       'it in a single stream') % image_id)
+            return False
+
+        checksum = image_meta.get('checksum')
+        if checksum and download.checksum.hexdigest() != checksum:
+            raise exception.ImageUnacceptable(
+                image_id=image_id,
+                reason=_('Checksum of the downloaded data is %(actual)s, '
+                         'expected %(expected)s') %
+                {'actual': download.checksum.hexdigest(),
+                 'expected': checksum})
+        return True
+
     def download(self, context, image_id, data=None):
         """Calls out to Glance for data and writes data."""
         if 'file' in CONF.allowed_direct_url_schemes:
@@ -273,6 +461,12 @@ class GlanceImageService(object):
                     shutil.copyfileobj(f, data)
                 return
 
+        # Only images that cannot be copied locally are downloaded in
+        # ranges.
+        if (data is not None and CONF.glance_download_workers > 1 and
+                self._download_ranges(context, image_id, data)):
+            return
+
         try:
             image_chunks = self._client.call(context, 'data', image_id)
         except Exception:
@@ -25,6 +25,7 @@ we should look at maybe pushing this up to Oslo
 
 
 import contextlib
+import hashlib
 import os
 import tempfile
 
@@ -50,6 +51,11 @@ image_helper_opt = [cfg.StrOpt('image_conversion_dir',
 CONF = cfg.CONF
 CONF.register_opts(image_helper_opt)
 
+# Raw images are streamed to volumes in writes of this size, once this
+# much of them has been checked by qemu-img.
+STREAM_WRITE_SIZE = 4 * units.Mi
+STREAM_PROBE_SIZE = units.Mi
+
 
 def qemu_img_info(path):
     """Return an object containing the parsed output from qemu-img info."""
@@ -130,6 +136,91 @@ def fetch_to_raw(context, image_service,
                            blocksize, user_id, project_id, size)
 
 
+class _RawImageWriter(object):
+    """Writes a raw image to a volume as it is downloaded.
+
+    The first bytes are held back until qemu-img has checked that they are
+    not an image in some other format, which may have a backing file.
+    """
+
+    def __init__(self, image_id, dest_file):
+        self.image_id = image_id
+        self.dest_file = dest_file
+        self.checksum = hashlib.md5()
+        self.size = 0
+        self._checked = False
+        self._pending = []
+        self._pending_size = 0
+
+    def _check(self, data):
+        with temporary_file() as tmp:
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            try:
+                info = qemu_img_info(tmp)
+            except processutils.ProcessExecutionError:
+                # Without qemu-img, raw images are taken as they are.
+                LOG.debug('qemu-img is not available to check image %s' %
+                          self.image_id)
+                return
+        if info.file_format != 'raw':
+            raise exception.ImageUnacceptable(
+                image_id=self.image_id,
+                reason=_("Image is marked raw, but its format is %s") %
+                info.file_format)
+
+    def _flush(self):
+        data = ''.join(self._pending)
+        self._pending = []
+        self._pending_size = 0
+        if not self._checked:
+            self._check(data)
+            self._checked = True
+        self.dest_file.write(data)
+
+    def write(self, data):
+        self.checksum.update(data)
+        self.size += len(data)
+        self._pending.append(data)
+        self._pending_size += len(data)
+        if self._pending_size >= (STREAM_WRITE_SIZE if self._checked
+                                  else STREAM_PROBE_SIZE):
+            self._flush()
+
+    def close(self):
+        if self._pending or not self._checked:
+            self._flush()
+
+
+def _stream_raw_to_volume(context, image_service, image_meta, dest, size):
+    """Downloads a raw image straight to the volume, without a temp file."""
+    image_id = image_meta['id']
+    if size is not None and image_meta.get('size', 0) > size * units.Gi:
+        params = {'image_size': image_meta['size'] / units.Gi,
+                  'volume_size': size}
+        reason = _("Size is %(image_size)dGB and doesn't fit in a "
+                   "volume of size %(volume_size)dGB.") % params
+        raise exception.ImageUnacceptable(image_id=image_id, reason=reason)
+
+    LOG.debug('Streaming raw image %(image_id)s to %(dest)s' %
+              {'image_id': image_id, 'dest': dest})
+    with utils.temporary_chown(dest):
+        with open(dest, 'wb') as dest_file:
+            writer = _RawImageWriter(image_id, dest_file)
+            image_service.download(context, image_id, writer)
+            writer.close()
+            dest_file.flush()
+            os.fsync(dest_file.fileno())
+
+    checksum = image_meta.get('checksum')
+    if checksum and writer.checksum.hexdigest() != checksum:
+        raise exception.ImageUnacceptable(
+            image_id=image_id,
+            reason=_("Checksum of the downloaded data is %(actual)s, "
+                     "expected %(expected)s") %
+            {'actual': writer.checksum.hexdigest(), 'expected': checksum})
+
+
 def fetch_to_volume_format(context, image_service,
                            image_id, dest, volume_format, blocksize,
                            user_id=None, project_id=None, size=None):
@@ -140,6 +231,14 @@ def fetch_to_volume_format(context, image_service,
     qemu_img = True
     image_meta = image_service.show(context, image_id)
 
+    # Raw images need no conversion, so they are written to the volume as
+    # they are downloaded.  Other formats are converted from a temp file.
+    if (volume_format == 'raw' and image_meta and
+            image_meta.get('disk_format') == 'raw'):
+        return _stream_raw_to_volume(context, image_service,
+                                     dict(image_meta, id=image_id), dest,
+                                     size)
+
     # NOTE(avishay): I'm not crazy about creating temp files which may be
     # large and cause disk full errors which would confuse users.
     # Unfortunately it seems that you can't pipe to 'qemu-img convert' because
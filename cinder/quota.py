@@ -52,6 +52,18 @@ quota_opts = [
     cfg.IntOpt('max_age',
                default=0,
                help='Number of seconds between subsequent usage refreshes'),
+    cfg.BoolOpt('defer_usage_refresh',
+                default=False,
+                help='Refresh usages that are due for a refresh (see '
+                     'until_refresh and max_age) in a periodic task of the '
+                     'scheduler instead of while making a reservation'),
+    cfg.IntOpt('quota_resources_cache_ttl',
+               default=60,
+               help='Number of seconds the quota resources of volume types '
+                    'are cached for. Volume types created or deleted '
+                    'through this process invalidate the cache right away, '
+                    'so this bounds how long changes made by other API '
+                    'nodes take to be seen. 0 disables the cache'),
     cfg.StrOpt('quota_driver',
                default='cinder.quota.DbQuotaDriver',
                help='Default driver to use for quota checks'),
@@ -355,7 +367,8 @@ class DbQuotaDriver(object):
         #            have to do the work there.
         return db.quota_reserve(context, resources, quotas, deltas, expire,
                                 CONF.until_refresh, CONF.max_age,
-                                project_id=project_id)
+                                project_id=project_id,
+                                defer_refresh=CONF.defer_usage_refresh)
 
     def commit(self, context, reservations, project_id=None):
         """Commit reservations.
@@ -411,6 +424,16 @@ class DbQuotaDriver(object):
 
         db.reservation_expire(context)
 
+    def refresh_usages(self, context, resources):
+        """Refresh the usages that are due for a refresh.
+
+        :param context: The request context, for access checks.
+        :param resources: A dictionary of the registered resources.
+        """
+
+        db.quota_usage_refresh(context, resources, CONF.until_refresh,
+                               CONF.max_age)
+
 
 class BaseResource(object):
     """Describe a single resource for quota checking."""
@@ -813,6 +836,17 @@ class QuotaEngine(object):
 
         self._driver.expire(context)
 
+    def refresh_usages(self, context):
+        """Refresh the usages that are due for a refresh.
+
+        Reservations leave those to this method if defer_usage_refresh
+        is set.
+
+        :param context: The request context, for access checks.
+        """
+
+        self._driver.refresh_usages(context, self.resources)
+
     def add_volume_type_opts(self, context, opts, volume_type_id):
         """Add volume type resource options.
 
@@ -850,10 +884,22 @@ class QuotaEngine(object):
 class VolumeTypeQuotaEngine(QuotaEngine):
     """Represent the set of all quotas."""
 
-    @property
-    def resources(self):
-        """Fetches all possible quota resources."""
-
+    def __init__(self, quota_driver_class=None):
+        super(VolumeTypeQuotaEngine, self).__init__(
+            quota_driver_class=quota_driver_class)
+        # Bumped by invalidate_resources(); resources built before the
+        # last bump are discarded, even if they were still being built.
+        self._version = 0
+        self._cache = None
+        self.hits = 0
+        self.misses = 0
+
+    def invalidate_resources(self):
+        """Forget the cached resources, e.g. after a volume type change."""
+        self._version += 1
+        self._cache = None
+
+    def _load_resources(self):
         result = {}
         # Global quotas.
         argses = [('volumes', '_sync_volumes', 'quota_volumes'),
@@ -872,6 +918,42 @@ class VolumeTypeQuotaEngine(QuotaEngine):
                 result[resource.name] = resource
         return result
 
+    @property
+    def resources(self):
+        """Fetches all possible quota resources."""
+
+        ttl = CONF.quota_resources_cache_ttl
+        now = timeutils.utcnow_ts()
+        cache = self._cache
+        if (ttl > 0 and cache is not None and
+                cache[0] == self._version and now < cache[1]):
+            self.hits += 1
+            return dict(cache[2])
+
+        self.misses += 1
+        version = self._version
+        result = self._load_resources()
+        if ttl > 0 and version == self._version:
+            self._cache = (version, now + ttl, result)
+        return dict(result)
+
+    def _check_resources(self, names):
+        # Volume types created through another API node are not known
+        # until the cache expires, so look again before failing.
+        cache = self._cache
+        if cache is not None and set(names) - set(cache[2]):
+            self.invalidate_resources()
+
+    def limit_check(self, context, project_id=None, **values):
+        self._check_resources(values)
+        return super(VolumeTypeQuotaEngine, self).limit_check(
+            context, project_id=project_id, **values)
+
+    def reserve(self, context, expire=None, project_id=None, **deltas):
+        self._check_resources(deltas)
+        return super(VolumeTypeQuotaEngine, self).reserve(
+            context, expire=expire, project_id=project_id, **deltas)
+
     def register_resource(self, resource):
         raise NotImplementedError(_("Cannot register resource"))
 
@@ -0,0 +1,183 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Columnar view of the capacity fields of a set of host states.
+
+When scheduler_columnar_evaluation is enabled and NumPy is installed, the
+CapacityFilter, CapacityWeigher and VolumeNumberWeigher evaluate all hosts
+at once on the arrays built here instead of calling a Python method per
+host.
+"""
+
+from oslo.config import cfg
+
+from cinder.openstack.common import log as logging
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+columnar_opts = [
+    cfg.BoolOpt('scheduler_columnar_evaluation',
+                default=False,
+                help='Evaluate the capacity filter and the capacity and '
+                     'volume number weighers over all hosts at once using '
+                     'NumPy arrays. Ignored if NumPy is not installed.'),
+]
+
+CONF = cfg.CONF
+CONF.register_opts(columnar_opts)
+
+LOG = logging.getLogger(__name__)
+
+
+def is_enabled():
+    """Return True if columnar evaluation is configured and available."""
+    return CONF.scheduler_columnar_evaluation and numpy is not None
+
+
+class CapacityColumns(object):
+    """Capacity fields of host states kept in NumPy arrays.
+
+    Every host state added to the store owns one row and writes its
+    capacity into it whenever it changes, so evaluating a request only has
+    to look up the rows of the candidate hosts.  'infinite' and 'unknown'
+    free capacities are flagged in ``unlimited``, a missing free capacity
+    in ``unset``.
+    """
+
+    def __init__(self, size=64):
+        self._rows = {}
+        self._unused_rows = []
+        self._size = 0
+        self._allocate(size)
+
+    def _allocate(self, size):
+        def grow(column, dtype):
+            new_column = numpy.zeros(size, dtype=dtype)
+            if column is not None:
+                new_column[:self._size] = column[:self._size]
+            return new_column
+
+        self.host_states = grow(getattr(self, 'host_states', None), object)
+        for name in ('free_capacity_gb', 'total_capacity_gb',
+                     'allocated_capacity_gb', 'reserved_percentage'):
+            setattr(self, name, grow(getattr(self, name, None), float))
+        for name in ('unlimited', 'unset'):
+            setattr(self, name, grow(getattr(self, name, None), bool))
+        self._unused_rows.extend(reversed(range(self._size, size)))
+        self._size = size
+
+    def add(self, host_state, attach=True):
+        """Assign a row to host_state and fill it in.
+
+        Attached host states keep their row up to date themselves.
+        """
+        if not self._unused_rows:
+            self._allocate(self._size * 2)
+        row = self._unused_rows.pop()
+        self._rows[id(host_state)] = row
+        self.host_states[row] = host_state
+        if attach:
+            host_state.capacity_columns = self
+        self.update(host_state)
+        return row
+
+    def remove(self, host_state):
+        row = self._rows.pop(id(host_state), None)
+        if row is None:
+            return
+        self.host_states[row] = None
+        self._unused_rows.append(row)
+        if host_state.capacity_columns is self:
+            host_state.capacity_columns = None
+
+    def update(self, host_state):
+        """Copy the capacity of host_state into its row."""
+        row = self._rows[id(host_state)]
+        free = host_state.free_capacity_gb
+        self.unset[row] = free is None
+        self.unlimited[row] = free == 'infinite' or free == 'unknown'
+        if self.unset[row] or self.unlimited[row]:
+            free = 0
+        self.free_capacity_gb[row] = free
+        total = host_state.total_capacity_gb
+        if total == 'infinite' or total == 'unknown':
+            total = 0
+        self.total_capacity_gb[row] = total
+        self.allocated_capacity_gb[row] = host_state.allocated_capacity_gb
+        self.reserved_percentage[row] = host_state.reserved_percentage
+
+    def rows(self, host_states):
+        """Return the row numbers of host_states, or None if any is
+        missing from this store.
+        """
+        rows = list(map(self._rows.get, map(id, host_states)))
+        if None in rows:
+            return None
+        return numpy.array(rows, dtype=int)
+
+
+class CapacityView(object):
+    """Capacity columns of a list of host states, in the list's order."""
+
+    def __init__(self, host_states):
+        host_states = list(host_states)
+        columns = None
+        rows = None
+        if host_states:
+            columns = host_states[0].capacity_columns
+        if columns is not None:
+            rows = columns.rows(host_states)
+        if rows is None:
+            # Not all of the hosts are tracked by the same store, so build
+            # a temporary one.
+            columns = CapacityColumns(max(len(host_states), 1))
+            for host_state in host_states:
+                columns.add(host_state, attach=False)
+            rows = columns.rows(host_states)
+
+        self.host_states = columns.host_states[rows]
+        self.free_capacity_gb = columns.free_capacity_gb[rows]
+        self.total_capacity_gb = columns.total_capacity_gb[rows]
+        self.allocated_capacity_gb = columns.allocated_capacity_gb[rows]
+        self.reserved_percentage = columns.reserved_percentage[rows]
+        self.unlimited = columns.unlimited[rows]
+        self.unset = columns.unset[rows]
+
+    def __len__(self):
+        return len(self.host_states)
+
+    def hosts(self):
+        return numpy.array([host_state.host
+                            for host_state in self.host_states],
+                           dtype=object)
+
+    def usable_capacity_gb(self):
+        """Free capacity minus the reserved share, floored.
+
+        Unlimited hosts are reported as infinity.
+        """
+        reserved = self.reserved_percentage / 100.0
+        usable = numpy.floor(self.free_capacity_gb * (1 - reserved))
+        usable[self.unlimited] = numpy.inf
+        return usable
+
+    def select(self, mask):
+        """Return the host states for which mask is True."""
+        return self.host_states[mask].tolist()
@@ -81,3 +81,8 @@ class Scheduler(object):
     def schedule_create_volume(self, context, request_spec, filter_properties):
         """Must override schedule method for scheduler to work."""
         raise NotImplementedError(_("Must implement schedule_create_volume"))
+
+    def schedule_create_volumes(self, context, request_spec, volume_ids,
+                                filter_properties):
+        """Must override schedule method for batch scheduling to work."""
+        raise NotImplementedError(_("Must implement schedule_create_volumes"))
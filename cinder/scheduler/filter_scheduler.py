@@ -86,6 +86,67 @@ class FilterScheduler(driver.Scheduler):
                                          snapshot_id=snapshot_id,
                                          image_id=image_id)
 
+    def schedule_create_volumes(self, context, request_spec, volume_ids,
+                                filter_properties):
+        """Place several volumes sharing one request_spec in a single pass.
+
+        The candidate hosts are looked up and filtered once for the whole
+        batch.  Every placement virtually consumes capacity on the chosen
+        host, which is then re-checked by the filters and the remaining
+        candidates are weighed again, so the volumes are spread the same
+        way individual requests would be.
+
+        :returns: a list of the volume ids which could not be placed.
+        """
+        if filter_properties is None:
+            filter_properties = {}
+        weighed_hosts = self._get_weighted_candidates(context, request_spec,
+                                                      filter_properties)
+        hosts = [weighed_host.obj for weighed_host in weighed_hosts]
+
+        unplaced = []
+        for volume_id in volume_ids:
+            if not hosts:
+                unplaced.append(volume_id)
+                continue
+            if weighed_hosts is None:
+                weighed_hosts = self.host_manager.get_weighed_hosts(
+                    hosts, filter_properties)
+            top_host = self._choose_top_host(weighed_hosts, request_spec)
+            host_state = top_host.obj
+            weighed_hosts = None
+
+            # Drop the host from the candidates once it can not take
+            # another volume of this batch.
+            if not self.host_manager.get_filtered_hosts([host_state],
+                                                        filter_properties):
+                hosts.remove(host_state)
+
+            volume_filter_properties = filter_properties.copy()
+            # context is not serializable
+            volume_filter_properties.pop('context', None)
+            retry = filter_properties.get('retry')
+            if retry:
+                volume_filter_properties['retry'] = {
+                    'num_attempts': retry['num_attempts'],
+                    'hosts': list(retry['hosts']),
+                }
+            self._post_select_populate_filter_properties(
+                volume_filter_properties, host_state)
+
+            volume_request_spec = request_spec.copy()
+            volume_request_spec['volume_id'] = volume_id
+            updated_volume = driver.volume_update_db(context, volume_id,
+                                                     host_state.host)
+            self.volume_rpcapi.create_volume(
+                context, updated_volume, host_state.host,
+                volume_request_spec, volume_filter_properties,
+                allow_reschedule=True,
+                snapshot_id=request_spec.get('snapshot_id'),
+                image_id=request_spec.get('image_id'))
+
+        return unplaced
+
     def host_passes_filters(self, context, host, request_spec,
                             filter_properties):
         """Check if the specified host passes the filters."""
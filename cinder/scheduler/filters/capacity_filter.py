@@ -21,6 +21,7 @@ import math
 from cinder.openstack.common.gettextutils import _
 from cinder.openstack.common import log as logging
 from cinder.openstack.common.scheduler import filters
+from cinder.scheduler import columnar
 
 
 LOG = logging.getLogger(__name__)
@@ -62,3 +63,34 @@ class CapacityFilter(filters.BaseHostFilter):
                            'available': free})
 
         return free >= volume_size
+
+    def filter_all(self, filter_obj_list, filter_properties):
+        """Yield hosts with sufficient capacity.
+
+        With columnar evaluation enabled all hosts are checked at once.
+        """
+        if not columnar.is_enabled():
+            return super(CapacityFilter, self).filter_all(filter_obj_list,
+                                                          filter_properties)
+
+        columns = columnar.CapacityView(filter_obj_list)
+        if not len(columns):
+            return []
+
+        if columns.unset.any():
+            LOG.error(_("Free capacity not set: "
+                        "volume node info collection broken."))
+
+        volume_size = filter_properties.get('size')
+        usable = columns.usable_capacity_gb()
+        passes = (usable >= volume_size) & ~columns.unset
+        vol_exists_on = filter_properties.get('vol_exists_on')
+        if vol_exists_on is not None:
+            passes |= columns.hosts() == vol_exists_on
+
+        if not passes.all():
+            LOG.warning(_("Insufficient free space for volume creation "
+                          "of %(requested)sG on %(count)d hosts")
+                        % {'requested': volume_size,
+                           'count': len(columns) - passes.sum()})
+        return columns.select(passes)
@@ -28,6 +28,7 @@ from cinder.openstack.common import log as logging
 from cinder.openstack.common.scheduler import filters
 from cinder.openstack.common.scheduler import weights
 from cinder.openstack.common import timeutils
+from cinder.scheduler import columnar
 from cinder import utils
 
 
@@ -44,7 +45,14 @@ host_manager_opts = [
                 default=[
                     'CapacityWeigher'
                 ],
-                help='Which weigher class names to use for weighing hosts.')
+                help='Which weigher class names to use for weighing hosts.'),
+    cfg.IntOpt('scheduler_host_state_refresh_interval',
+               default=10,
+               help='Maximum number of seconds the scheduler reuses the '
+                    'list of enabled and running volume services before '
+                    'reading it from the database again. Capability updates '
+                    'from volume services are applied as they arrive. Set '
+                    'to 0 to read the service list on every request.'),
 ]
 
 CONF = cfg.CONF
@@ -91,6 +99,8 @@ class HostState(object):
 
     def __init__(self, host, capabilities=None, service=None):
         self.host = host
+        # columnar.CapacityColumns store mirroring the capacity fields
+        self.capacity_columns = None
         self.update_capabilities(capabilities, service)
 
         self.volume_backend_name = None
@@ -138,6 +148,8 @@ class HostState(object):
             self.reserved_percentage = capability['reserved_percentage']
 
             self.updated = capability['timestamp']
+            if self.capacity_columns is not None:
+                self.capacity_columns.update(self)
 
     def consume_from_volume(self, volume):
         """Incrementally update host state from an volume."""
@@ -152,6 +164,8 @@ class HostState(object):
         else:
             self.free_capacity_gb -= volume_gb
         self.updated = timeutils.utcnow()
+        if self.capacity_columns is not None:
+            self.capacity_columns.update(self)
 
     def __repr__(self):
         return ("host '%s': free_capacity_gb: %s" %
@@ -166,6 +180,15 @@ class HostManager(object):
     def __init__(self):
         self.service_states = {}  # { <host>: {<service>: {cap k : v}}}
         self.host_state_map = {}
+        # Cached { <host>: <service dict> } of enabled, running volume
+        # services, and the time it was last read from the database.
+        self._active_services = None
+        self._active_services_updated = None
+        # { <host>: <capabilities dict last applied to its HostState> }
+        self._applied_capabilities = {}
+        self._capacity_columns = None
+        if columnar.is_enabled():
+            self._capacity_columns = columnar.CapacityColumns()
         self.filter_handler = filters.HostFilterHandler('cinder.scheduler.'
                                                         'filters')
         self.filter_classes = self.filter_handler.get_all_classes()
@@ -276,50 +299,102 @@ class HostManager(object):
         # Copy the capabilities, so we don't modify the original dict
         capab_copy = dict(capabilities)
         capab_copy["timestamp"] = timeutils.utcnow()  # Reported time
+        new_host = host not in self.service_states
         self.service_states[host] = capab_copy
 
-    def get_all_host_states(self, context):
-        """Returns a dict of all the hosts the HostManager knows about.
-
-        Each of the consumable resources in HostState are
-        populated with capabilities scheduler received from RPC.
-
-        For example:
-          {'192.168.1.100': HostState(), ...}
+        if (new_host and self._active_services is not None and
+                host not in self._active_services):
+            # A service we have not heard of reported in, so the set of
+            # services has changed; re-read it on the next request.
+            # Disabled and down services keep reporting too, those are
+            # picked up once the list expires.
+            self._active_services = None
+
+    def _active_services_expired(self):
+        if self._active_services is None:
+            return True
+        interval = CONF.scheduler_host_state_refresh_interval
+        if interval <= 0:
+            return True
+        return timeutils.is_older_than(self._active_services_updated,
+                                       interval)
+
+    def _refresh_active_services(self, context):
+        """Re-read enabled volume services and their state if needed.
+
+        Returns True if the cached service list was replaced.
         """
+        if not self._active_services_expired():
+            return False
 
-        # Get resource usage across the available volume nodes:
         topic = CONF.volume_topic
         volume_services = db.service_get_all_by_topic(context,
                                                       topic,
                                                       disabled=False)
-        active_hosts = set()
+        active_services = {}
         for service in volume_services:
             host = service['host']
             if not utils.service_is_up(service):
                 LOG.warn(_("volume service is down. (host: %s)") % host)
                 continue
+            active_services[host] = dict(service.iteritems())
+
+        self._active_services = active_services
+        self._active_services_updated = timeutils.utcnow()
+        # Service records may have changed, so every host state has to be
+        # brought up to date again.
+        self._applied_capabilities.clear()
+        return True
+
+    def get_all_host_states(self, context):
+        """Returns a dict of all the hosts the HostManager knows about.
+
+        Each of the consumable resources in HostState are
+        populated with capabilities scheduler received from RPC.
+
+        For example:
+          {'192.168.1.100': HostState(), ...}
+
+        The list of volume services is only read from the database when
+        a previously unknown service reports its capabilities or when it is
+        older than scheduler_host_state_refresh_interval.  Host states are
+        only updated for services that reported new capabilities since the
+        previous call.
+        """
+
+        services_refreshed = self._refresh_active_services(context)
+
+        for host, service in self._active_services.iteritems():
             capabilities = self.service_states.get(host, None)
             host_state = self.host_state_map.get(host)
             if host_state:
+                if (host in self._applied_capabilities and
+                        self._applied_capabilities[host] is capabilities):
+                    # Nothing was reported since the last request.
+                    continue
                 # copy capabilities to host_state.capabilities
-                host_state.update_capabilities(capabilities,
-                                               dict(service.iteritems()))
+                host_state.update_capabilities(capabilities, service)
             else:
                 host_state = self.host_state_cls(host,
                                                  capabilities=capabilities,
-                                                 service=
-                                                 dict(service.iteritems()))
+                                                 service=service)
                 self.host_state_map[host] = host_state
+                if self._capacity_columns is not None:
+                    self._capacity_columns.add(host_state)
             # update attributes in host_state that scheduler is interested in
             host_state.update_from_volume_capability(capabilities)
-            active_hosts.add(host)
-
-        # remove non-active hosts from host_state_map
-        nonactive_hosts = set(self.host_state_map.keys()) - active_hosts
-        for host in nonactive_hosts:
-            LOG.info(_("Removing non-active host: %(host)s from "
-                       "scheduler cache.") % {'host': host})
-            del self.host_state_map[host]
+            self._applied_capabilities[host] = capabilities
+
+        if services_refreshed:
+            # remove non-active hosts from host_state_map
+            nonactive_hosts = (set(self.host_state_map.keys()) -
+                               set(self._active_services.keys()))
+            for host in nonactive_hosts:
+                LOG.info(_("Removing non-active host: %(host)s from "
+                           "scheduler cache.") % {'host': host})
+                host_state = self.host_state_map.pop(host)
+                self._applied_capabilities.pop(host, None)
+                if self._capacity_columns is not None:
+                    self._capacity_columns.remove(host_state)
 
         return self.host_state_map.itervalues()
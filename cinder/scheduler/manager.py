@@ -31,6 +31,7 @@ from cinder.openstack.common import excutils
 from cinder.openstack.common.gettextutils import _
 from cinder.openstack.common import importutils
 from cinder.openstack.common import log as logging
+from cinder.openstack.common import periodic_task
 from cinder import quota
 from cinder import rpc
 from cinder.scheduler.flows import create_volume
@@ -53,7 +54,7 @@ LOG = logging.getLogger(__name__)
 class SchedulerManager(manager.Manager):
     """Chooses a host to create volumes."""
 
-    RPC_API_VERSION = '1.5'
+    RPC_API_VERSION = '1.6'
 
     target = messaging.Target(version=RPC_API_VERSION)
 
@@ -78,6 +79,11 @@ class SchedulerManager(manager.Manager):
         ctxt = context.get_admin_context()
         self.request_service_capabilities(ctxt)
 
+    @periodic_task.periodic_task
+    def _refresh_quota_usages(self, context):
+        if CONF.defer_usage_refresh:
+            QUOTAS.refresh_usages(context)
+
     def update_service_capabilities(self, context, service_name=None,
                                     host=None, capabilities=None, **kwargs):
         """Process a capability update from a service node."""
@@ -107,6 +113,38 @@ class SchedulerManager(manager.Manager):
         with flow_utils.DynamicLogListener(flow_engine, logger=LOG):
             flow_engine.run()
 
+    def create_volumes(self, context, topic, volume_ids, request_spec=None,
+                       filter_properties=None):
+        """Schedule several volumes created with the same request_spec."""
+
+        def _create_volumes_set_error(self, context, ex, request_spec,
+                                      volume_ids):
+            volume_state = {'volume_state': {'status': 'error'}}
+            for volume_id in volume_ids:
+                volume_request_spec = dict(request_spec, volume_id=volume_id)
+                self._set_volume_state_and_notify('create_volume',
+                                                  volume_state, context, ex,
+                                                  volume_request_spec)
+
+        try:
+            unplaced = self.driver.schedule_create_volumes(context,
+                                                           request_spec,
+                                                           volume_ids,
+                                                           filter_properties)
+        except exception.NoValidHost as ex:
+            _create_volumes_set_error(self, context, ex, request_spec,
+                                      volume_ids)
+        except Exception as ex:
+            with excutils.save_and_reraise_exception():
+                _create_volumes_set_error(self, context, ex, request_spec,
+                                          volume_ids)
+        else:
+            if unplaced:
+                ex = exception.NoValidHost(
+                    reason=_("No weighed hosts available"))
+                _create_volumes_set_error(self, context, ex, request_spec,
+                                          unplaced)
+
     def request_service_capabilities(self, context):
         volume_rpcapi.VolumeAPI().publish_service_capabilities(context)
 
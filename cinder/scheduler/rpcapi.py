@@ -38,6 +38,7 @@ class SchedulerAPI(object):
         1.3 - Add migrate_volume_to_host() method
         1.4 - Add retype method
         1.5 - Add manage_existing method
+        1.6 - Add create_volumes method
     '''
 
     RPC_API_VERSION = '1.0'
@@ -46,7 +47,7 @@ class SchedulerAPI(object):
         super(SchedulerAPI, self).__init__()
         target = messaging.Target(topic=CONF.scheduler_topic,
                                   version=self.RPC_API_VERSION)
-        self.client = rpc.get_client(target, version_cap='1.5')
+        self.client = rpc.get_client(target, version_cap='1.6')
 
     def create_volume(self, ctxt, topic, volume_id, snapshot_id=None,
                       image_id=None, request_spec=None,
@@ -62,6 +63,16 @@ class SchedulerAPI(object):
                           request_spec=request_spec_p,
                           filter_properties=filter_properties)
 
+    def create_volumes(self, ctxt, topic, volume_ids, request_spec=None,
+                       filter_properties=None):
+        cctxt = self.client.prepare(version='1.6')
+        request_spec_p = jsonutils.to_primitive(request_spec)
+        return cctxt.cast(ctxt, 'create_volumes',
+                          topic=topic,
+                          volume_ids=volume_ids,
+                          request_spec=request_spec_p,
+                          filter_properties=filter_properties)
+
     def migrate_volume_to_host(self, ctxt, topic, volume_id, host,
                                force_host_copy=False, request_spec=None,
                                filter_properties=None):
@@ -38,6 +38,7 @@ import math
 from oslo.config import cfg
 
 from cinder.openstack.common.scheduler import weights
+from cinder.scheduler import columnar
 
 
 capacity_weight_opts = [
@@ -72,6 +73,17 @@ class CapacityWeigher(weights.BaseHostWeigher):
             free = math.floor(host_state.free_capacity_gb * (1 - reserved))
         return free
 
+    def weigh_objects(self, weighed_obj_list, weight_properties):
+        if not columnar.is_enabled():
+            return super(CapacityWeigher, self).weigh_objects(
+                weighed_obj_list, weight_properties)
+
+        columns = columnar.CapacityView(weighed_obj.obj for weighed_obj
+                                        in weighed_obj_list)
+        weights = self._weight_multiplier() * columns.usable_capacity_gb()
+        for weighed_obj, weight in zip(weighed_obj_list, weights.tolist()):
+            weighed_obj.weight += weight
+
 
 class AllocatedCapacityWeigher(weights.BaseHostWeigher):
     def _weight_multiplier(self):
@@ -83,3 +95,14 @@ class AllocatedCapacityWeigher(weights.BaseHostWeigher):
         # allocated_capacity first) to be the default.
         allocated_space = host_state.allocated_capacity_gb
         return allocated_space
+
+    def weigh_objects(self, weighed_obj_list, weight_properties):
+        if not columnar.is_enabled():
+            return super(AllocatedCapacityWeigher, self).weigh_objects(
+                weighed_obj_list, weight_properties)
+
+        columns = columnar.CapacityView(weighed_obj.obj for weighed_obj
+                                        in weighed_obj_list)
+        weights = self._weight_multiplier() * columns.allocated_capacity_gb
+        for weighed_obj, weight in zip(weighed_obj_list, weights.tolist()):
+            weighed_obj.weight += weight
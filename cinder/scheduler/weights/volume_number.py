@@ -28,6 +28,7 @@ from oslo.config import cfg
 from cinder import db
 from cinder.openstack.common import log as logging
 from cinder.openstack.common.scheduler import weights
+from cinder.scheduler import columnar
 
 
 LOG = logging.getLogger(__name__)
@@ -58,3 +59,18 @@ class VolumeNumberWeigher(weights.BaseHostWeigher):
                                                     host=host_state.host,
                                                     count_only=True)
         return volume_number
+
+    def weigh_objects(self, weighed_obj_list, weight_properties):
+        """Weigh all hosts with a single volume count query."""
+        if not columnar.is_enabled():
+            return super(VolumeNumberWeigher, self).weigh_objects(
+                weighed_obj_list, weight_properties)
+
+        context = weight_properties['context']
+        hosts = [weighed_obj.obj.host for weighed_obj in weighed_obj_list]
+        counts = db.volume_count_get_for_hosts(context, hosts)
+        volume_numbers = columnar.numpy.array(
+            [counts.get(host, 0) for host in hosts], dtype=float)
+        weights = self._weight_multiplier() * volume_numbers
+        for weighed_obj, weight in zip(weighed_obj_list, weights.tolist()):
+            weighed_obj.weight += weight
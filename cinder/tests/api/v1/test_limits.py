@@ -18,6 +18,8 @@ Tests dealing with HTTP rate-limiting.
 """
 
 import httplib
+import mock
+import os
 import six
 from xml.dom import minidom
 
@@ -558,6 +560,51 @@ class LimiterTest(BaseLimitTestSuite):
         results = list(self._check(2, "PUT", "/anything", "user0"))
         self.assertEqual(expected, results)
 
+    def test_routes(self):
+        """Only the limits of the verb of a request are looked at."""
+        with mock.patch.object(limits.Limit, 'record',
+                               return_value=None) as record:
+            self.limiter.check_for_delay("GET", "/volumes")
+            self.assertFalse(record.called)
+
+            self.limiter.check_for_delay("POST", "/volumes")
+            self.assertEqual(2, record.call_count)
+
+    def test_forget_least_recently_seen_users(self):
+        """Users are forgotten when too many others are seen."""
+        userlimits = {'limits.user0': '(put, *, .*, 2, minute)'}
+        self.limiter = limits.Limiter(TEST_LIMITS, max_users=2,
+                                      **userlimits)
+        self.assertEqual(30, self._check_sum(3, "PUT", "/anything", "user0"))
+        self.assertEqual(6, self._check_sum(11, "PUT", "/anything", "user1"))
+        self.assertEqual(6, self._check_sum(11, "PUT", "/anything", "user2"))
+        self.assertEqual(6, self._check_sum(1, "PUT", "/anything", "user1"))
+        self.assertEqual(0, self._check_sum(1, "PUT", "/anything", "user3"))
+
+        self.assertNotIn("user2", self.limiter.levels)
+        self.assertEqual(6, self._check_sum(11, "PUT", "/anything", "user2"))
+        # Users with their own limits are kept.
+        self.assertEqual(30, self._check_sum(1, "PUT", "/anything", "user0"))
+
+    def test_shared_levels(self):
+        """Workers forked from the limiter share its levels."""
+        self.limiter = limits.Limiter(TEST_LIMITS, shared_slots=64)
+
+        pid = os.fork()
+        if not pid:
+            try:
+                list(self._check(10, "PUT", "/anything"))
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        expected = [6.0]
+        results = list(self._check(1, "PUT", "/anything"))
+        self.assertEqual(expected, results)
+        expected = [None] * 5 + [12.0]
+        results = list(self._check(6, "PUT", "/volumes", "user1"))
+        self.assertEqual(expected, results)
+
 
 class WsgiLimiterTest(BaseLimitTestSuite):
     """Tests for `limits.WsgiLimiter` class."""
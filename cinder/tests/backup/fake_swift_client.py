@@ -16,9 +16,12 @@
 import httplib
 import json
 import os
+import random
 import socket
 import zlib
 
+import eventlet
+
 from cinder.openstack.common import log as logging
 from swiftclient import client as swift
 
@@ -85,10 +88,14 @@ class FakeSwiftConnection(object):
             metadata['backup_name'] = 'fake backup'
             metadata['backup_description'] = 'fake backup description'
             metadata['created_at'] = '2013-02-19 11:20:54,805'
+            if container == 'untrusted_compression':
+                compression = 'os.system'
+            else:
+                compression = 'zlib'
             metadata['objects'] = [{
-                'backup_001': {'compression': 'zlib', 'length': 10},
-                'backup_002': {'compression': 'zlib', 'length': 10},
-                'backup_003': {'compression': 'zlib', 'length': 10}
+                'backup_001': {'compression': compression, 'length': 10},
+                'backup_002': {'compression': compression, 'length': 10},
+                'backup_003': {'compression': compression, 'length': 10}
             }]
             metadata_json = json.dumps(metadata, sort_keys=True, indent=2)
             fake_object_body = metadata_json
@@ -111,3 +118,45 @@ class FakeSwiftConnection(object):
         if container == 'socket_error_on_delete':
             raise socket.error(111, 'ECONNREFUSED')
         pass
+
+
+class FakeSwiftStoreConnection(object):
+    """Keeps the objects in memory, shared by all connections.
+
+    Each request yields for a random short time so that parallel requests
+    complete out of order.
+    """
+    objects = {}
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    @classmethod
+    def Connection(cls, *args, **kwargs):
+        return cls()
+
+    def _delay(self):
+        eventlet.sleep(random.random() / 100)
+
+    def put_container(self, container):
+        pass
+
+    def get_container(self, container, prefix=None, full_listing=False):
+        names = sorted(name for (cont, name) in self.objects
+                       if cont == container and
+                       (prefix is None or name.startswith(prefix)))
+        return None, [{'name': name} for name in names]
+
+    def put_object(self, container, name, reader, content_length=None,
+                   etag=None, chunk_size=None, content_type=None,
+                   headers=None, query_string=None):
+        self._delay()
+        self.objects[(container, name)] = reader.read()
+        return 'fake-md5-sum'
+
+    def get_object(self, container, name):
+        self._delay()
+        return None, self.objects[(container, name)]
+
+    def delete_object(self, container, name):
+        del self.objects[(container, name)]
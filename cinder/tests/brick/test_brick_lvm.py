@@ -89,8 +89,8 @@ class BrickLvmTestCase(test.TestCase):
                     "mXzbuX-dKpG-Rz7E-xtKY-jeju-QsYU-SLG8Z3\n"
         elif ('env, LC_ALL=C, lvs, --noheadings, '
               '--unit=g, -o, vg_name,name,size' in cmd_string):
-            data = "  fake-vg fake-1 1.00g\n"
-            data += "  fake-vg fake-2 1.00g\n"
+            data = "  fake-vg:fake-1:1.00g\n"
+            data += "  fake-vg:fake-2:1.00g\n"
         elif ('env, LC_ALL=C, lvdisplay, --noheading, -C, -o, Attr' in
               cmd_string):
             if 'test-volumes' in cmd_string:
@@ -226,6 +226,108 @@ class BrickLvmTestCase(test.TestCase):
                          self.vg._get_thin_pool_free_space("fake-vg",
                                                            "fake-vg-pool"))
 
+    def test_update_volume_group_info_thin_pool(self):
+        self.vg.vg_thin_pool = 'fake-vg-pool'
+        self.vg.update_volume_group_info()
+        self.assertEqual(10.0, self.vg.vg_size)
+        self.assertEqual(9.0, self.vg.vg_thin_pool_size)
+        self.assertEqual(7.92, self.vg.vg_thin_pool_free_space)
+
+    def test_lv_inventory(self):
+        volumes = {'fake-1': '1.00', 'fake-2': '1.00'}
+        lvs = []
+
+        def fake_execute(*cmd, **kwargs):
+            if 'lv_count' in ''.join(cmd):
+                return ('  fake-vg:10.00:10.00:%d:fake-uuid\n' % len(volumes),
+                        '')
+            elif 'lvs' not in cmd:
+                return self.fake_execute(*cmd, **kwargs)
+            lvs.append(cmd[-1])
+            names = sorted(volumes)
+            if '/' in cmd[-1]:
+                names = [n for n in names if cmd[-1] == 'fake-vg/' + n]
+                if not names:
+                    raise processutils.ProcessExecutionError(exit_code=5)
+            return (''.join('  fake-vg:%s:%s\n' % (name, volumes[name])
+                            for name in names), '')
+
+        self.stubs.Set(processutils, 'execute', fake_execute)
+        self.vg.set_execute(lambda *cmd, **kwargs: ('', ''))
+
+        # Lookups are answered from the inventory, loaded with one lvs.
+        self.assertEqual('fake-1', self.vg.get_volume('fake-1')['name'])
+        self.assertEqual('fake-2', self.vg.get_volume('fake-2')['name'])
+        self.assertEqual(['fake-vg'], lvs)
+
+        # LVs changed by the object are read again, one at a time.
+        volumes['fake-1'] = '2.00'
+        self.vg.extend_volume('fake-1', '2g')
+        self.assertEqual('2.00', self.vg.get_volume('fake-1')['size'])
+        self.assertEqual('2.00', self.vg.get_volume('fake-1')['size'])
+        del volumes['fake-2']
+        self.vg.delete('fake-2')
+        self.assertIsNone(self.vg.get_volume('fake-2'))
+        volumes['fake-3'] = volumes.pop('fake-1')
+        self.vg.rename_volume('fake-1', 'fake-3')
+        self.assertEqual('fake-3', self.vg.get_volume('fake-3')['name'])
+        self.assertEqual(['fake-vg', 'fake-vg/fake-1', 'fake-vg/fake-2',
+                          'fake-vg/fake-3'], lvs)
+
+        # The inventory is only reloaded if the VG's LV count changed.
+        self.vg.update_volume_group_info()
+        self.assertEqual(4, len(lvs))
+        volumes['fake-4'] = '1.00'
+        self.vg.update_volume_group_info()
+        self.assertEqual('fake-4', self.vg.get_volume('fake-4')['name'])
+        self.assertEqual(5, len(lvs))
+        self.assertEqual('fake-vg', lvs[-1])
+
+    def _fake_vg_execute(self, volumes, lvs):
+        def fake_execute(*cmd, **kwargs):
+            if 'lv_count' in ''.join(cmd):
+                free = 10 - sum(float(size) for size in volumes.values())
+                return ('  fake-vg:10.00:%.2f:%d:fake-uuid\n' %
+                        (free, len(volumes)), '')
+            elif 'lvs' not in cmd:
+                return self.fake_execute(*cmd, **kwargs)
+            lvs.append(cmd[-1])
+            return (''.join('  fake-vg:%s:%s\n' % (name, volumes[name])
+                            for name in sorted(volumes)), '')
+
+        self.stubs.Set(processutils, 'execute', fake_execute)
+        self.vg.set_execute(lambda *cmd, **kwargs: ('', ''))
+
+    def test_lv_inventory_out_of_band_resize(self):
+        volumes = {'fake-1': '1.00', 'fake-2': '1.00'}
+        lvs = []
+        self._fake_vg_execute(volumes, lvs)
+        self.assertEqual('1.00', self.vg.get_volume('fake-1')['size'])
+        self.vg.update_volume_group_info()
+        self.vg.update_volume_group_info()
+        self.assertEqual(1, len(lvs))
+
+        volumes['fake-1'] = '2.00'
+        self.vg.update_volume_group_info()
+        self.assertEqual(2, len(lvs))
+        self.assertEqual('2.00', self.vg.get_volume('fake-1')['size'])
+
+    def test_lv_inventory_periodic_reload(self):
+        volumes = {'fake-1': '1.00', 'fake-2': '1.00'}
+        lvs = []
+        self._fake_vg_execute(volumes, lvs)
+        self.assertEqual('fake-1', self.vg.get_volume('fake-1')['name'])
+
+        # A rename changes neither the LV count nor the free space.
+        volumes['fake-3'] = volumes.pop('fake-1')
+        for i in range(self.vg.RELOAD_REFRESHES - 1):
+            self.vg.update_volume_group_info()
+        self.assertEqual(1, len(lvs))
+        self.vg.update_volume_group_info()
+        self.assertEqual(2, len(lvs))
+        self.assertIsNone(self.vg.get_volume('fake-1'))
+        self.assertEqual('fake-3', self.vg.get_volume('fake-3')['name'])
+
     def test_volume_create_after_thin_creation(self):
         """Test self.vg.vg_thin_pool is set to pool_name
 
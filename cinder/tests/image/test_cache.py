@@ -0,0 +1,165 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the image cache."""
+
+import os
+import shutil
+import tempfile
+
+import eventlet
+import mock
+
+from cinder import exception
+from cinder.image import cache
+from cinder.openstack.common import units
+from cinder import test
+
+
+IMAGE_SIZE = 64 * units.Ki
+
+
+class ImageCacheTestCase(test.TestCase):
+
+    def setUp(self):
+        super(ImageCacheTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.cache = cache.ImageCache(self.tmpdir, 2 * IMAGE_SIZE)
+        self.image_service = mock.Mock()
+        self.image_service.show.side_effect = lambda ctxt, image_id: {
+            'id': image_id, 'checksum': 'sum-%s' % image_id}
+
+        patcher = mock.patch('cinder.image.image_utils.fetch_to_raw',
+                             side_effect=self._fake_fetch_to_raw)
+        self.fetch_to_raw = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('cinder.volume.utils.copy_volume')
+        self.copy_volume = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _fake_fetch_to_raw(self, context, image_service, image_id, dest,
+                           blocksize, user_id=None, project_id=None,
+                           size=None):
+        eventlet.sleep(0)
+        if size is not None and IMAGE_SIZE > size * units.Gi:
+            raise exception.ImageUnacceptable(image_id=image_id,
+                                              reason='fake')
+        with open(dest, 'wb') as f:
+            f.write('x' * IMAGE_SIZE)
+
+    def _fetch(self, image_id, size=None):
+        self.cache.fetch_to_raw('ctxt', self.image_service, image_id,
+                                '/dev/fake', '1M', size=size)
+
+    def _cached(self):
+        return sorted(os.listdir(self.tmpdir))
+
+    def test_fetch_to_raw(self):
+        self._fetch('image1')
+        self._fetch('image1')
+
+        self.assertEqual(1, self.fetch_to_raw.call_count)
+        path = os.path.join(self.tmpdir, 'image1-sum-image1')
+        self.assertEqual(2 * [mock.call(path, '/dev/fake', 1, '1M')],
+                         self.copy_volume.call_args_list)
+        self.assertEqual(['image1-sum-image1'], self._cached())
+        stats = self.cache.get_stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['images'])
+
+    def test_fetch_to_raw_changed_image(self):
+        self._fetch('image1')
+        self.image_service.show.side_effect = None
+        self.image_service.show.return_value = {'id': 'image1',
+                                                'checksum': 'new'}
+        self._fetch('image1')
+
+        self.assertEqual(2, self.fetch_to_raw.call_count)
+        self.assertEqual(['image1-new', 'image1-sum-image1'], self._cached())
+
+    def test_fetch_to_raw_no_checksum(self):
+        self.image_service.show.side_effect = None
+        self.image_service.show.return_value = {'id': 'image1'}
+        self._fetch('image1', size=1)
+
+        self.fetch_to_raw.assert_called_once_with(
+            'ctxt', self.image_service, 'image1', '/dev/fake', '1M', None,
+            None, 1)
+        self.assertEqual([], self._cached())
+
+    def test_fetch_to_raw_too_large(self):
+        self.assertRaises(exception.ImageUnacceptable, self._fetch,
+                          'image1', size=0)
+        # The image is rejected by the fetch, before it fills the cache.
+        self.fetch_to_raw.assert_called_once_with(
+            'ctxt', self.image_service, 'image1',
+            os.path.join(self.tmpdir, 'image1-sum-image1.part'), '1M', None,
+            None, 0)
+        self.assertFalse(self.copy_volume.called)
+        self.assertEqual([], self._cached())
+
+    def test_fetch_to_raw_cached_too_large(self):
+        self._fetch('image1', size=1)
+        self.assertRaises(exception.ImageUnacceptable, self._fetch,
+                          'image1', size=0)
+        self.assertEqual(1, self.fetch_to_raw.call_count)
+        self.assertEqual(1, self.copy_volume.call_count)
+        # The image is still cached for larger volumes.
+        self.assertEqual(['image1-sum-image1'], self._cached())
+
+    def test_evict_least_recently_used(self):
+        self._fetch('image1')
+        self._fetch('image2')
+        self._fetch('image1')
+        self._fetch('image3')
+
+        self.assertEqual(['image1-sum-image1', 'image3-sum-image3'],
+                         self._cached())
+        self.assertEqual(1, self.cache.get_stats()['evictions'])
+
+    def test_fetch_to_raw_coalesced(self):
+        threads = [eventlet.spawn(self._fetch, 'image1') for i in range(3)]
+        for thread in threads:
+            thread.wait()
+
+        self.assertEqual(1, self.fetch_to_raw.call_count)
+        self.assertEqual(3, self.copy_volume.call_count)
+        stats = self.cache.get_stats()
+        self.assertEqual(2, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+
+    def test_fetch_to_raw_error(self):
+        self.fetch_to_raw.side_effect = exception.ImageUnacceptable(
+            image_id='image1', reason='fake')
+        self.assertRaises(exception.ImageUnacceptable, self._fetch, 'image1')
+        self.assertEqual([], self._cached())
+
+        self.fetch_to_raw.side_effect = self._fake_fetch_to_raw
+        self._fetch('image1')
+        self.assertEqual(['image1-sum-image1'], self._cached())
+
+    def test_load(self):
+        for name in ('image1-sum', 'image2-sum', 'image3-sum.part'):
+            with open(os.path.join(self.tmpdir, name), 'wb') as f:
+                f.write('x' * IMAGE_SIZE)
+        os.utime(os.path.join(self.tmpdir, 'image1-sum'), (0, 0))
+        self.cache.max_size = IMAGE_SIZE
+
+        self.cache._load()
+
+        # Fetches that did not finish and images over the size are removed.
+        self.assertEqual(['image2-sum'], self._cached())
+        self.assertEqual(IMAGE_SIZE, self.cache.size)
@@ -15,14 +15,21 @@
 
 
 import datetime
+import hashlib
+import os
+import tempfile
 
+import eventlet
+from eventlet import wsgi
 import glanceclient.exc
 from glanceclient.v2 import client as glance_client_v2
+import mock
 from oslo.config import cfg
 
 from cinder import context
 from cinder import exception
 from cinder.image import glance
+from cinder.openstack.common import units
 from cinder import test
 from cinder.tests.glance import stubs as glance_stubs
 
@@ -586,6 +593,132 @@ class TestGlanceImageService(test.TestCase):
         self.assertEqual(actual, expected)
 
 
+class TestRangedDownload(test.TestCase):
+    """Downloads images in ranges from a local HTTP server."""
+
+    def setUp(self):
+        super(TestRangedDownload, self).setUp()
+        self.data = os.urandom(3 * units.Mi + 100)
+        self.ranges = []
+        self.serve_ranges = True
+        self.short_ranges = 0
+
+        sock = eventlet.listen(('127.0.0.1', 0))
+        server = eventlet.spawn(wsgi.server, sock, self._app,
+                                log_output=False)
+        self.addCleanup(server.kill)
+        self.flags(glance_api_servers=['127.0.0.1:%d' %
+                                       sock.getsockname()[1]],
+                   glance_api_version=1,
+                   auth_strategy='keystone',
+                   glance_download_workers=3,
+                   glance_download_range_size=1)
+
+        self.client = mock.Mock()
+        self.client.call.return_value = [self.data]
+        self.service = glance.GlanceImageService(client=self.client)
+        self.image_meta = {'size': len(self.data),
+                           'checksum': hashlib.md5(self.data).hexdigest()}
+        self.stubs.Set(self.service, 'show',
+                       lambda context, image_id: self.image_meta)
+        self.context = context.RequestContext('fake', 'fake',
+                                              auth_token='token')
+
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, self.path)
+
+    def _app(self, environ, start_response):
+        self.assertEqual('/v1/images/image_id', environ['PATH_INFO'])
+        self.assertEqual('token', environ['HTTP_X_AUTH_TOKEN'])
+        byte_range = environ.get('HTTP_RANGE')
+        if not (byte_range and self.serve_ranges):
+            start_response('200 OK', [('Content-Length',
+                                       str(len(self.data)))])
+            return [self.data]
+
+        start, end = map(int, byte_range[len('bytes='):].split('-'))
+        self.ranges.append((start, end))
+        body = self.data[start:end + 1]
+        if start and self.short_ranges:
+            self.short_ranges -= 1
+            body = body[:100]
+        start_response('206 Partial Content',
+                       [('Content-Length', str(len(body))),
+                        ('Content-Range', 'bytes %d-%d/%d' %
+                         (start, start + len(body) - 1, len(self.data)))])
+        return [body]
+
+    def _download(self):
+        """Returns the MD5 of the data downloaded."""
+        with open(self.path, 'wb') as f:
+            self.service.download(self.context, 'image_id', f)
+        with open(self.path, 'rb') as f:
+            return hashlib.md5(f.read()).hexdigest()
+
+    def test_download(self):
+        self.assertEqual(self.image_meta['checksum'], self._download())
+        self.assertEqual([(0, units.Mi - 1), (units.Mi, 2 * units.Mi - 1),
+                          (2 * units.Mi, 3 * units.Mi - 1),
+                          (3 * units.Mi, 3 * units.Mi + 99)],
+                         sorted(self.ranges))
+        self.assertFalse(self.client.call.called)
+
+    def test_download_ranges_not_served(self):
+        self.serve_ranges = False
+
+        self.assertEqual(self.image_meta['checksum'], self._download())
+        self.client.call.assert_called_once_with(self.context, 'data',
+                                                 'image_id')
+
+    def test_download_small_image(self):
+        self.data = self.data[:units.Mi]
+        self.image_meta = {'size': units.Mi,
+                           'checksum': hashlib.md5(self.data).hexdigest()}
+        self.client.call.return_value = [self.data]
+
+        self.assertEqual(self.image_meta['checksum'], self._download())
+        self.assertEqual([], self.ranges)
+
+    def test_download_bad_checksum(self):
+        self.image_meta['checksum'] = 'bad'
+        self.assertRaises(exception.ImageUnacceptable, self._download)
+
+    def test_download_short_range(self):
+        self.short_ranges = 1
+
+        # The range cut short is retried.
+        self.flags(glance_num_retries=1)
+        self.assertEqual(self.image_meta['checksum'], self._download())
+        self.assertEqual(5, len(self.ranges))
+
+        self.short_ranges = 1
+        self.flags(glance_num_retries=0)
+        self.assertRaises(IOError, self._download)
+
+    def test_download_range_bad_status(self):
+        response = mock.Mock(status_code=200)
+        download = glance.RangedDownload(self.context, 'image_id',
+                                         len(self.data), None)
+        self.stubs.Set(download, '_get', lambda start, end: response)
+
+        self.assertRaises(IOError, download._fetch, 0, units.Mi - 1)
+        response.close.assert_called_once_with()
+
+    def test_download_direct_url_first(self):
+        source = self.path + '.source'
+        with open(source, 'wb') as f:
+            f.write(self.data)
+        self.addCleanup(os.unlink, source)
+        self.flags(allowed_direct_url_schemes=['file'])
+        self.stubs.Set(self.service, 'get_location',
+                       lambda context, image_id: 'file://' + source)
+
+        self.assertEqual(self.image_meta['checksum'], self._download())
+        self.assertEqual([], self.ranges)
+        self.assertFalse(self.client.call.called)
+
+
 class TestGlanceClientVersion(test.TestCase):
     """Tests the version of the glance client generated."""
     def setUp(self):
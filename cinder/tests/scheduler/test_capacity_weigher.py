@@ -17,11 +17,13 @@ Tests For Capacity Weigher.
 """
 
 import mock
+import testtools
 
 from oslo.config import cfg
 
 from cinder import context
 from cinder.openstack.common.scheduler.weights import HostWeightHandler
+from cinder.scheduler import columnar
 from cinder.scheduler.weights.capacity import CapacityWeigher
 from cinder import test
 from cinder.tests.scheduler import fakes
@@ -92,3 +94,10 @@ class CapacityWeigherTestCase(test.TestCase):
         weighed_host = self._get_weighed_host(hostinfo_list)
         self.assertEqual(weighed_host.weight, 921.0 * 2)
         self.assertEqual(weighed_host.obj.host, 'host1')
+
+
+@testtools.skipIf(columnar.numpy is None, 'NumPy is not installed')
+class ColumnarCapacityWeigherTestCase(CapacityWeigherTestCase):
+    def setUp(self):
+        super(ColumnarCapacityWeigherTestCase, self).setUp()
+        self.flags(scheduler_columnar_evaluation=True)
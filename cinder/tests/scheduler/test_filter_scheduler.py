@@ -69,6 +69,78 @@ class FilterSchedulerTestCase(test_scheduler.SchedulerTestCase):
                           fake_context, request_spec, {})
         self.assertTrue(self.was_admin)
 
+    @mock.patch('cinder.scheduler.driver.volume_update_db')
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_schedule_create_volumes(self, _mock_service_get_all_by_topic,
+                                     _mock_volume_update_db):
+        # Volumes of a batch virtually consume capacity one after another,
+        # so hosts drop out once they can't fit another volume.
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.volume_rpcapi = mock.Mock()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        fakes.mock_host_manager_db_calls(_mock_service_get_all_by_topic)
+        _mock_volume_update_db.side_effect = (
+            lambda ctxt, volume_id, host: {'id': volume_id, 'host': host})
+
+        request_spec = {'volume_type': {'name': 'LVM_iSCSI'},
+                        'volume_properties': {'project_id': 1,
+                                              'size': 400},
+                        'snapshot_id': None,
+                        'image_id': None}
+        unplaced = sched.schedule_create_volumes(fake_context, request_spec,
+                                                 ['vol1', 'vol2', 'vol3'],
+                                                 {})
+
+        self.assertEqual(['vol3'], unplaced)
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual([mock.call(fake_context, 'vol1', 'host1'),
+                          mock.call(fake_context, 'vol2', 'host1')],
+                         _mock_volume_update_db.call_args_list)
+        create_calls = sched.volume_rpcapi.create_volume.call_args_list
+        self.assertEqual(2, len(create_calls))
+        for call, volume_id in zip(create_calls, ['vol1', 'vol2']):
+            self.assertEqual(volume_id, call[0][3]['volume_id'])
+            self.assertNotIn('context', call[0][4])
+        host1 = sched.host_manager.host_state_map['host1']
+        self.assertEqual(224, host1.free_capacity_gb)
+
+    @mock.patch('cinder.scheduler.driver.volume_update_db')
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    def test_schedule_create_volumes_spread(self,
+                                            _mock_service_get_all_by_topic,
+                                            _mock_volume_update_db):
+        sched = fakes.FakeFilterScheduler()
+        sched.host_manager = fakes.FakeHostManager()
+        sched.volume_rpcapi = mock.Mock()
+        fake_context = context.RequestContext('user', 'project',
+                                              is_admin=True)
+
+        fakes.mock_host_manager_db_calls(_mock_service_get_all_by_topic)
+        _mock_volume_update_db.side_effect = (
+            lambda ctxt, volume_id, host: {'id': volume_id, 'host': host})
+
+        request_spec = {'volume_type': {'name': 'LVM_iSCSI'},
+                        'volume_properties': {'project_id': 1,
+                                              'size': 100},
+                        'snapshot_id': None,
+                        'image_id': None}
+        filter_properties = {}
+        unplaced = sched.schedule_create_volumes(fake_context, request_spec,
+                                                 ['vol%d' % i
+                                                  for i in xrange(9)],
+                                                 filter_properties)
+
+        self.assertEqual([], unplaced)
+        hosts = [call[0][2] for call in
+                 _mock_volume_update_db.call_args_list]
+        self.assertEqual(['host1'] * 8 + ['host2'], hosts)
+        retries = [call[0][4]['retry']['hosts'] for call in
+                   sched.volume_rpcapi.create_volume.call_args_list]
+        self.assertEqual([[host] for host in hosts], retries)
+
     @mock.patch('cinder.db.service_get_all_by_topic')
     def test_schedule_happy_day(self, _mock_service_get_all_by_topic):
         # Make sure there's nothing glaringly wrong with _schedule()
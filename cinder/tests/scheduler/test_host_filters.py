@@ -16,11 +16,13 @@ Tests For Scheduler Host Filters.
 """
 
 import mock
+import testtools
 
 from cinder import context
 from cinder import db
 from cinder.openstack.common import jsonutils
 from cinder.openstack.common.scheduler import filters
+from cinder.scheduler import columnar
 from cinder import test
 from cinder.tests.scheduler import fakes
 from cinder.tests import utils
@@ -93,6 +95,30 @@ class HostFiltersTestCase(test.TestCase):
                                     'service': service})
         self.assertTrue(filt_cls.host_passes(host, filter_properties))
 
+    @testtools.skipIf(columnar.numpy is None, 'NumPy is not installed')
+    def test_capacity_filter_columnar(self):
+        self.flags(scheduler_columnar_evaluation=True)
+        filt_cls = self.class_map['CapacityFilter']()
+        filter_properties = {'size': 100, 'vol_exists_on': 'host6'}
+        hosts = [fakes.FakeHostState('host1', {'free_capacity_gb': 200}),
+                 fakes.FakeHostState('host2', {'free_capacity_gb': 120,
+                                               'reserved_percentage': 20}),
+                 fakes.FakeHostState('host3',
+                                     {'free_capacity_gb': 'infinite',
+                                      'reserved_percentage': 100}),
+                 fakes.FakeHostState('host4',
+                                     {'free_capacity_gb': 'unknown'}),
+                 fakes.FakeHostState('host5', {}),
+                 fakes.FakeHostState('host6', {'free_capacity_gb': 10})]
+
+        passed = list(filt_cls.filter_all(iter(hosts), filter_properties))
+        self.assertEqual(['host1', 'host3', 'host4', 'host6'],
+                         [host.host for host in passed])
+
+        self.flags(scheduler_columnar_evaluation=False)
+        expected = list(filt_cls.filter_all(iter(hosts), filter_properties))
+        self.assertEqual(expected, passed)
+
     @mock.patch('cinder.utils.service_is_up')
     def test_affinity_different_filter_passes(self, _mock_serv_is_up):
         _mock_serv_is_up.return_value = True
@@ -16,13 +16,17 @@
 Tests For HostManager
 """
 
+import datetime
+
 import mock
+import testtools
 
 from oslo.config import cfg
 
 from cinder import exception
 from cinder.openstack.common.scheduler import filters
 from cinder.openstack.common import timeutils
+from cinder.scheduler import columnar
 from cinder.scheduler import host_manager
 from cinder import test
 
@@ -121,6 +125,7 @@ class HostManagerTestCase(test.TestCase):
     @mock.patch('cinder.utils.service_is_up')
     def test_get_all_host_states(self, _mock_service_is_up,
                                  _mock_service_get_all_by_topic):
+        self.flags(scheduler_host_state_refresh_interval=0)
         context = 'fake_context'
         topic = CONF.volume_topic
 
@@ -189,6 +194,169 @@ class HostManagerTestCase(test.TestCase):
             self.assertEqual(host_state_map[host].service,
                              volume_node)
 
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    @mock.patch('cinder.utils.service_is_up')
+    def test_get_all_host_states_cached(self, _mock_service_is_up,
+                                        _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        services = [
+            dict(id=1, host='host1', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=timeutils.utcnow()),
+            dict(id=2, host='host2', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=timeutils.utcnow()),
+        ]
+        _mock_service_get_all_by_topic.return_value = services
+        _mock_service_is_up.return_value = True
+        self.host_manager.update_service_capabilities(
+            'volume', 'host1', dict(free_capacity_gb=10,
+                                    total_capacity_gb=20,
+                                    reserved_percentage=0))
+
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        host1 = self.host_manager.host_state_map['host1']
+        self.assertEqual(10, host1.free_capacity_gb)
+
+        # Nothing changed, so neither the database nor the host states
+        # are touched.
+        host1.consume_from_volume({'size': 1})
+        with mock.patch.object(host1,
+                               'update_from_volume_capability') as _update:
+            self.host_manager.get_all_host_states(context)
+            self.assertFalse(_update.called)
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(9, host1.free_capacity_gb)
+
+        # A new report from a known host is applied without a db call.
+        self.host_manager.update_service_capabilities(
+            'volume', 'host1', dict(free_capacity_gb=5,
+                                    total_capacity_gb=20,
+                                    reserved_percentage=0))
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(5, host1.free_capacity_gb)
+
+        # A report from an unknown host refreshes the service list.
+        services.append(
+            dict(id=3, host='host3', topic='volume', disabled=False,
+                 availability_zone='zone2', updated_at=timeutils.utcnow()))
+        self.host_manager.update_service_capabilities(
+            'volume', 'host3', dict(free_capacity_gb=30,
+                                    total_capacity_gb=30,
+                                    reserved_percentage=0))
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(3, len(self.host_manager.host_state_map))
+        self.assertEqual(
+            30, self.host_manager.host_state_map['host3'].free_capacity_gb)
+
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    @mock.patch('cinder.utils.service_is_up')
+    def test_get_all_host_states_cached_disabled_host(
+            self, _mock_service_is_up, _mock_service_get_all_by_topic):
+        context = 'fake_context'
+        # host2 is disabled, so it is not among the services read.
+        services = [
+            dict(id=1, host='host1', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=timeutils.utcnow()),
+        ]
+        _mock_service_get_all_by_topic.return_value = services
+        _mock_service_is_up.return_value = True
+        capabilities = dict(free_capacity_gb=10, total_capacity_gb=20,
+                            reserved_percentage=0)
+        for host in ('host1', 'host2'):
+            self.host_manager.update_service_capabilities('volume', host,
+                                                          capabilities)
+        self.host_manager.get_all_host_states(context)
+
+        # The disabled host keeps reporting, which does not make the
+        # service list be read again.
+        for i in range(2):
+            self.host_manager.update_service_capabilities('volume', 'host2',
+                                                          capabilities)
+            self.host_manager.get_all_host_states(context)
+
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(['host1'], self.host_manager.host_state_map.keys())
+
+    @mock.patch('cinder.openstack.common.timeutils.utcnow')
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    @mock.patch('cinder.utils.service_is_up')
+    def test_get_all_host_states_cache_expired(self, _mock_service_is_up,
+                                               _mock_service_get_all_by_topic,
+                                               _mock_utcnow):
+        self.flags(scheduler_host_state_refresh_interval=10)
+        context = 'fake_context'
+        now = datetime.datetime(2014, 1, 1, 0, 0, 0)
+        services = [
+            dict(id=1, host='host1', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=now),
+            dict(id=2, host='host2', topic='volume', disabled=False,
+                 availability_zone='zone1', updated_at=now),
+        ]
+        _mock_service_get_all_by_topic.return_value = services
+        _mock_service_is_up.return_value = True
+        _mock_utcnow.return_value = now
+
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(2, len(self.host_manager.host_state_map))
+
+        _mock_utcnow.return_value = now + datetime.timedelta(seconds=5)
+        _mock_service_is_up.return_value = False
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(1, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual(2, len(self.host_manager.host_state_map))
+
+        # Once the cached list expires, down services are dropped.
+        _mock_utcnow.return_value = now + datetime.timedelta(seconds=11)
+        self.host_manager.get_all_host_states(context)
+        self.assertEqual(2, _mock_service_get_all_by_topic.call_count)
+        self.assertEqual({}, self.host_manager.host_state_map)
+
+    @testtools.skipIf(columnar.numpy is None, 'NumPy is not installed')
+    @mock.patch('cinder.db.service_get_all_by_topic')
+    @mock.patch('cinder.utils.service_is_up')
+    def test_get_all_host_states_columnar(self, _mock_service_is_up,
+                                          _mock_service_get_all_by_topic):
+        self.flags(scheduler_columnar_evaluation=True,
+                   scheduler_host_state_refresh_interval=0)
+        hm = host_manager.HostManager()
+        services = [dict(id=i, host='host%d' % i, topic='volume',
+                         disabled=False, availability_zone='zone1',
+                         updated_at=timeutils.utcnow())
+                    for i in xrange(100)]
+        _mock_service_get_all_by_topic.return_value = services
+        _mock_service_is_up.return_value = True
+        for service in services:
+            hm.update_service_capabilities(
+                'volume', service['host'],
+                dict(free_capacity_gb=service['id'],
+                     total_capacity_gb='infinite',
+                     reserved_percentage=10))
+
+        host_states = sorted(hm.get_all_host_states('fake_context'),
+                             key=lambda state: state.free_capacity_gb)
+        view = columnar.CapacityView(host_states)
+        self.assertEqual([host_state.free_capacity_gb
+                          for host_state in host_states],
+                         view.free_capacity_gb.tolist())
+        self.assertEqual([0.0] * 100, view.total_capacity_gb.tolist())
+
+        # Consumption is reflected in the columns right away.
+        host_states[0].consume_from_volume({'size': 1})
+        view = columnar.CapacityView(host_states[:1])
+        self.assertEqual([host_states[0].free_capacity_gb],
+                         view.free_capacity_gb.tolist())
+
+        # Removed hosts give their rows back.
+        del services[50:]
+        hm.get_all_host_states('fake_context')
+        for host_state in host_states[50:]:
+            self.assertIsNone(host_state.capacity_columns)
+        self.assertIsNone(hm._capacity_columns.rows(host_states))
+        self.assertEqual(50, len(set(
+            hm._capacity_columns.rows(host_states[:50]).tolist())))
+
 
 class HostStateTestCase(test.TestCase):
     """Test case for HostState class."""
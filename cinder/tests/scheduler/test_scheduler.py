@@ -102,6 +102,40 @@ class SchedulerManagerTestCase(test.TestCase):
         _mock_sched_create.assert_called_once_with(self.context, request_spec,
                                                    {})
 
+    @mock.patch('cinder.scheduler.driver.Scheduler.schedule_create_volumes')
+    @mock.patch('cinder.db.volume_update')
+    def test_create_volumes_unplaced_volumes_in_error_state(
+            self, _mock_volume_update, _mock_sched_create):
+        # Volumes the driver could not place are put in 'error' state,
+        # the others are left alone.
+        _mock_sched_create.return_value = [2, 3]
+        topic = 'fake_topic'
+        request_spec = {'volume_properties': {'size': 1}}
+
+        self.manager.create_volumes(self.context, topic, [1, 2, 3],
+                                    request_spec=request_spec,
+                                    filter_properties={})
+        _mock_sched_create.assert_called_once_with(self.context, request_spec,
+                                                   [1, 2, 3], {})
+        self.assertEqual([mock.call(self.context, 2, {'status': 'error'}),
+                          mock.call(self.context, 3, {'status': 'error'})],
+                         _mock_volume_update.call_args_list)
+
+    @mock.patch('cinder.scheduler.driver.Scheduler.schedule_create_volumes')
+    @mock.patch('cinder.db.volume_update')
+    def test_create_volumes_exception_puts_volumes_in_error_state(
+            self, _mock_volume_update, _mock_sched_create):
+        _mock_sched_create.side_effect = exception.NoValidHost(reason="")
+        topic = 'fake_topic'
+        request_spec = {'volume_properties': {'size': 1}}
+
+        self.manager.create_volumes(self.context, topic, [1, 2],
+                                    request_spec=request_spec,
+                                    filter_properties={})
+        self.assertEqual([mock.call(self.context, 1, {'status': 'error'}),
+                          mock.call(self.context, 2, {'status': 'error'})],
+                         _mock_volume_update.call_args_list)
+
     @mock.patch('cinder.scheduler.driver.Scheduler.host_passes_filters')
     @mock.patch('cinder.db.volume_update')
     def test_migrate_volume_exception_returns_volume_state(
@@ -17,12 +17,14 @@ Tests For Volume Number Weigher.
 """
 
 import mock
+import testtools
 
 from oslo.config import cfg
 
 from cinder import context
 from cinder.db.sqlalchemy import api
 from cinder.openstack.common.scheduler.weights import HostWeightHandler
+from cinder.scheduler import columnar
 from cinder.scheduler.weights.volume_number import VolumeNumberWeigher
 from cinder import test
 from cinder.tests.scheduler import fakes
@@ -30,7 +32,8 @@ from cinder.tests.scheduler import fakes
 CONF = cfg.CONF
 
 
-def fake_volume_data_get_for_host(context, host, count_only=False):
+def fake_volume_data_get_for_host(context, host, count_only=False,
+                                  statuses=None):
     if host == 'host1':
         return 1
     elif host == 'host2':
@@ -96,3 +99,18 @@ class VolumeNumberWeigherTestCase(test.TestCase):
             weighed_host = self._get_weighed_host(hostinfo_list)
             self.assertEqual(weighed_host.weight, 4.0)
             self.assertEqual(weighed_host.obj.host, 'host4')
+
+    @testtools.skipIf(columnar.numpy is None, 'NumPy is not installed')
+    def test_volume_number_weight_columnar(self):
+        self.flags(scheduler_columnar_evaluation=True,
+                   volume_number_multiplier=-1.0)
+        hostinfo_list = self._get_all_hosts()
+
+        counts = {'host1': 3, 'host2': 1, 'host4': 4}
+        with mock.patch.object(api, 'volume_count_get_for_hosts',
+                               return_value=counts) as _mock_count:
+            weighed_host = self._get_weighed_host(hostinfo_list)
+            self.assertEqual(1, _mock_count.call_count)
+            # host3 has no volumes at all
+            self.assertEqual(weighed_host.weight, 0.0)
+            self.assertEqual(weighed_host.obj.host, 'host3')
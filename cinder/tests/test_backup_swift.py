@@ -23,8 +23,12 @@ import os
 import tempfile
 import zlib
 
+import mock
+import six
 from swiftclient import client as swift
+import testtools
 
+from cinder.backup import compression
 from cinder.backup.drivers.swift import SwiftBackupDriver
 from cinder import context
 from cinder import db
@@ -32,6 +36,7 @@ from cinder import exception
 from cinder.openstack.common import log as logging
 from cinder import test
 from cinder.tests.backup.fake_swift_client import FakeSwiftClient
+from cinder.tests.backup.fake_swift_client import FakeSwiftStoreConnection
 
 
 LOG = logging.getLogger(__name__)
@@ -184,6 +189,205 @@ class BackupSwiftTestCase(test.TestCase):
                           service.backup,
                           backup, self.volume_file)
 
+    def _backup_and_restore_parallel(self, compression):
+        self._create_backup_db_entry()
+        self.flags(backup_compression_algorithm=compression,
+                   backup_swift_object_size=8 * 1024,
+                   backup_swift_concurrency=4)
+        self.stubs.Set(swift, 'Connection',
+                       FakeSwiftStoreConnection.Connection)
+        self.stubs.Set(FakeSwiftStoreConnection, 'objects', {})
+        # Compressible data.
+        self.volume_file.seek(0)
+        for i in xrange(0, 128):
+            self.volume_file.write(os.urandom(512) * 2)
+        self.volume_file.flush()
+
+        service = SwiftBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        backup = db.backup_get(self.ctxt, 123)
+        self.assertEqual(17, backup['object_count'])
+        metadata = service._read_metadata(backup)
+        offsets = [obj.values()[0]['offset'] for obj in metadata['objects']]
+        self.assertEqual(range(8 * 1024, 129 * 1024, 8 * 1024), offsets)
+        self.assertEqual(set([compression.lower()]),
+                         set(obj.values()[0]['compression']
+                             for obj in metadata['objects']))
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, '1234-5678-1234-8888', restored_file)
+            restored_file.seek(0)
+            self.volume_file.seek(0)
+            self.assertEqual(self.volume_file.read(), restored_file.read())
+
+    def test_backup_restore_parallel(self):
+        self._backup_and_restore_parallel('none')
+
+    def test_backup_restore_parallel_zlib(self):
+        self._backup_and_restore_parallel('zlib')
+
+    @testtools.skipIf(compression.lz4_frame is None, 'lz4 is not installed')
+    def test_backup_restore_parallel_lz4(self):
+        self._backup_and_restore_parallel('LZ4')
+
+    @testtools.skipIf(compression.zstandard is None,
+                      'zstandard is not installed')
+    def test_backup_restore_parallel_zstd(self):
+        self._backup_and_restore_parallel('zstd')
+
+    def test_backup_incompressible_chunks_stored_raw(self):
+        self._create_backup_db_entry()
+        self.flags(backup_compression_algorithm='zlib',
+                   backup_swift_object_size=8 * 1024)
+        self.stubs.Set(swift, 'Connection',
+                       FakeSwiftStoreConnection.Connection)
+        self.stubs.Set(FakeSwiftStoreConnection, 'objects', {})
+        # Make every other chunk compressible.
+        for offset in xrange(0, 128 * 1024, 16 * 1024):
+            self.volume_file.seek(offset)
+            self.volume_file.write('a' * 8 * 1024)
+        self.volume_file.flush()
+
+        service = SwiftBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        backup = db.backup_get(self.ctxt, 123)
+        metadata = service._read_metadata(backup)
+        self.assertEqual(['zlib', 'none'] * 8,
+                         [obj.values()[0]['compression']
+                          for obj in metadata['objects']])
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, '1234-5678-1234-8888', restored_file)
+            restored_file.seek(0)
+            self.volume_file.seek(0)
+            self.assertEqual(self.volume_file.read(), restored_file.read())
+
+    def test_backup_parallel_put_object_wraps_socket_error(self):
+        container_name = 'socket_error_on_put'
+        self._create_backup_db_entry(container=container_name)
+        self.flags(backup_swift_object_size=8 * 1024,
+                   backup_swift_concurrency=4)
+        service = SwiftBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        self.assertRaises(exception.SwiftConnectionFailed,
+                          service.backup,
+                          backup, self.volume_file)
+
+    def test_backup_restore_incremental(self):
+        self._create_backup_db_entry()
+        self.flags(backup_compression_algorithm='zlib',
+                   backup_swift_object_size=8 * 1024)
+        self.stubs.Set(swift, 'Connection',
+                       FakeSwiftStoreConnection.Connection)
+        self.stubs.Set(FakeSwiftStoreConnection, 'objects', {})
+        service = SwiftBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+        backup = db.backup_get(self.ctxt, 123)
+        db.backup_update(self.ctxt, 123, {'status': 'available'})
+
+        # Change the second and the last chunk of the volume.
+        for offset in (8 * 1024, 120 * 1024):
+            self.volume_file.seek(offset)
+            self.volume_file.write(os.urandom(1024))
+        self.volume_file.flush()
+
+        db.backup_create(self.ctxt, {'id': 456,
+                                     'size': 1,
+                                     'container': 'other-container',
+                                     'volume_id': '1234-5678-1234-8888',
+                                     'parent_id': 123})
+        incremental = db.backup_get(self.ctxt, 456)
+        self.volume_file.seek(0)
+        service.backup(incremental, self.volume_file)
+
+        incremental = db.backup_get(self.ctxt, 456)
+        object_names = service._generate_object_names(incremental)
+        self.assertEqual(3, len(object_names))
+        self.assertEqual(3, incremental['object_count'])
+        metadata = service._read_metadata(incremental)
+        self.assertEqual(16, len(metadata['objects']))
+        reused = [obj.values()[0] for obj in metadata['objects']
+                  if obj.values()[0].get('backup_id') == '123']
+        self.assertEqual(14, len(reused))
+        self.assertEqual(set(['test-container']),
+                         set(entry['container'] for entry in reused))
+
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(incremental, '1234-5678-1234-8888',
+                            restored_file)
+            restored_file.seek(0)
+            self.volume_file.seek(0)
+            self.assertEqual(self.volume_file.read(), restored_file.read())
+
+        # Deleting the incremental backup leaves its parent intact.
+        service.delete(incremental)
+        self.assertEqual([], service._generate_object_names(incremental))
+        self.assertEqual(17, len(service._generate_object_names(backup)))
+
+    def test_backup_restore_sparse(self):
+        self._create_backup_db_entry()
+        self.flags(backup_compression_algorithm='zlib',
+                   backup_swift_object_size=8 * 1024)
+        self.stubs.Set(swift, 'Connection',
+                       FakeSwiftStoreConnection.Connection)
+        self.stubs.Set(FakeSwiftStoreConnection, 'objects', {})
+
+        # Zero everything but the second chunk and part of the fourth.
+        self.volume_file.seek(0)
+        self.volume_file.write('\0' * 128 * 1024)
+        self.volume_file.seek(8 * 1024)
+        self.volume_file.write(os.urandom(8 * 1024))
+        self.volume_file.seek(25 * 1024)
+        self.volume_file.write(os.urandom(10))
+        self.volume_file.flush()
+
+        service = SwiftBackupDriver(self.ctxt)
+        self.volume_file.seek(0)
+        backup = db.backup_get(self.ctxt, 123)
+        service.backup(backup, self.volume_file)
+
+        backup = db.backup_get(self.ctxt, 123)
+        self.assertEqual(2, len(FakeSwiftStoreConnection.objects) - 1)
+        metadata = service._read_metadata(backup)
+        self.assertEqual(16, len(metadata['objects']))
+        self.assertEqual(14, len([obj for obj in metadata['objects']
+                                  if obj.values()[0].get('zero')]))
+
+        # Restore over stale data.
+        with tempfile.NamedTemporaryFile() as restored_file:
+            restored_file.write(os.urandom(128 * 1024))
+            restored_file.flush()
+            restored_file.seek(0)
+            service.restore(backup, '1234-5678-1234-8888', restored_file)
+            restored_file.seek(0)
+            self.volume_file.seek(0)
+            self.assertEqual(self.volume_file.read(), restored_file.read())
+
+        # Restore to an empty file, ending with a hole.
+        with tempfile.NamedTemporaryFile() as restored_file:
+            service.restore(backup, '1234-5678-1234-8888', restored_file)
+            restored_file.seek(0)
+            self.volume_file.seek(0)
+            self.assertEqual(self.volume_file.read(), restored_file.read())
+
+    def test_restore_zeros_without_fileno(self):
+        self.flags(backup_swift_object_size=1024)
+        service = SwiftBackupDriver(self.ctxt)
+        volume_file = six.StringIO()
+        volume_file.write('x')
+        service._restore_zeros(volume_file, 3000)
+        volume_file.write('y')
+        self.assertEqual('x' + '\0' * 3000 + 'y', volume_file.getvalue())
+
     def test_restore(self):
         self._create_backup_db_entry()
         service = SwiftBackupDriver(self.ctxt)
@@ -203,6 +407,34 @@ class BackupSwiftTestCase(test.TestCase):
                               service.restore,
                               backup, '1234-5678-1234-8888', volume_file)
 
+    @mock.patch('cinder.openstack.common.importutils.import_object')
+    def test_restore_untrusted_compression(self, import_object):
+        container_name = 'untrusted_compression'
+        self._create_backup_db_entry(container=container_name)
+        service = SwiftBackupDriver(self.ctxt)
+
+        with tempfile.NamedTemporaryFile() as volume_file:
+            backup = db.backup_get(self.ctxt, 123)
+            self.assertRaises(exception.InvalidBackup,
+                              service.restore,
+                              backup, '1234-5678-1234-8888', volume_file)
+        self.assertFalse(import_object.called)
+
+    def test_get_decompressor(self):
+        self.flags(backup_compression_algorithm=(
+            'cinder.backup.compression.ZstdCompressor'))
+        service = SwiftBackupDriver(self.ctxt)
+        self.assertIsInstance(service._get_decompressor('zlib'),
+                              compression.ZlibCompressor)
+        self.assertIsInstance(service._get_decompressor(
+            'cinder.backup.compression.ZstdCompressor'),
+            compression.ZstdCompressor)
+        self.assertRaises(exception.InvalidBackup,
+                          service._get_decompressor,
+                          'cinder.backup.compression.LZ4Compressor')
+        self.assertRaises(exception.InvalidBackup,
+                          service._get_decompressor, 'fake')
+
     def test_restore_unsupported_version(self):
         container_name = 'unsupported_version'
         self._create_backup_db_entry(container=container_name)
@@ -234,7 +466,20 @@ class BackupSwiftTestCase(test.TestCase):
         compressor = service._get_compressor('None')
         self.assertIsNone(compressor)
         compressor = service._get_compressor('zlib')
-        self.assertEqual(compressor, zlib)
+        self.assertIsInstance(compressor, compression.ZlibCompressor)
+        data = os.urandom(512) * 8
+        self.assertEqual(zlib.compress(data), compressor.compress(data))
+        self.assertEqual(data, compressor.decompress(zlib.compress(data)))
         compressor = service._get_compressor('bz2')
         self.assertEqual(compressor, bz2)
         self.assertRaises(ValueError, service._get_compressor, 'fake')
+        self.assertRaises(ValueError, service._get_compressor,
+                          'cinder.tests.fake')
+        compressor = service._get_compressor(
+            'cinder.backup.compression.ZstdCompressor')
+        self.assertIsInstance(compressor, compression.ZstdCompressor)
+
+    @mock.patch.object(compression, 'lz4_frame', None)
+    def test_get_compressor_not_installed(self):
+        service = SwiftBackupDriver(self.ctxt)
+        self.assertRaises(ValueError, service._get_compressor, 'lz4')
@@ -0,0 +1,125 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the native volume copy engine."""
+
+import os
+import shutil
+import tempfile
+
+import mock
+
+from cinder.openstack.common import units
+from cinder import test
+from cinder.volume import block_copy
+
+
+CHUNK = 64 * units.Ki
+
+
+class BlockCopyTestCase(test.TestCase):
+
+    def setUp(self):
+        super(BlockCopyTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.src = os.path.join(self.tmpdir, 'src')
+        self.dst = os.path.join(self.tmpdir, 'dst')
+        self._write_file(self.dst, [], 0)
+
+    def _write_file(self, path, extents, size):
+        with open(path, 'wb') as f:
+            for offset, data in extents:
+                f.seek(offset)
+                f.write(data)
+            f.truncate(size)
+
+    def _read_file(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_copy(self):
+        data = os.urandom(3 * CHUNK + 100)
+        self._write_file(self.src, [(0, data)], len(data))
+        self._write_file(self.dst, [(0, 'x' * 10 * CHUNK)], 10 * CHUNK)
+
+        copier = block_copy.BlockCopy(self.src, self.dst, 10 * CHUNK,
+                                      chunk_size=CHUNK, workers=3)
+        copier.run()
+
+        # Like dd, the copy stops at the end of the source and the
+        # destination file is truncated.
+        self.assertEqual(data, self._read_file(self.dst))
+        self.assertEqual(len(data), copier.length)
+
+    def test_copy_sparse(self):
+        data = os.urandom(CHUNK)
+        size = 64 * CHUNK
+        self._write_file(self.src, [(CHUNK, data), (40 * CHUNK, data),
+                                    (41 * CHUNK, '\0' * CHUNK)], size)
+
+        copier = block_copy.BlockCopy(self.src, self.dst, size,
+                                      chunk_size=CHUNK, workers=2)
+        with mock.patch.object(block_copy, '_read',
+                               side_effect=block_copy._read) as read:
+            copier.run()
+
+        expected = self._read_file(self.src)
+        self.assertEqual(expected, self._read_file(self.dst))
+        # Holes are neither read nor written and neither are zeros.
+        self.assertTrue(read.call_count < 10)
+        self.assertEqual(2 * CHUNK, copier.written)
+        self.assertEqual(size, copier.copied)
+
+    def test_copy_zeros_to_device(self):
+        self._write_file(self.dst, [(0, 'x' * 4 * CHUNK)], 4 * CHUNK)
+
+        copier = block_copy.BlockCopy('/dev/zero', self.dst, 2 * CHUNK,
+                                      chunk_size=CHUNK)
+        with mock.patch.object(block_copy, '_is_sparse_file',
+                               return_value=False):
+            copier.run()
+
+        # A destination that can't be sparse gets zeros written.
+        self.assertEqual('\0' * 2 * CHUNK + 'x' * 2 * CHUNK,
+                         self._read_file(self.dst))
+        self.assertEqual(2 * CHUNK, copier.written)
+
+    @mock.patch('cinder.volume.block_copy.greenthread.sleep')
+    @mock.patch('time.time', return_value=100.0)
+    def test_copy_bps_limit(self, mock_time, mock_sleep):
+        self._write_file(self.src, [(0, 'x' * 4 * CHUNK)], 4 * CHUNK)
+
+        block_copy.BlockCopy(self.src, self.dst, 4 * CHUNK,
+                             chunk_size=CHUNK, workers=1,
+                             bps_limit=CHUNK).run()
+
+        self.assertEqual([mock.call(1.0), mock.call(2.0), mock.call(3.0),
+                          mock.call(4.0)], mock_sleep.call_args_list)
+
+    def test_copy_error(self):
+        self._write_file(self.src, [(0, 'x' * 4 * CHUNK)], 4 * CHUNK)
+
+        with mock.patch.object(block_copy, '_write',
+                               side_effect=IOError('fake')) as write:
+            self.assertRaises(IOError, block_copy.copy, self.src,
+                              self.dst, 4 * CHUNK, CHUNK, workers=2)
+        # The workers stop after the first error.
+        self.assertEqual(2, write.call_count)
+
+    def test_can_copy(self):
+        self._write_file(self.src, [], 0)
+        self.assertTrue(block_copy.can_copy(self.src, self.src))
+        self.assertFalse(block_copy.can_copy(self.src, self.src + '2'))
+        self.assertFalse(block_copy.can_copy(self.src, self.tmpdir))
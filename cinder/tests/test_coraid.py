@@ -243,6 +243,7 @@ class CoraidDriverTestCase(test.TestCase):
         configuration.use_multipath_for_image_xfer = False
         configuration.num_volume_device_scan_tries = 3
         configuration.volume_dd_blocksize = '1M'
+        configuration.image_cache_size_gb = 0
         self.fake_rpc = FakeRpc()
 
         self.stubs.Set(coraid.CoraidRESTClient, 'rpc', self.fake_rpc)
@@ -16,11 +16,15 @@
 
 import datetime
 
+import mock
 from oslo.config import cfg
+import sqlalchemy
 
 from cinder import context
 from cinder import db
+from cinder.db.sqlalchemy import api as sqlalchemy_api
 from cinder import exception
+from cinder.openstack.common.db import exception as db_exc
 from cinder.openstack.common import uuidutils
 from cinder.quota import ReservableResource
 from cinder import test
@@ -46,15 +50,14 @@ def _quota_reserve(context, project_id):
     resources = {}
     deltas = {}
     for i, resource in enumerate(('volumes', 'gigabytes')):
-        quotas[resource] = db.quota_create(context, project_id,
-                                           resource, i + 1)
+        db.quota_create(context, project_id, resource, i + 1)
+        quotas[resource] = i + 1
         resources[resource] = ReservableResource(resource,
                                                  '_sync_%s' % resource)
         deltas[resource] = i + 1
     return db.quota_reserve(
         context, resources, quotas, deltas,
-        datetime.datetime.utcnow(), datetime.datetime.utcnow(),
-        datetime.timedelta(days=1), project_id
+        datetime.datetime.utcnow(), 0, 0, project_id
     )
 
 
@@ -304,6 +307,15 @@ class DBAPIVolumeTestCase(BaseTest):
                              db.volume_data_get_for_host(
                                  self.ctxt, 'h%d' % i))
 
+    def test_volume_count_get_for_hosts(self):
+        for i in xrange(3):
+            for j in xrange(i + 1):
+                db.volume_create(self.ctxt, {'host': 'h%d' % i, 'size': 100})
+        self.assertEqual({'h0': 1, 'h2': 3},
+                         db.volume_count_get_for_hosts(self.ctxt,
+                                                       ['h0', 'h2', 'h3']))
+        self.assertEqual({}, db.volume_count_get_for_hosts(self.ctxt, []))
+
     def test_volume_data_get_for_project(self):
         for i in xrange(3):
             for j in xrange(3):
@@ -316,6 +328,16 @@ class DBAPIVolumeTestCase(BaseTest):
                              db.volume_data_get_for_project(
                                  self.ctxt, 'p%d' % i))
 
+    def test_volume_data_get_for_host_by_status(self):
+        for status, size in (('in-use', 1), ('in-use', 2), ('available', 4)):
+            db.volume_create(self.ctxt, {'host': 'h1', 'status': status,
+                                         'size': size})
+        db.volume_create(self.ctxt, {'host': 'h2', 'size': 8})
+        self.assertEqual((3, 7), db.volume_data_get_for_host(self.ctxt, 'h1'))
+        self.assertEqual((2, 3), db.volume_data_get_for_host(
+            self.ctxt, 'h1', statuses=['in-use']))
+        self.assertEqual((0, 0), db.volume_data_get_for_host(self.ctxt, 'h3'))
+
     def test_volume_detached_from_instance(self):
         volume = db.volume_create(self.ctxt, {})
         db.volume_attached(self.ctxt, volume['id'],
@@ -370,6 +392,46 @@ class DBAPIVolumeTestCase(BaseTest):
         self._assertEqualListsOfObjects(volumes[2:], db.volume_get_all(
                                         self.ctxt, 2, 2, 'id', None))
 
+    def test_volume_get_all_marker_sorted_desc(self):
+        volumes = [db.volume_create(self.ctxt, {'id': i, 'host': 'h'})
+                   for i in xrange(1, 5)]
+        self._assertEqualListsOfObjects(
+            [volumes[1], volumes[0]],
+            db.volume_get_all(self.ctxt, 3, None, 'host', 'desc'))
+
+    def test_volume_get_all_marker_not_found(self):
+        db.volume_create(self.ctxt, {'id': 1})
+        self.assertRaises(exception.VolumeNotFound, db.volume_get_all,
+                          self.ctxt, 2, None, 'id', None)
+
+    def test_volume_get_all_metadata(self):
+        self.stubs.Set(sqlalchemy_api, '_VOLUME_METADATA_BATCH', 2)
+        for i in xrange(1, 4):
+            db.volume_create(self.ctxt, {'id': i, 'metadata': {'n': str(i)},
+                                         'admin_metadata': {'a': str(i)}})
+        volumes = db.volume_get_all(self.ctxt, None, None, 'id', 'asc')
+        self.assertEqual(3, len(volumes))
+        for i, volume in enumerate(volumes, 1):
+            self.assertEqual([('n', str(i))],
+                             [(m.key, m.value)
+                              for m in volume.volume_metadata])
+            self.assertEqual([('a', str(i))],
+                             [(m.key, m.value)
+                              for m in volume.volume_admin_metadata])
+
+    def test_volume_get_all_columns(self):
+        db.volume_create(self.ctxt, {'id': 1, 'display_name': 'vol1',
+                                     'project_id': 'p1'})
+        db.volume_create(self.ctxt, {'id': 2, 'display_name': 'vol2',
+                                     'project_id': 'p1'})
+        self.assertEqual([{'id': '2', 'display_name': 'vol2'}],
+                         db.volume_get_all_by_project(
+                             self.ctxt, 'p1', 1, None, 'id', 'asc',
+                             columns=('id', 'display_name')))
+        self.assertRaises(exception.InvalidInput, db.volume_get_all,
+                          self.ctxt, None, None, 'id', 'asc',
+                          columns=('id', 'nonexistent'))
+
     def test_volume_get_all_by_host(self):
         volumes = []
         for i in xrange(3):
@@ -958,6 +1020,53 @@ class DBAPIReservationTestCase(BaseTest):
                              self.ctxt,
                              'project1'))
 
+    @mock.patch('cinder.db.sqlalchemy.api._RESERVATION_EXPIRE_BATCH', 1)
+    def test_reservation_expire_batches(self):
+        _quota_reserve(self.ctxt, 'project1')
+        resources = {'volumes': ReservableResource('volumes',
+                                                   '_sync_volumes')}
+        quotas = {'volumes': -1}
+        now = datetime.datetime.utcnow()
+        for delta, expire in ((1, now), (-1, now),
+                              (5, now + datetime.timedelta(days=1))):
+            db.quota_reserve(self.ctxt, resources, quotas,
+                             {'volumes': delta}, expire, 0, 0, 'project1')
+
+        db.reservation_expire(self.ctxt)
+
+        expected = {'project_id': 'project1',
+                    'gigabytes': {'reserved': 0, 'in_use': 0},
+                    'volumes': {'reserved': 5, 'in_use': 0}}
+        self.assertEqual(expected,
+                         db.quota_usage_get_all_by_project(
+                             self.ctxt,
+                             'project1'))
+        reservations = sqlalchemy_api.model_query(
+            self.ctxt, sqlalchemy_api.models.Reservation).all()
+        self.assertEqual([5], [r.delta for r in reservations])
+
+    def test_reservation_commit_negative_delta(self):
+        db.reservation_commit(self.ctxt, _quota_reserve(self.ctxt,
+                                                        'project1'),
+                              'project1')
+        resources = {'volumes': ReservableResource('volumes',
+                                                   '_sync_volumes')}
+        reservations = db.quota_reserve(
+            self.ctxt, resources, {'volumes': -1}, {'volumes': -1},
+            datetime.datetime.utcnow(), 0, 0, 'project1')
+
+        db.reservation_commit(self.ctxt, reservations, 'project1')
+        # Committing again does nothing.
+        db.reservation_commit(self.ctxt, reservations, 'project1')
+
+        expected = {'project_id': 'project1',
+                    'gigabytes': {'reserved': 0, 'in_use': 2},
+                    'volumes': {'reserved': 0, 'in_use': 0}}
+        self.assertEqual(expected,
+                         db.quota_usage_get_all_by_project(
+                             self.ctxt,
+                             'project1'))
+
 
 class DBAPIQuotaClassTestCase(BaseTest):
 
@@ -1062,6 +1171,101 @@ class DBAPIQuotaTestCase(BaseTest):
                           'volumes': {'reserved': 1, 'in_use': 0}},
                          quota_usage)
 
+    def _reserve_volumes(self, count, quota, until_refresh=0,
+                         defer_refresh=False):
+        resources = {'volumes': ReservableResource('volumes',
+                                                   '_sync_volumes')}
+        expire = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+        return db.quota_reserve(self.ctxt, resources, {'volumes': quota},
+                                {'volumes': count}, expire, until_refresh, 0,
+                                project_id='project1',
+                                defer_refresh=defer_refresh)
+
+    def test_quota_reserve_without_lock(self):
+        self._reserve_volumes(1, 5)
+        with mock.patch.object(sqlalchemy_api, '_get_quota_usages',
+                               wraps=sqlalchemy_api._get_quota_usages) as m:
+            self._reserve_volumes(2, 5)
+            m.assert_called_once_with(mock.ANY, mock.ANY, 'project1',
+                                      resources=['volumes'], lock=False)
+        self.assertRaises(exception.OverQuota, self._reserve_volumes, 3, 5)
+        self.assertEqual({'project_id': 'project1',
+                          'volumes': {'reserved': 3, 'in_use': 0}},
+                         db.quota_usage_get_all_by_project(self.ctxt,
+                                                           'project1'))
+
+    def test_quota_reserve_falls_back_to_lock(self):
+        self._reserve_volumes(1, 5)
+        with mock.patch.object(sqlalchemy_api, '_quota_usage_reserve',
+                               return_value=False):
+            reservations = self._reserve_volumes(2, 5)
+        self.assertEqual(1, len(reservations))
+        self.assertEqual({'project_id': 'project1',
+                          'volumes': {'reserved': 3, 'in_use': 0}},
+                         db.quota_usage_get_all_by_project(self.ctxt,
+                                                           'project1'))
+
+    def test_quota_reserve_without_lock_in_usage_order(self):
+        resources = {'volumes': ReservableResource('volumes',
+                                                   '_sync_volumes'),
+                     'gigabytes': ReservableResource('gigabytes',
+                                                     '_sync_gigabytes')}
+        quotas = {'volumes': -1, 'gigabytes': -1}
+        expire = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+        # The usages of project1 and project2 are created in opposite
+        # orders.
+        for project_id, first in (('project1', 'volumes'),
+                                  ('project2', 'gigabytes')):
+            db.quota_reserve(self.ctxt, resources, quotas, {first: 1},
+                             expire, 0, 0, project_id=project_id)
+            db.quota_reserve(self.ctxt, resources, quotas,
+                             {'volumes': 1, 'gigabytes': 1}, expire, 0, 0,
+                             project_id=project_id)
+
+        for project_id, first, second in (
+                ('project1', 'volumes', 'gigabytes'),
+                ('project2', 'gigabytes', 'volumes')):
+            with mock.patch.object(
+                    sqlalchemy_api, '_quota_usage_reserve',
+                    wraps=sqlalchemy_api._quota_usage_reserve) as m:
+                db.quota_reserve(self.ctxt, resources, quotas,
+                                 {'volumes': 1, 'gigabytes': 1}, expire,
+                                 0, 0, project_id=project_id)
+            self.assertEqual([first, second],
+                             [c[0][3] for c in m.call_args_list])
+
+    def test_quota_reserve_without_lock_deadlock(self):
+        self._reserve_volumes(1, 5)
+        with mock.patch.object(sqlalchemy_api, '_quota_usage_reserve',
+                               side_effect=db_exc.DBDeadlock()):
+            reservations = self._reserve_volumes(2, 5)
+        self.assertEqual(1, len(reservations))
+        self.assertEqual({'project_id': 'project1',
+                          'volumes': {'reserved': 3, 'in_use': 0}},
+                         db.quota_usage_get_all_by_project(self.ctxt,
+                                                           'project1'))
+
+    def test_quota_reserve_zero_over_quota(self):
+        self._reserve_volumes(3, 5)
+        self.assertRaises(exception.OverQuota, self._reserve_volumes, 0, 2)
+
+    def test_quota_usage_refresh(self):
+        db.volume_create(self.ctxt, {'project_id': 'project1'})
+        self._reserve_volumes(1, 5, until_refresh=1, defer_refresh=True)
+        db.volume_create(self.ctxt, {'project_id': 'project1'})
+        self._reserve_volumes(1, 5, until_refresh=1, defer_refresh=True)
+        usage = db.quota_usage_get(self.ctxt, 'project1', 'volumes')
+        self.assertEqual(1, usage.in_use)
+        self.assertEqual(0, usage.until_refresh)
+
+        resources = {'volumes': ReservableResource('volumes',
+                                                   '_sync_volumes')}
+        db.quota_usage_refresh(self.ctxt, resources, 1, 0)
+        usage = db.quota_usage_get(self.ctxt, 'project1', 'volumes')
+        self.assertEqual(2, usage.in_use)
+        self.assertEqual(1, usage.until_refresh)
+        self.assertEqual(2, usage.reserved)
+
     def test_quota_destroy(self):
         db.quota_create(self.ctxt, 'project1', 'resource1', 41)
         self.assertIsNone(db.quota_destroy(self.ctxt, 'project1',
@@ -1157,7 +1361,8 @@ class DBAPIBackupTestCase(BaseTest):
             'service_metadata': 'metadata',
             'service': 'service',
             'size': 1000,
-            'object_count': 100}
+            'object_count': 100,
+            'parent_id': 'parent'}
         if one:
             return base_values
 
@@ -1228,3 +1433,70 @@ class DBAPIBackupTestCase(BaseTest):
     def test_backup_not_found(self):
         self.assertRaises(exception.BackupNotFound, db.backup_get, self.ctxt,
                           'notinbase')
+
+
+class DBAPIArchiveTestCase(BaseTest):
+
+    """Tests for db.api.archive_deleted_rows."""
+
+    def setUp(self):
+        super(DBAPIArchiveTestCase, self).setUp()
+        db.volume_create(self.ctxt, {'id': 'deleted',
+                                     'metadata': {'key': 'value'}})
+        db.volume_destroy(self.ctxt, 'deleted')
+        # Deleted, but a snapshot still refers to it.
+        db.volume_create(self.ctxt, {'id': 'snapshotted'})
+        db.snapshot_create(self.ctxt, {'id': 'snapshot',
+                                       'volume_id': 'snapshotted'})
+        db.volume_destroy(self.ctxt, 'snapshotted')
+        db.volume_create(self.ctxt, {'id': 'available'})
+
+    def _ids(self, table_name):
+        engine = sqlalchemy_api.get_engine()
+        table = sqlalchemy.Table(table_name, sqlalchemy.MetaData(engine),
+                                 autoload=True)
+        return sorted(row[0] for row in
+                      engine.execute(sqlalchemy.select([table.c.id])))
+
+    def test_archive_deleted_rows(self):
+        rows = db.archive_deleted_rows(self.ctxt)
+
+        self.assertEqual(1, rows['volumes'])
+        self.assertEqual(1, rows['volume_metadata'])
+        self.assertEqual(['available', 'snapshotted'], self._ids('volumes'))
+        self.assertEqual(['deleted'], self._ids('shadow_volumes'))
+        self.assertEqual(1, len(self._ids('shadow_volume_metadata')))
+        self.assertEqual([], self._ids('volume_metadata'))
+
+    def test_archive_deleted_rows_referred_to(self):
+        db.snapshot_destroy(self.ctxt, 'snapshot')
+
+        rows = db.archive_deleted_rows(self.ctxt, batch_size=1)
+
+        self.assertEqual(2, rows['volumes'])
+        self.assertEqual(1, rows['snapshots'])
+        self.assertEqual(['available'], self._ids('volumes'))
+        self.assertEqual(['deleted', 'snapshotted'],
+                         self._ids('shadow_volumes'))
+
+    def test_archive_deleted_rows_before(self):
+        before = datetime.datetime.utcnow() - datetime.timedelta(days=1)
+        rows = db.archive_deleted_rows(self.ctxt, before=before)
+
+        self.assertEqual(0, sum(rows.values()))
+        self.assertEqual(['available', 'deleted', 'snapshotted'],
+                         self._ids('volumes'))
+
+    def test_archive_deleted_rows_max_rows(self):
+        rows = db.archive_deleted_rows(self.ctxt, max_rows=1)
+
+        self.assertEqual(1, sum(rows.values()))
+        self.assertEqual(1, rows['volume_metadata'])
+        self.assertNotIn('volumes', rows)
+
+    def test_purge_deleted_rows(self):
+        rows = db.archive_deleted_rows(self.ctxt, purge=True)
+
+        self.assertEqual(1, rows['volumes'])
+        self.assertEqual(['available', 'snapshotted'], self._ids('volumes'))
+        self.assertEqual([], self._ids('shadow_volumes'))
@@ -68,6 +68,10 @@ class FakeDb(object):
         """Mock this if you want results from it."""
         return []
 
+    def volume_get_all_by_host(self, *a, **kw):
+        """Mock this if you want results from it."""
+        return []
+
 
 class GlusterFsDriverTestCase(test.TestCase):
     """Test case for GlusterFS driver."""
@@ -96,6 +100,7 @@ class GlusterFsDriverTestCase(test.TestCase):
             self.TEST_MNT_POINT_BASE
         self._configuration.glusterfs_sparsed_volumes = True
         self._configuration.glusterfs_qcow2_volumes = False
+        self._configuration.glusterfs_allocation_refresh_interval = 3600
 
         self.stubs = stubout.StubOutForTesting()
         self._driver =\
@@ -516,6 +521,26 @@ class GlusterFsDriverTestCase(test.TestCase):
 
         mox.VerifyAll()
 
+    def test_find_share_least_allocated(self):
+        """_find_share should prefer the share with less space allocated."""
+        drv = self._driver
+        drv._mounted_shares = [self.TEST_EXPORT1, self.TEST_EXPORT2]
+        volumes = [{'provider_location': self.TEST_EXPORT2, 'size': 1}]
+        capacities = {self.TEST_EXPORT1: (2 * units.Gi, 5 * units.Gi),
+                      self.TEST_EXPORT2: (3 * units.Gi, 10 * units.Gi)}
+
+        with mock.patch.object(drv.db, 'volume_get_all_by_host',
+                               return_value=volumes):
+            with mock.patch.object(drv, '_get_available_capacity',
+                                   side_effect=capacities.get):
+                self.assertEqual(self.TEST_EXPORT1,
+                                 drv._find_share(self.TEST_SIZE_IN_GB))
+
+                # The space of new volumes counts at once.
+                drv._allocate_space(self.TEST_EXPORT1, 2)
+                self.assertEqual(self.TEST_EXPORT2,
+                                 drv._find_share(self.TEST_SIZE_IN_GB))
+
     def test_find_share_should_throw_error_if_there_is_no_enough_place(self):
         """_find_share should throw error if there is no share to host vol."""
         mox = self._mox
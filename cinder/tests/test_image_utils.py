@@ -16,9 +16,14 @@
 """Unit tests for image utils."""
 
 import contextlib
-import mox
+import hashlib
+import os
+import shutil
 import tempfile
 
+import mock
+import mox
+
 from oslo.config import cfg
 
 from cinder import context
@@ -497,6 +502,99 @@ class TestUtils(test.TestCase):
         m.VerifyAll()
 
 
+class TestStreamRawImage(test.TestCase):
+    DATA = 'x' * 1000 + 'y' * 1000
+
+    def setUp(self):
+        super(TestStreamRawImage, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.flags(image_conversion_dir=self.tmpdir)
+        self.dest = os.path.join(self.tmpdir, 'volume')
+        open(self.dest, 'wb').close()
+
+        self.image_service = mock.Mock()
+        self.image_meta = {'size': len(self.DATA),
+                           'disk_format': 'raw',
+                           'container_format': 'bare',
+                           'checksum': hashlib.md5(self.DATA).hexdigest()}
+        self.image_service.show.return_value = self.image_meta
+
+        def download(context, image_id, data):
+            for i in range(0, len(self.DATA), 100):
+                data.write(self.DATA[i:i + 100])
+        self.image_service.download.side_effect = download
+
+        self.mock_info = self._patch('cinder.image.image_utils.qemu_img_info')
+        self.mock_info.return_value.file_format = 'raw'
+        self.mock_convert = self._patch(
+            'cinder.image.image_utils.convert_image')
+        self._patch('cinder.image.image_utils.STREAM_PROBE_SIZE', 500)
+        self._patch('cinder.image.image_utils.STREAM_WRITE_SIZE', 700)
+
+    def _patch(self, *args):
+        patcher = mock.patch(*args)
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def _fetch_to_raw(self, size=None):
+        image_utils.fetch_to_raw(context, self.image_service, 'image_id',
+                                 self.dest, '1M', size=size)
+
+    def _read_dest(self):
+        with open(self.dest, 'rb') as f:
+            return f.read()
+
+    def test_fetch_to_raw(self):
+        self._fetch_to_raw(size=1)
+
+        self.assertEqual(self.DATA, self._read_dest())
+        # Only the first bytes are checked and no temp file is converted.
+        self.assertEqual(1, self.mock_info.call_count)
+        self.assertFalse(self.mock_convert.called)
+        self.assertEqual(['volume'], os.listdir(self.tmpdir))
+
+    def test_fetch_to_raw_not_raw(self):
+        self.mock_info.return_value.file_format = 'qcow2'
+
+        self.assertRaises(exception.ImageUnacceptable, self._fetch_to_raw)
+        self.assertEqual('', self._read_dest())
+
+    def test_fetch_to_raw_no_qemu_img(self):
+        self.mock_info.side_effect = processutils.ProcessExecutionError
+
+        self._fetch_to_raw()
+        self.assertEqual(self.DATA, self._read_dest())
+
+    def test_fetch_to_raw_bad_checksum(self):
+        self.image_meta['checksum'] = 'bad'
+        self.assertRaises(exception.ImageUnacceptable, self._fetch_to_raw)
+
+    def test_fetch_to_raw_too_large(self):
+        self.image_meta['size'] = 2 * units.Gi
+        self.assertRaises(exception.ImageUnacceptable, self._fetch_to_raw,
+                          size=1)
+        self.assertFalse(self.image_service.download.called)
+
+    def test_raw_image_writer(self):
+        writes = []
+
+        class FakeFile(object):
+            def write(self, data):
+                writes.append(data)
+
+        writer = image_utils._RawImageWriter('image_id', FakeFile())
+        for i in range(0, len(self.DATA), 100):
+            writer.write(self.DATA[i:i + 100])
+        writer.close()
+
+        # The first 500 bytes are written once checked, then the rest is
+        # written 700 bytes at a time.
+        self.assertEqual([500, 700, 700, 100], [len(data) for data in writes])
+        self.assertEqual(self.DATA, ''.join(writes))
+        self.assertEqual(2000, writer.size)
+
+
 class TestExtractTo(test.TestCase):
     def test_extract_to_calls_tar(self):
         mox = self.mox
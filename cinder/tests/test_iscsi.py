@@ -21,6 +21,7 @@ import tempfile
 from cinder.brick.iscsi import iscsi
 from cinder import test
 from cinder.volume import driver
+from cinder.volume import iscsi as volume_iscsi
 
 
 class TargetAdminTestCase(object):
@@ -126,6 +127,41 @@ class TgtAdmTestCase(test.TestCase, TargetAdminTestCase):
             '--delete %(target_name)s',
             'tgtadm --lld iscsi --op show --mode target'])
 
+    def test_get_missing_exports(self):
+        show = """Target 1: iqn.2011-09.org.foo.bar:volume-1
+    System information:
+        Driver: iscsi
+    LUN information:
+        LUN: 0
+            Type: controller
+        LUN: 1
+            Type: disk
+Target 2: iqn.2011-09.org.foo.bar:volume-2
+    LUN information:
+        LUN: 0
+            Type: controller
+"""
+
+        def fake_execute(*cmd, **kwargs):
+            self.cmds.append(string.join(cmd))
+            return show, None
+
+        target_helper = volume_iscsi.TgtAdm('sudo', self.persist_tempdir,
+                                            'iqn.2011-09.org.foo.bar:')
+        target_helper.set_execute(fake_execute)
+        volumes = [{'name': 'volume-%d' % i, 'provider_location': None}
+                   for i in range(1, 4)]
+        volumes.append({'name': 'volume-4', 'provider_location':
+                        '10.0.0.1:3260,1 iqn.2011-09.org.foo.bar:volume-5 1'})
+        for volume in volumes:
+            open(os.path.join(self.persist_tempdir, volume['name']),
+                 'w').close()
+        os.remove(os.path.join(self.persist_tempdir, 'volume-3'))
+
+        self.assertEqual(volumes[1:],
+                         target_helper.get_missing_exports(None, volumes))
+        self.assertEqual(['tgt-admin --show'], self.cmds)
+
 
 class IetAdmTestCase(test.TestCase, TargetAdminTestCase):
 
@@ -202,6 +238,18 @@ class LioAdmTestCase(test.TestCase, TargetAdminTestCase):
             '%(path)s %(target_name)s test_id test_pass',
             'cinder-rtstool delete %(target_name)s'])
 
+    def test_get_missing_exports(self):
+        def fake_execute(*cmd, **kwargs):
+            self.cmds.append(string.join(cmd))
+            return 'iqn.2011-09.org.foo.bar:volume-1\n', None
+
+        target_helper = self.driver.get_target_helper(self.db)
+        target_helper.set_execute(fake_execute)
+        volumes = [{'name': 'volume-1'}, {'name': 'volume-2'}]
+        self.assertEqual(volumes[1:],
+                         target_helper.get_missing_exports(None, volumes))
+        self.assertEqual(['cinder-rtstool get-targets'], self.cmds)
+
 
 class ISERTgtAdmTestCase(TgtAdmTestCase):
 
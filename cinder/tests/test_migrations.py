@@ -1071,3 +1071,69 @@ class TestMigrations(test.TestCase):
                                         metadata,
                                         autoload=True)
             self.assertNotIn('disabled_reason', services.c)
+
+    def test_migration_023(self):
+        """Test that adding parent_id column to backups works correctly."""
+        for (key, engine) in self.engines.items():
+            migration_api.version_control(engine,
+                                          TestMigrations.REPOSITORY,
+                                          migration.db_initial_version())
+            migration_api.upgrade(engine, TestMigrations.REPOSITORY, 22)
+            metadata = sqlalchemy.schema.MetaData()
+            metadata.bind = engine
+
+            migration_api.upgrade(engine, TestMigrations.REPOSITORY, 23)
+            backups = sqlalchemy.Table('backups',
+                                       metadata,
+                                       autoload=True)
+            self.assertIsInstance(backups.c.parent_id.type,
+                                  sqlalchemy.types.VARCHAR)
+
+            migration_api.downgrade(engine, TestMigrations.REPOSITORY, 22)
+            metadata = sqlalchemy.schema.MetaData()
+            metadata.bind = engine
+
+            backups = sqlalchemy.Table('backups',
+                                       metadata,
+                                       autoload=True)
+            self.assertNotIn('parent_id', backups.c)
+
+    def test_migration_024(self):
+        """Test adding shadow tables and indexes of deleted rows."""
+        for (key, engine) in self.engines.items():
+            migration_api.version_control(engine,
+                                          TestMigrations.REPOSITORY,
+                                          migration.db_initial_version())
+            migration_api.upgrade(engine, TestMigrations.REPOSITORY, 23)
+            metadata = sqlalchemy.schema.MetaData()
+            metadata.bind = engine
+
+            migration_api.upgrade(engine, TestMigrations.REPOSITORY, 24)
+
+            volumes = sqlalchemy.Table('volumes', metadata, autoload=True)
+            shadow_volumes = sqlalchemy.Table('shadow_volumes', metadata,
+                                              autoload=True)
+            self.assertEqual(sorted(volumes.c.keys()),
+                             sorted(shadow_volumes.c.keys()))
+            self.assertFalse(shadow_volumes.primary_key.columns)
+            self.assertTrue(engine.dialect.has_table(engine.connect(),
+                                                     "shadow_reservations"))
+            self.assertFalse(engine.dialect.has_table(
+                engine.connect(), "shadow_migrate_version"))
+            indexes = dict((index.name, [column.name for column in
+                                         index.columns])
+                           for index in volumes.indexes)
+            self.assertEqual(['deleted', 'project_id'],
+                             indexes['volumes_deleted_project_id_idx'])
+            self.assertEqual(['deleted', 'host'],
+                             indexes['volumes_deleted_host_idx'])
+
+            migration_api.downgrade(engine, TestMigrations.REPOSITORY, 23)
+            metadata = sqlalchemy.schema.MetaData()
+            metadata.bind = engine
+
+            self.assertFalse(engine.dialect.has_table(engine.connect(),
+                                                      "shadow_volumes"))
+            volumes = sqlalchemy.Table('volumes', metadata, autoload=True)
+            self.assertNotIn('volumes_deleted_host_idx',
+                             [index.name for index in volumes.indexes])
@@ -31,6 +31,7 @@ from cinder.image import image_utils
 from cinder.openstack.common import units
 from cinder import test
 from cinder.volume import configuration as conf
+from cinder.volume.drivers.netapp import nfs as netapp_nfs
 from cinder.volume.drivers import nfs
 
 
@@ -135,6 +136,7 @@ class NfsDriverTestCase(test.TestCase):
         self.configuration.nfs_oversub_ratio = 1.0
         self.configuration.nfs_mount_point_base = self.TEST_MNT_POINT_BASE
         self.configuration.nfs_mount_options = None
+        self.configuration.nfs_allocation_refresh_interval = 3600
         self.configuration.volume_dd_blocksize = '1M'
         self._driver = nfs.NfsDriver(configuration=self.configuration)
         self._driver.shares = {}
@@ -215,7 +217,7 @@ class NfsDriverTestCase(test.TestCase):
 
         mox.StubOutWithMock(drv, '_get_mount_point_for_share')
         drv._get_mount_point_for_share(self.TEST_NFS_EXPORT1).\
-            AndReturn(self.TEST_MNT_POINT)
+            MultipleTimes().AndReturn(self.TEST_MNT_POINT)
 
         mox.StubOutWithMock(drv, '_execute')
         drv._execute('stat', '-f', '-c', '%S %b %a',
@@ -248,7 +250,7 @@ class NfsDriverTestCase(test.TestCase):
 
         mox.StubOutWithMock(drv, '_get_mount_point_for_share')
         drv._get_mount_point_for_share(self.TEST_NFS_EXPORT_SPACES).\
-            AndReturn(self.TEST_MNT_POINT_SPACES)
+            MultipleTimes().AndReturn(self.TEST_MNT_POINT_SPACES)
 
         mox.StubOutWithMock(drv, '_execute')
         drv._execute('stat', '-f', '-c', '%S %b %a',
@@ -414,12 +416,6 @@ class NfsDriverTestCase(test.TestCase):
         drv._get_capacity_info(self.TEST_NFS_EXPORT1).\
             AndReturn((5 * units.Gi, 2 * units.Gi,
                        2 * units.Gi))
-        drv._get_capacity_info(self.TEST_NFS_EXPORT1).\
-            AndReturn((5 * units.Gi, 2 * units.Gi,
-                       2 * units.Gi))
-        drv._get_capacity_info(self.TEST_NFS_EXPORT2).\
-            AndReturn((10 * units.Gi, 3 * units.Gi,
-                       1 * units.Gi))
         drv._get_capacity_info(self.TEST_NFS_EXPORT2).\
             AndReturn((10 * units.Gi, 3 * units.Gi,
                        1 * units.Gi))
@@ -755,3 +751,130 @@ class NfsDriverTestCase(test.TestCase):
         with mock.patch.object(image_utils, 'qemu_img_info',
                                return_value=data):
             self.assertFalse(drv._is_file_size_equal(path, size))
+
+    def _set_volumes(self, *volumes):
+        self._driver.db = mock.Mock()
+        self._driver.db.volume_get_all_by_host.return_value = [
+            {'provider_location': share, 'size': size}
+            for share, size in volumes]
+
+    def test_get_allocated_space(self):
+        """Allocated space is tracked without scanning the shares."""
+        drv = self._driver
+        self._set_volumes((self.TEST_NFS_EXPORT1, 1),
+                          (self.TEST_NFS_EXPORT1, 2),
+                          (self.TEST_NFS_EXPORT2, 4),
+                          (None, 8))
+
+        with mock.patch.object(drv, '_execute') as mock_execute:
+            self.assertEqual(3 * units.Gi,
+                             drv._get_allocated_space(self.TEST_NFS_EXPORT1))
+            drv._allocate_space(self.TEST_NFS_EXPORT1, 5)
+            drv._allocate_space(self.TEST_NFS_EXPORT2, -4)
+            self.assertEqual(8 * units.Gi,
+                             drv._get_allocated_space(self.TEST_NFS_EXPORT1))
+            self.assertEqual(0,
+                             drv._get_allocated_space(self.TEST_NFS_EXPORT2))
+
+            self.assertFalse(mock_execute.called)
+        self.assertEqual(1, drv.db.volume_get_all_by_host.call_count)
+
+    def test_get_allocated_space_new_share(self):
+        """Shares without volumes are scanned once."""
+        drv = self._driver
+        self._set_volumes()
+
+        with mock.patch.object(drv, '_scan_allocated_space',
+                               return_value=units.Gi) as mock_scan:
+            drv._get_allocated_space(self.TEST_NFS_EXPORT1)
+            drv._allocate_space(self.TEST_NFS_EXPORT1, 1)
+            self.assertEqual(2 * units.Gi,
+                             drv._get_allocated_space(self.TEST_NFS_EXPORT1))
+
+            mock_scan.assert_called_once_with(self.TEST_NFS_EXPORT1)
+
+    def test_get_allocated_space_without_refresh_interval(self):
+        """Shares are scanned every time with no refresh interval."""
+        drv = self._driver
+        self.configuration.nfs_allocation_refresh_interval = 0
+        self._set_volumes((self.TEST_NFS_EXPORT1, 1))
+
+        with mock.patch.object(drv, '_scan_allocated_space',
+                               return_value=units.Gi) as mock_scan:
+            drv._get_allocated_space(self.TEST_NFS_EXPORT1)
+            drv._get_allocated_space(self.TEST_NFS_EXPORT1)
+
+            self.assertEqual(2, mock_scan.call_count)
+
+    def test_refresh_expired_allocations(self):
+        """Shares are scanned again once the refresh interval passed."""
+        drv = self._driver
+        drv._mounted_shares = [self.TEST_NFS_EXPORT1, self.TEST_NFS_EXPORT2]
+        self._set_volumes((self.TEST_NFS_EXPORT1, 1),
+                          (self.TEST_NFS_EXPORT2, 1))
+        drv._get_allocated_space(self.TEST_NFS_EXPORT1)
+        drv._allocation_refreshed[self.TEST_NFS_EXPORT1] -= 3600
+
+        def scan(share):
+            # A volume created during the scan is counted.
+            drv._allocate_space(share, 1)
+            return 4 * units.Gi
+
+        with mock.patch.object(drv, '_scan_allocated_space',
+                               side_effect=scan) as mock_scan:
+            drv._refresh_expired_allocations()
+
+            mock_scan.assert_called_once_with(self.TEST_NFS_EXPORT1)
+        self.assertEqual(5 * units.Gi,
+                         drv._get_allocated_space(self.TEST_NFS_EXPORT1))
+        self.assertEqual(units.Gi,
+                         drv._get_allocated_space(self.TEST_NFS_EXPORT2))
+
+    def test_create_and_delete_volume_allocate_space(self):
+        """Creating and deleting volumes updates the allocated space."""
+        drv = self._driver
+        self._set_volumes((self.TEST_NFS_EXPORT1, 1))
+        volume = {'name': 'volume-123', 'size': 2,
+                  'provider_location': self.TEST_NFS_EXPORT1}
+        drv._get_allocated_space(self.TEST_NFS_EXPORT1)
+
+        with mock.patch.object(drv, '_ensure_shares_mounted'):
+            with mock.patch.object(drv, '_ensure_share_mounted'):
+                with mock.patch.object(drv, '_find_share',
+                                       return_value=self.TEST_NFS_EXPORT1):
+                    with mock.patch.object(drv, '_do_create_volume'):
+                        with mock.patch.object(drv, '_execute'):
+                            drv.create_volume(volume)
+                            self.assertEqual(
+                                3 * units.Gi,
+                                drv._get_allocated_space(
+                                    self.TEST_NFS_EXPORT1))
+
+                            drv.delete_volume(volume)
+        self.assertEqual(units.Gi,
+                         drv._get_allocated_space(self.TEST_NFS_EXPORT1))
+
+    def test_get_allocated_space_untracked(self):
+        """Drivers that do not track the space scan the shares instead."""
+        drv = netapp_nfs.NetAppNFSDriver(configuration=self.configuration)
+        drv._mounted_shares = [self.TEST_NFS_EXPORT1]
+        drv.db = mock.Mock()
+        drv.db.volume_get_all_by_host.return_value = [
+            {'provider_location': self.TEST_NFS_EXPORT1, 'size': 1}]
+        volume = {'name': 'volume-123', 'size': 2,
+                  'provider_location': self.TEST_NFS_EXPORT1}
+        scans = [4 * units.Gi, 2 * units.Gi]
+
+        with mock.patch.object(drv, '_scan_allocated_space',
+                               side_effect=scans) as mock_scan:
+            self.assertEqual(4 * units.Gi,
+                             drv._get_allocated_space(self.TEST_NFS_EXPORT1))
+            drv._refresh_expired_allocations()
+            with mock.patch.object(drv, '_ensure_share_mounted'):
+                with mock.patch.object(drv, '_execute'):
+                    drv.delete_volume(volume)
+            # The volume deleted is found by the scan, not subtracted.
+            self.assertEqual(2 * units.Gi,
+                             drv._get_allocated_space(self.TEST_NFS_EXPORT1))
+
+            self.assertEqual(2, mock_scan.call_count)
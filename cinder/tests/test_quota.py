@@ -31,6 +31,7 @@ from cinder import quota
 from cinder import test
 import cinder.tests.image.fake
 from cinder import volume
+from cinder.volume import volume_types
 
 
 CONF = cfg.CONF
@@ -707,6 +708,55 @@ class VolumeTypeQuotaEngineTestCase(test.TestCase):
         db.volume_type_destroy(ctx, vtype['id'])
         db.volume_type_destroy(ctx, vtype2['id'])
 
+    def test_resources_cached(self):
+        self.flags(quota_resources_cache_ttl=60)
+        engine = quota.VolumeTypeQuotaEngine()
+        with mock.patch.object(db, 'volume_type_get_all',
+                               return_value={}) as vtga:
+            engine.resources
+            engine.resources['volumes_type1'] = None
+            self.assertNotIn('volumes_type1', engine.resources)
+        self.assertEqual(1, vtga.call_count)
+        self.assertEqual(2, engine.hits)
+        self.assertEqual(1, engine.misses)
+
+    def test_resources_invalidated_by_volume_types(self):
+        self.flags(quota_resources_cache_ttl=60)
+        self.stubs.Set(quota, 'QUOTAS', quota.VolumeTypeQuotaEngine())
+        self.stubs.Set(volume_types, 'QUOTAS', quota.QUOTAS)
+        ctx = context.get_admin_context()
+        self.assertNotIn('volumes_type1', quota.QUOTAS.resources)
+        vtype = volume_types.create(ctx, 'type1')
+        self.assertIn('volumes_type1', quota.QUOTAS.resources)
+        volume_types.destroy(ctx, vtype['id'])
+        self.assertNotIn('volumes_type1', quota.QUOTAS.resources)
+        self.assertEqual(0, quota.QUOTAS.hits)
+        self.assertEqual(3, quota.QUOTAS.misses)
+
+    def test_resources_expire(self):
+        self.flags(quota_resources_cache_ttl=60)
+        timeutils.set_time_override()
+        self.addCleanup(timeutils.clear_time_override)
+        engine = quota.VolumeTypeQuotaEngine()
+        ctx = context.get_admin_context()
+        engine.resources
+        vtype = db.volume_type_create(ctx, {'name': 'type1'})
+        self.addCleanup(db.volume_type_destroy, ctx, vtype['id'])
+        timeutils.advance_time_seconds(59)
+        self.assertNotIn('volumes_type1', engine.resources)
+        timeutils.advance_time_seconds(1)
+        self.assertIn('volumes_type1', engine.resources)
+
+    def test_reserve_reloads_unknown_resources(self):
+        self.flags(quota_resources_cache_ttl=60)
+        engine = quota.VolumeTypeQuotaEngine()
+        ctx = context.get_admin_context()
+        engine.resources
+        vtype = db.volume_type_create(ctx, {'name': 'type1'})
+        self.addCleanup(db.volume_type_destroy, ctx, vtype['id'])
+        engine.reserve(ctx, project_id='fake', volumes=1, volumes_type1=1)
+        self.assertEqual(2, engine.misses)
+
 
 class DbQuotaDriverTestCase(test.TestCase):
     def setUp(self):
@@ -958,7 +1008,8 @@ class DbQuotaDriverTestCase(test.TestCase):
 
     def _stub_quota_reserve(self):
         def fake_quota_reserve(context, resources, quotas, deltas, expire,
-                               until_refresh, max_age, project_id=None):
+                               until_refresh, max_age, project_id=None,
+                               defer_refresh=False):
             self.calls.append(('quota_reserve', expire, until_refresh,
                                max_age))
             return ['resv-1', 'resv-2', 'resv-3']
@@ -1066,6 +1117,9 @@ class DbQuotaDriverTestCase(test.TestCase):
 
 
 class FakeSession(object):
+    def __init__(self):
+        self.updates = []
+
     def begin(self):
         return self
 
@@ -1073,6 +1127,9 @@ class FakeSession(object):
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            for update in self.updates:
+                update()
         return False
 
 
@@ -1116,12 +1173,42 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.usages = {}
         self.usages_created = {}
         self.reservations_created = {}
+        self.usages_reserved = []
 
         def fake_get_session():
             return FakeSession()
 
-        def fake_get_quota_usages(context, session, project_id):
-            return self.usages.copy()
+        def fake_get_quota_usages(context, session, project_id,
+                                  resources=None, lock=True):
+            return dict((resource, usage)
+                        for resource, usage in self.usages.items()
+                        if resources is None or resource in resources)
+
+        def fake_quota_usage_reserve(context, session, project_id, resource,
+                                     delta, quota, max_age, defer_refresh):
+            usage = self.usages.get(resource)
+            if usage is None:
+                return False
+            if not defer_refresh and (usage.in_use < 0 or
+                                      usage.until_refresh is not None and
+                                      usage.until_refresh <= 1):
+                return False
+            if not defer_refresh and max_age and (
+                    timeutils.utcnow() - usage.updated_at >=
+                    datetime.timedelta(seconds=max_age)):
+                return False
+            if (delta >= 0 and quota >= 0 and
+                    usage.in_use + usage.reserved + delta > quota):
+                return False
+
+            def update():
+                self.usages_reserved.append(resource)
+                if delta > 0:
+                    usage.reserved += delta
+                if usage.until_refresh is not None:
+                    usage.until_refresh -= 1
+            session.updates.append(update)
+            return True
 
         def fake_quota_usage_create(context, project_id, resource, in_use,
                                     reserved, until_refresh, session=None,
@@ -1147,6 +1234,8 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
         self.stubs.Set(sqa_api, 'get_session', fake_get_session)
         self.stubs.Set(sqa_api, '_get_quota_usages', fake_get_quota_usages)
         self.stubs.Set(sqa_api, '_quota_usage_create', fake_quota_usage_create)
+        self.stubs.Set(sqa_api, '_quota_usage_reserve',
+                       fake_quota_usage_reserve)
         self.stubs.Set(sqa_api, '_reservation_create', fake_reservation_create)
 
         patcher = mock.patch.object(timeutils, 'utcnow')
@@ -1384,6 +1473,51 @@ class QuotaReserveSqlAlchemyTestCase(test.TestCase):
                                        usage_id=self.usages['gigabytes'],
                                        delta=2 * 1024), ])
 
+    def test_quota_reserve_without_lock(self):
+        self.init_usage('test_project', 'volumes', 3, 0, until_refresh=5)
+        self.init_usage('test_project', 'gigabytes', 3, 0)
+        context = FakeContext('test_project', 'test_class')
+        quotas = dict(volumes=5, gigabytes=10 * 1024, )
+        deltas = dict(volumes=2, gigabytes=2 * 1024, )
+        with mock.patch.object(sqa_api, '_get_quota_usages',
+                               wraps=sqa_api._get_quota_usages) as m:
+            sqa_api.quota_reserve(context, self.resources, quotas,
+                                  deltas, self.expire, 5, 0)
+            m.assert_called_once_with(context, mock.ANY, 'test_project',
+                                      resources=mock.ANY, lock=False)
+
+        self.assertEqual(self.sync_called, set([]))
+        self.assertEqual(set(['volumes', 'gigabytes']),
+                         set(self.usages_reserved))
+        self.compare_usage(self.usages, [dict(resource='volumes',
+                                              in_use=3,
+                                              reserved=2,
+                                              until_refresh=4),
+                                         dict(resource='gigabytes',
+                                              in_use=3,
+                                              reserved=2 * 1024,
+                                              until_refresh=None), ])
+
+    def test_quota_reserve_until_refresh_deferred(self):
+        self.init_usage('test_project', 'volumes', 3, 0, until_refresh=1)
+        self.init_usage('test_project', 'gigabytes', -1, 0)
+        context = FakeContext('test_project', 'test_class')
+        quotas = dict(volumes=5, gigabytes=10 * 1024, )
+        deltas = dict(volumes=2, gigabytes=2 * 1024, )
+        sqa_api.quota_reserve(context, self.resources, quotas,
+                              deltas, self.expire, 5, 0,
+                              defer_refresh=True)
+
+        self.assertEqual(self.sync_called, set([]))
+        self.compare_usage(self.usages, [dict(resource='volumes',
+                                              in_use=3,
+                                              reserved=2,
+                                              until_refresh=0),
+                                         dict(resource='gigabytes',
+                                              in_use=-1,
+                                              reserved=2 * 1024,
+                                              until_refresh=None), ])
+
     def test_quota_reserve_unders(self):
         self.init_usage('test_project', 'volumes', 1, 0)
         self.init_usage('test_project', 'gigabytes', 1 * 1024, 0)
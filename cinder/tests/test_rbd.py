@@ -143,6 +143,8 @@ class RBDTestCase(test.TestCase):
         self.cfg.rbd_user = None
         self.cfg.volume_dd_blocksize = '1M'
         self.cfg.rbd_store_chunk_size = 4
+        self.cfg.rados_connection_pool_size = 4
+        self.cfg.rados_connection_idle_timeout = 300
 
         mock_exec = mock.Mock()
         mock_exec.return_value = ('', '')
@@ -817,6 +819,97 @@ class RBDTestCase(test.TestCase):
         self.mock_rados.Rados.shutdown.assert_called_once()
 
 
+class FakeIoctx(object):
+    def __init__(self):
+        self.state = 'open'
+        self.closed = 0
+
+    def close(self):
+        self.closed += 1
+
+
+class FakeCluster(object):
+    def __init__(self):
+        self.state = 'connected'
+        self.shutdowns = 0
+        self.ioctxs = []
+
+    def open_ioctx(self, pool):
+        self.ioctxs.append(FakeIoctx())
+        return self.ioctxs[-1]
+
+    def shutdown(self):
+        self.shutdowns += 1
+
+
+class RADOSConnectionPoolTestCase(test.TestCase):
+    def setUp(self):
+        super(RADOSConnectionPoolTestCase, self).setUp()
+        self.connect = mock.Mock(side_effect=FakeCluster)
+        self.pool = driver.RADOSConnectionPool(self.connect, 2, 300)
+
+    def test_reuse(self):
+        cluster, ioctx = self.pool.get('rbd')
+        self.pool.put(cluster, ioctx)
+        self.assertEqual((cluster, ioctx), self.pool.get('rbd'))
+
+        # A borrowed handle is not lent twice.
+        cluster2, ioctx2 = self.pool.get('rbd')
+        self.assertNotEqual(cluster, cluster2)
+        self.assertEqual(2, self.connect.call_count)
+
+        # The ioctxs opened are kept with the handle.
+        self.pool.put(cluster, ioctx)
+        other = self.pool.get('other')
+        self.assertEqual(cluster, other[0])
+        self.pool.put(*other)
+        self.assertEqual((cluster, ioctx), self.pool.get('rbd'))
+        self.assertEqual(2, len(cluster.ioctxs))
+        self.assertEqual(0, cluster.shutdowns)
+
+    def test_max_idle(self):
+        handles = [self.pool.get('rbd') for i in range(3)]
+        for cluster, ioctx in handles:
+            self.pool.put(cluster, ioctx)
+
+        self.assertEqual(3, self.connect.call_count)
+        self.assertEqual([0, 0, 1],
+                         [cluster.shutdowns for cluster, ioctx in handles])
+        self.assertEqual(1, handles[2][1].closed)
+
+    @mock.patch('time.time')
+    def test_idle_timeout(self, mock_time):
+        mock_time.return_value = 1000
+        cluster, ioctx = self.pool.get('rbd')
+        self.pool.put(cluster, ioctx)
+
+        mock_time.return_value = 1301
+        self.assertNotEqual(cluster, self.pool.get('rbd')[0])
+        self.assertEqual(1, cluster.shutdowns)
+        self.assertEqual(1, ioctx.closed)
+
+    def test_health_check(self):
+        cluster, ioctx = self.pool.get('rbd')
+        self.pool.put(cluster, ioctx)
+        ioctx.state = 'closed'
+        self.assertEqual(cluster, self.pool.get('rbd')[0])
+        self.assertEqual(2, len(cluster.ioctxs))
+
+        self.pool.put(cluster, ioctx)
+        cluster.state = 'shutdown'
+        self.assertNotEqual(cluster, self.pool.get('rbd')[0])
+        self.assertEqual(1, cluster.shutdowns)
+
+    def test_open_ioctx_error(self):
+        cluster = FakeCluster()
+        self.connect.side_effect = [cluster]
+
+        with mock.patch.object(cluster, 'open_ioctx', side_effect=IOError):
+            self.assertRaises(IOError, self.pool.get, 'rbd')
+        self.assertEqual(1, cluster.shutdowns)
+        self.assertEqual({}, self.pool._borrowed)
+
+
 class RBDImageIOWrapperTestCase(test.TestCase):
     def setUp(self):
         super(RBDImageIOWrapperTestCase, self).setUp()
@@ -20,6 +20,7 @@ import socket
 import tempfile
 import uuid
 
+import eventlet
 import mock
 from oslo.config import cfg
 import paramiko
@@ -126,6 +127,61 @@ grep foo
             os.unlink(tmpfilename)
             os.unlink(tmpfilename2)
 
+    @mock.patch('os.geteuid', return_value=1000)
+    @mock.patch.object(utils, '_ROOTWRAP_DAEMON', None)
+    @mock.patch.object(utils.rootwrap_client, 'Client')
+    def test_execute_rootwrap_daemon(self, mock_client, mock_geteuid):
+        self.flags(use_rootwrap_daemon=True)
+        daemon = mock_client.return_value
+        daemon.execute.return_value = (0, 'out', 'err')
+
+        self.assertEqual(('out', 'err'),
+                         utils.execute('ls', 1, run_as_root=True,
+                                       process_input='in'))
+        self.assertEqual(('out', 'err'),
+                         utils.execute('ls', run_as_root=True))
+
+        mock_client.assert_called_once_with(
+            ['sudo', 'cinder-rootwrap-daemon', CONF.rootwrap_config])
+        daemon.execute.assert_has_calls([mock.call(['ls', '1'], None, 'in'),
+                                         mock.call(['ls'], None, None)])
+
+    @mock.patch('os.geteuid', return_value=1000)
+    @mock.patch.object(utils, 'get_rootwrap_daemon')
+    def test_execute_rootwrap_daemon_failure(self, mock_daemon,
+                                             mock_geteuid):
+        self.flags(use_rootwrap_daemon=True)
+        daemon = mock_daemon.return_value
+        daemon.execute.return_value = (1, 'out', 'err')
+
+        self.assertEqual(('out', 'err'),
+                         utils.execute('false', run_as_root=True,
+                                       check_exit_code=[0, 1]))
+        self.assertRaises(putils.ProcessExecutionError,
+                          utils.execute, 'false', run_as_root=True,
+                          attempts=3, delay_on_retry=False)
+        self.assertEqual(4, daemon.execute.call_count)
+        self.assertRaises(putils.UnknownArgumentError,
+                          utils.execute, 'false', run_as_root=True,
+                          this_is_not_a_valid_kwarg=True)
+
+    @mock.patch('os.geteuid', return_value=1000)
+    @mock.patch.object(utils, 'get_rootwrap_daemon')
+    @mock.patch.object(putils, 'execute')
+    def test_execute_without_rootwrap_daemon(self, mock_execute, mock_daemon,
+                                             mock_geteuid):
+        utils.execute('ls', run_as_root=True)
+        self.flags(use_rootwrap_daemon=True)
+        utils.execute('ls', run_as_root=True, root_helper='sudo')
+        utils.execute('ls')
+
+        self.assertFalse(mock_daemon.called)
+        mock_execute.assert_has_calls([
+            mock.call('ls', run_as_root=True,
+                      root_helper=utils.get_root_helper()),
+            mock.call('ls', run_as_root=True, root_helper='sudo'),
+            mock.call('ls')])
+
 
 class GetFromPathTestCase(test.TestCase):
     def test_tolerates_nones(self):
@@ -956,6 +1012,133 @@ class SSHPoolTestCase(test.TestCase):
         self.assertNotEqual(first_id, third_id)
 
 
+class LocalSSHServer(paramiko.ServerInterface):
+    """An SSH server on localhost running fake commands.
+
+    Every command takes a while and echoes itself, "fail" exits with
+    status 1.
+    """
+
+    host_key = None
+
+    def __init__(self):
+        if LocalSSHServer.host_key is None:
+            LocalSSHServer.host_key = paramiko.RSAKey.generate(1024)
+        self.running = 0
+        self.max_running = 0
+        self.transports = []
+        self.sock = eventlet.listen(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.thread = eventlet.spawn(self._serve)
+
+    def _serve(self):
+        while True:
+            conn, addr = self.sock.accept()
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=self)
+            self.transports.append(transport)
+
+    def stop(self):
+        self.thread.kill()
+        for transport in self.transports:
+            transport.close()
+        self.sock.close()
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        eventlet.spawn_n(self._run, channel, command)
+        return True
+
+    def _run(self, channel, command):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            eventlet.sleep(0.2)
+            channel.sendall(command)
+            channel.send_exit_status(1 if command == 'fail' else 0)
+        finally:
+            self.running -= 1
+            channel.close()
+
+
+class SSHPoolBatchTestCase(test.TestCase):
+    """Test SSHPool against a local SSH server."""
+
+    def setUp(self):
+        super(SSHPoolBatchTestCase, self).setUp()
+        self.server = LocalSSHServer()
+        # Connections with no socket timeout can only be closed once the
+        # server has ended them, so the pools are kept until it stops.
+        self.pools = []
+        self.addCleanup(delattr, self, 'pools')
+        self.addCleanup(self.server.stop)
+        self.addCleanup(utils._SSH_SERVER_LIMITS.clear)
+
+    def _pool(self, **kwargs):
+        pool = utils.SSHPool('127.0.0.1', self.server.port, 10, 'test',
+                             password='test', **kwargs)
+        self.pools.append(pool)
+        return pool
+
+    def test_execute_batch(self):
+        pool = self._pool(max_size=1)
+
+        results = pool.execute_batch(['lsnode', 'lsiogrp', 'lsportip'])
+
+        self.assertEqual([('lsnode', ''), ('lsiogrp', ''), ('lsportip', '')],
+                         results)
+        self.assertEqual(3, self.server.max_running)
+        stats = pool.get_stats()
+        self.assertEqual(1, stats['creations'])
+        self.assertEqual(0, stats['failures'])
+        self.assertEqual(1, stats['free'])
+
+    def test_execute_batch_max_channels(self):
+        pool = self._pool(max_size=1, max_channels=2)
+        pool.execute_batch(['lsnode'] * 4)
+        self.assertEqual(2, self.server.max_running)
+
+    def test_execute_batch_error(self):
+        pool = self._pool(max_size=1)
+        self.assertRaises(putils.ProcessExecutionError, pool.execute_batch,
+                          ['fail', 'lsnode'])
+        # The other commands are done, the connection can be used again.
+        self.assertEqual(0, self.server.running)
+        self.assertEqual([('lsnode', '')], pool.execute_batch(['lsnode']))
+        self.assertEqual(1, pool.get_stats()['creations'])
+
+    def test_max_concurrent(self):
+        pools = [self._pool(max_size=2, max_concurrent=1) for i in range(2)]
+        threads = [eventlet.spawn(pool.execute_batch, ['lsnode'])
+                   for pool in pools + pools]
+        for thread in threads:
+            thread.wait()
+
+        self.assertEqual(1, self.server.max_running)
+        stats = [pool.get_stats() for pool in pools]
+        self.assertEqual(3, sum(s['waits'] for s in stats))
+        self.assertTrue(sum(s['wait_time'] for s in stats) >= 0.2)
+        # Connections are only created when they can be used.
+        self.assertEqual(1, stats[0]['creations'])
+        self.assertEqual(1, stats[1]['creations'])
+
+    def test_connect_failure(self):
+        pool = self._pool(max_size=1)
+        self.server.stop()
+        self.assertRaises(paramiko.SSHException, pool.execute_batch,
+                          ['lsnode'])
+        self.assertEqual(1, pool.get_stats()['failures'])
+
+
 class BrickUtils(test.TestCase):
     """Unit test to test the brick utility
     wrapper functions.
@@ -990,27 +1173,27 @@ class BrickUtils(test.TestCase):
         root_helper = utils.get_root_helper()
 
         self.mox.StubOutClassWithMocks(connector, 'ISCSIConnector')
-        connector.ISCSIConnector(execute=putils.execute,
+        connector.ISCSIConnector(execute=utils.execute,
                                  driver=None,
                                  root_helper=root_helper,
                                  use_multipath=False,
                                  device_scan_attempts=3)
 
         self.mox.StubOutClassWithMocks(connector, 'FibreChannelConnector')
-        connector.FibreChannelConnector(execute=putils.execute,
+        connector.FibreChannelConnector(execute=utils.execute,
                                         driver=None,
                                         root_helper=root_helper,
                                         use_multipath=False,
                                         device_scan_attempts=3)
 
         self.mox.StubOutClassWithMocks(connector, 'AoEConnector')
-        connector.AoEConnector(execute=putils.execute,
+        connector.AoEConnector(execute=utils.execute,
                                driver=None,
                                root_helper=root_helper,
                                device_scan_attempts=3)
 
         self.mox.StubOutClassWithMocks(connector, 'LocalConnector')
-        connector.LocalConnector(execute=putils.execute,
+        connector.LocalConnector(execute=utils.execute,
                                  driver=None,
                                  root_helper=root_helper,
                                  device_scan_attempts=3)
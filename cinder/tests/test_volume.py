@@ -38,11 +38,13 @@ from cinder.brick.local_dev import lvm as brick_lvm
 from cinder import context
 from cinder import db
 from cinder import exception
+from cinder.image import cache as image_cache
 from cinder.image import image_utils
 from cinder import keymgr
 from cinder.openstack.common import fileutils
 from cinder.openstack.common import importutils
 from cinder.openstack.common import jsonutils
+from cinder.openstack.common import processutils
 from cinder.openstack.common import timeutils
 from cinder.openstack.common import units
 import cinder.policy
@@ -240,6 +242,42 @@ class VolumeTestCase(BaseVolumeTestCase):
         self.assertEqual(volume['status'], "error")
         self.volume.delete_volume(self.context, volume_id)
 
+    def test_init_host_ensure_exports(self):
+        volumes = [tests_utils.create_volume(self.context, status='in-use',
+                                             size=size, host=CONF.host)
+                   for size in (1, 2)]
+        tests_utils.create_volume(self.context, status='available', size=4,
+                                  host=CONF.host)
+        with mock.patch.object(self.volume.driver, 'ensure_exports',
+                               return_value={volumes[1]['id']:
+                                             Exception()}) as ensure_exports:
+            self.volume.init_host()
+            exported = ensure_exports.call_args[0][1]
+        self.assertEqual(sorted(volume['id'] for volume in volumes),
+                         sorted(volume['id'] for volume in exported))
+        self.assertEqual(3, self.volume.stats['allocated_capacity_gb'])
+        self.assertEqual('in-use', db.volume_get(self.context,
+                                                 volumes[0]['id'])['status'])
+        self.assertEqual('error', db.volume_get(self.context,
+                                                volumes[1]['id'])['status'])
+
+    def test_ensure_exports(self):
+        self.flags(ensure_export_workers=4)
+        volumes = [{'id': i} for i in range(8)]
+        exported = []
+
+        def fake_ensure_export(context, volume):
+            if volume['id'] == 3:
+                raise exception.VolumeBackendAPIException(data='')
+            eventlet.sleep(0)
+            exported.append(volume['id'])
+
+        self.stubs.Set(self.volume.driver, 'ensure_export',
+                       fake_ensure_export)
+        failed = self.volume.driver.ensure_exports(self.context, volumes)
+        self.assertEqual([3], failed.keys())
+        self.assertEqual([0, 1, 2, 4, 5, 6, 7], sorted(exported))
+
     def test_init_host_resumes_deletes(self):
         """init_host will resume deleting volume in deleting status."""
         volume = tests_utils.create_volume(self.context, status='deleting',
@@ -495,6 +533,64 @@ class VolumeTestCase(BaseVolumeTestCase):
                                    volume_type=db_vol_type)
         self.assertEqual(volume['volume_type_id'], db_vol_type.get('id'))
 
+    @mock.patch('cinder.scheduler.rpcapi.SchedulerAPI.create_volumes')
+    def test_create_volumes(self, _mock_create_volumes):
+        """Test creating several volumes with one scheduler request."""
+        volume_api = cinder.volume.api.API()
+
+        volumes = volume_api.create_volumes(self.context, 3, 1, 'name',
+                                            'description')
+
+        self.assertEqual(3, len(volumes))
+        volume_ids = [volume['id'] for volume in volumes]
+        for volume_id in volume_ids:
+            volume = db.volume_get(self.context, volume_id)
+            self.assertEqual('creating', volume['status'])
+            self.assertIsNone(volume['host'])
+        self.assertEqual(1, _mock_create_volumes.call_count)
+        args, kwargs = _mock_create_volumes.call_args
+        self.assertEqual((self.context, CONF.volume_topic, volume_ids), args)
+        request_spec = kwargs['request_spec']
+        self.assertEqual(1, request_spec['volume_properties']['size'])
+        self.assertIsNone(request_spec['volume_id'])
+        self.assertEqual({}, kwargs['filter_properties'])
+
+    @mock.patch('cinder.scheduler.rpcapi.SchedulerAPI.create_volumes')
+    def test_create_volumes_rolls_back_on_failure(self, _mock_create_volumes):
+        """Test volumes of a failed batch are deleted again."""
+        created = []
+
+        def fake_reserve(context, expire=None, project_id=None, **deltas):
+            if deltas['volumes'] > 0:
+                if len(created) == 2:
+                    raise exception.VolumeLimitExceeded(allowed=2)
+                created.append(deltas)
+            return ["RESERVATION"]
+
+        def fake_commit(context, reservations, project_id=None):
+            pass
+
+        def fake_rollback(context, reservations, project_id=None):
+            pass
+
+        self.stubs.Set(QUOTAS, "reserve", fake_reserve)
+        self.stubs.Set(QUOTAS, "commit", fake_commit)
+        self.stubs.Set(QUOTAS, "rollback", fake_rollback)
+        volume_api = cinder.volume.api.API()
+
+        self.assertRaises(exception.VolumeLimitExceeded,
+                          volume_api.create_volumes,
+                          self.context, 3, 1, 'name', 'description')
+        self.assertEqual([], db.volume_get_all(self.context, None, None,
+                                               'created_at', 'desc'))
+        self.assertFalse(_mock_create_volumes.called)
+
+    def test_create_volumes_invalid_count(self):
+        volume_api = cinder.volume.api.API()
+        self.assertRaises(exception.InvalidInput,
+                          volume_api.create_volumes,
+                          self.context, 0, 1, 'name', 'description')
+
     def test_create_volume_with_encrypted_volume_type(self):
         self.stubs.Set(keymgr, "API", fake_keymgr.fake_api)
 
@@ -2996,6 +3092,34 @@ class GetActiveByWindowTestCase(BaseVolumeTestCase):
         self.assertEqual(snapshots[2].id, u'4')
         self.assertEqual(snapshots[2].volume.id, u'1')
 
+    def test_volume_get_active_by_window_pages(self):
+        for attrs in self.db_attrs:
+            db.volume_create(self.ctx, attrs)
+        begin = datetime.datetime(1, 3, 1, 1, 1, 1)
+        end = datetime.datetime(1, 4, 1, 1, 1, 1)
+
+        volumes = db.volume_get_active_by_window(self.ctx, begin, end,
+                                                 limit=2, columns=['id'])
+        self.assertEqual([u'2', u'3'], [volume.id for volume in volumes])
+        volumes = db.volume_get_active_by_window(self.ctx, begin, end,
+                                                 marker=u'3', limit=2)
+        self.assertEqual([u'4'], [volume.id for volume in volumes])
+
+    def test_snapshot_get_active_by_window_pages(self):
+        db.volume_create(self.context, {'id': 1,
+                                        'availability_zone': 'zone1'})
+        for attrs in self.db_attrs:
+            attrs['volume_id'] = 1
+            db.snapshot_create(self.ctx, attrs)
+        begin = datetime.datetime(1, 3, 1, 1, 1, 1)
+        end = datetime.datetime(1, 4, 1, 1, 1, 1)
+
+        snapshots = db.snapshot_get_active_by_window(
+            self.ctx, begin, end, marker=u'2', limit=1,
+            columns=['id', 'volume_id'])
+        self.assertEqual([u'3'], [snapshot.id for snapshot in snapshots])
+        self.assertEqual('zone1', snapshots[0].volume.availability_zone)
+
 
 class DriverTestCase(test.TestCase):
     """Base Test class for Drivers."""
@@ -3117,6 +3241,23 @@ class LVMISCSIVolumeDriverTestCase(DriverTestCase):
     """Test case for VolumeDriver"""
     driver_name = "cinder.volume.drivers.lvm.LVMISCSIDriver"
 
+    def test_ensure_exports(self):
+        volumes = [{'id': 1, 'name': 'volume-1'},
+                   {'id': 2, 'name': 'volume-2'}]
+        drv = self.volume.driver
+        with contextlib.nested(
+                mock.patch.object(drv.target_helper, 'get_missing_exports',
+                                  return_value=volumes[1:]),
+                mock.patch.object(drv, 'ensure_export')) as (missing,
+                                                             ensure_export):
+            self.assertEqual({}, drv.ensure_exports(self.context, volumes))
+            ensure_export.assert_called_once_with(self.context, volumes[1])
+
+            missing.side_effect = processutils.ProcessExecutionError
+            ensure_export.reset_mock()
+            drv.ensure_exports(self.context, volumes)
+            self.assertEqual(2, ensure_export.call_count)
+
     def test_delete_busy_volume(self):
         """Test deleting a busy volume."""
         self.stubs.Set(self.volume.driver, '_volume_not_present',
@@ -3387,6 +3528,84 @@ class LVMVolumeDriverTestCase(DriverTestCase):
 
         lvm_driver._delete_volume(fake_snapshot, is_snapshot=True)
 
+    @mock.patch.object(volutils, 'clear_volume')
+    def test_delete_volume_clear_queued(self, mock_clear):
+        configuration = conf.Configuration(fake_opt, 'fake_group')
+        configuration.volume_clear = 'zero'
+        configuration.volume_clear_size = 0
+        configuration.volume_clear_workers = 1
+        configuration.volume_clear_queue_size = 1
+        vg = mock.Mock()
+        lvm_driver = lvm.LVMVolumeDriver(configuration=configuration,
+                                         vg_obj=vg)
+        volume = dict(self.FAKE_VOLUME, size=1)
+        other = {'name': 'test2', 'id': 'test2', 'size': 1}
+
+        with mock.patch('eventlet.greenthread.spawn_n') as spawn_n:
+            with mock.patch.object(lvm_driver, '_clear_volume') as clear:
+                lvm_driver._delete_volume(volume)
+                # The queue is full, the next volume is cleared in place.
+                lvm_driver._delete_volume(other)
+        clear.assert_called_once_with(other, False)
+        vg.rename_volume.assert_called_once_with('test1', 'clear-test1')
+        self.assertEqual([mock.call('test2')], vg.delete.call_args_list)
+        self.assertEqual(1, lvm_driver.get_volume_stats(
+            refresh=True)['pending_volume_clears'])
+
+        # Run the queued clear.
+        spawn_n.call_args[0][0](*spawn_n.call_args[0][1:])
+        mock_clear.assert_called_once_with(
+            units.Ki, '/dev/mapper/cinder--volumes-clear--test1',
+            volume_clear='zero', volume_clear_size=0)
+        vg.delete.assert_called_with('clear-test1')
+        self.assertEqual(set(), lvm_driver._pending_clears)
+
+    @mock.patch.object(volutils, 'clear_volume')
+    @mock.patch('eventlet.greenthread.spawn_n')
+    def test_resume_clears(self, spawn_n, mock_clear):
+        configuration = conf.Configuration(fake_opt, 'fake_group')
+        configuration.volume_clear = 'zero'
+        configuration.volume_clear_size = 0
+        vg = mock.Mock()
+        vg.get_volumes.return_value = [
+            {'vg': 'cinder-volumes', 'name': 'volume-1', 'size': '1.00'},
+            {'vg': 'cinder-volumes', 'name': 'clear-volume-2',
+             'size': '2.00'}]
+        lvm_driver = lvm.LVMVolumeDriver(configuration=configuration,
+                                         vg_obj=vg)
+
+        lvm_driver._resume_clears()
+
+        # Clears left over by a restart are resumed even when deletes
+        # clear volumes in place.
+        spawn_n.assert_called_once_with(lvm_driver._clear_and_delete,
+                                        'clear-volume-2', 2)
+        self.assertEqual(set(['clear-volume-2']), lvm_driver._pending_clears)
+
+    @mock.patch.object(image_utils, 'fetch_to_raw')
+    @mock.patch('cinder.image.cache.ImageCache.fetch_to_raw')
+    def test_copy_image_to_volume_cached(self, mock_cached, mock_fetch):
+        configuration = conf.Configuration(fake_opt, 'fake_group')
+        configuration.image_cache_size_gb = 1
+        configuration.image_cache_dir = '/fake/cache'
+        lvm_driver = lvm.LVMVolumeDriver(configuration=configuration,
+                                         vg_obj=mock.Mock())
+        volume = dict(self.FAKE_VOLUME, size=1)
+
+        lvm_driver.copy_image_to_volume('ctxt', volume, 'image_service',
+                                        'image_id')
+
+        mock_cached.assert_called_once_with(
+            'ctxt', 'image_service', 'image_id',
+            '/dev/mapper/cinder--volumes-test1',
+            configuration.volume_dd_blocksize, size=1)
+        self.assertFalse(mock_fetch.called)
+        cache = lvm_driver._get_image_cache()
+        self.assertEqual('/fake/cache/fake_group', cache.path)
+        self.assertEqual(units.Gi, cache.max_size)
+        stats = lvm_driver.get_volume_stats(refresh=True)
+        self.assertEqual(0, stats['image_cache_stats']['hits'])
+
 
 class ISCSITestCase(DriverTestCase):
     """Test Case for ISCSIDriver"""
@@ -3532,6 +3751,17 @@ class ISERTestCase(ISCSITestCase):
         self.assertEqual(stats['total_capacity_gb'], 'infinite')
         self.assertEqual(stats['free_capacity_gb'], 'infinite')
         self.assertEqual(stats['storage_protocol'], 'iSER')
+        self.assertNotIn('image_cache_stats', stats)
+
+    def test_get_volume_stats_image_cache(self):
+        iser_driver = self.base_driver(configuration=self.configuration)
+        iser_driver._image_cache = image_cache.ImageCache('/fake/cache',
+                                                          units.Gi)
+
+        stats = iser_driver.get_volume_stats(refresh=True)
+
+        self.assertEqual(0, stats['image_cache_stats']['misses'])
+        self.assertEqual(1.0, stats['image_cache_stats']['max_size_gb'])
 
 
 class FibreChannelTestCase(DriverTestCase):
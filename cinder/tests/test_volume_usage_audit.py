@@ -0,0 +1,139 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""Tests for the volume usage audit."""
+
+import datetime
+import os
+import shutil
+import tempfile
+
+import mock
+
+from cinder import context
+from cinder import db
+from cinder.openstack.common import jsonutils
+from cinder import test
+from cinder.tests import fake_notifier
+from cinder.volume import usage_audit
+
+
+BEGIN = datetime.datetime(2014, 3, 1)
+END = datetime.datetime(2014, 4, 1)
+
+
+class UsageAuditTestCase(test.TestCase):
+
+    def setUp(self):
+        super(UsageAuditTestCase, self).setUp()
+        fake_notifier.reset()
+        self.context = context.get_admin_context(read_deleted='yes')
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.checkpoint_file = os.path.join(self.tmpdir, 'checkpoint')
+
+        before = datetime.datetime(2014, 1, 1)
+        during = datetime.datetime(2014, 3, 10)
+        for volume_id, created_at, deleted_at in (
+                ('1', before, None),
+                ('2', during, None),
+                ('3', before, during),
+                ('4', before, before)):
+            db.volume_create(self.context, {'id': volume_id,
+                                            'project_id': 'p1',
+                                            'created_at': created_at,
+                                            'deleted_at': deleted_at,
+                                            'deleted': bool(deleted_at)})
+        db.snapshot_create(self.context, {'id': '1', 'volume_id': '1',
+                                          'project_id': 'p1',
+                                          'created_at': during})
+
+    def _audit(self, **kwargs):
+        kwargs.setdefault('checkpoint_file', self.checkpoint_file)
+        return usage_audit.UsageAudit(self.context, BEGIN, END,
+                                      batch_size=2, **kwargs)
+
+    def _events(self):
+        return sorted((msg['event_type'], msg['payload'].get('snapshot_id') or
+                       msg['payload']['volume_id'])
+                      for msg in fake_notifier.NOTIFICATIONS)
+
+    def test_run(self):
+        stats = self._audit().run()
+
+        self.assertEqual([('snapshot.exists', '1'),
+                          ('volume.exists', '1'),
+                          ('volume.exists', '2'),
+                          ('volume.exists', '3')], self._events())
+        self.assertEqual(3, stats['volumes'])
+        self.assertEqual(1, stats['snapshots'])
+        self.assertEqual(4, stats['sent'])
+        self.assertEqual(0, stats['failed'])
+        self.assertFalse(os.path.exists(self.checkpoint_file))
+
+    def test_run_send_actions(self):
+        self._audit(send_actions=True).run()
+
+        self.assertEqual([('snapshot.create.end', '1'),
+                          ('snapshot.create.start', '1'),
+                          ('snapshot.exists', '1'),
+                          ('volume.create.end', '2'),
+                          ('volume.create.start', '2'),
+                          ('volume.delete.end', '3'),
+                          ('volume.delete.start', '3'),
+                          ('volume.exists', '1'),
+                          ('volume.exists', '2'),
+                          ('volume.exists', '3')], self._events())
+
+    def test_run_resumes_from_checkpoint(self):
+        with open(self.checkpoint_file, 'w') as f:
+            f.write(jsonutils.dumps({'begin': str(BEGIN), 'end': str(END),
+                                     'kind': 'volumes', 'marker': '2'}))
+
+        stats = self._audit().run()
+
+        self.assertEqual([('snapshot.exists', '1'),
+                          ('volume.exists', '3')], self._events())
+        self.assertEqual(1, stats['volumes'])
+
+    def test_run_ignores_checkpoint_of_other_period(self):
+        with open(self.checkpoint_file, 'w') as f:
+            f.write(jsonutils.dumps({'begin': str(END), 'end': str(END),
+                                     'kind': 'snapshots', 'marker': '1'}))
+
+        stats = self._audit().run()
+
+        self.assertEqual(3, stats['volumes'])
+        self.assertEqual(1, stats['snapshots'])
+
+    @mock.patch('cinder.db.snapshot_get_active_by_window')
+    def test_run_records_checkpoint(self, get_snapshots):
+        get_snapshots.side_effect = KeyboardInterrupt
+
+        self.assertRaises(KeyboardInterrupt, self._audit().run)
+
+        with open(self.checkpoint_file) as f:
+            checkpoint = jsonutils.loads(f.read())
+        self.assertEqual({'begin': str(BEGIN), 'end': str(END),
+                          'kind': 'volumes', 'marker': '3'}, checkpoint)
+
+    @mock.patch('cinder.volume.utils.notify_about_volume_usage')
+    def test_run_notify_error(self, notify):
+        notify.side_effect = [Exception('fake'), None, None]
+
+        stats = self._audit(workers=1).run()
+
+        self.assertEqual(3, notify.call_count)
+        self.assertEqual(3, stats['sent'])
+        self.assertEqual(1, stats['failed'])
@@ -15,6 +15,7 @@
 
 """Tests For miscellaneous util methods used with volume."""
 
+import functools
 import mock
 import os
 import re
@@ -27,6 +28,7 @@ from cinder import exception
 from cinder.openstack.common import importutils
 from cinder.openstack.common import log as logging
 from cinder.openstack.common import processutils
+from cinder.openstack.common import units
 from cinder import test
 from cinder.tests import fake_notifier
 from cinder import utils
@@ -183,6 +185,87 @@ class ClearVolumeTestCase(test.TestCase):
                           volume_utils.clear_volume,
                           1024, "volume_path")
 
+    @mock.patch.dict(volume_utils._CLEAR_STATS, clear=True)
+    @mock.patch('cinder.volume.utils.copy_volume')
+    @mock.patch('cinder.utils.execute')
+    @mock.patch('cinder.volume.utils._get_block_queue_limit')
+    def test_clear_volume_discard(self, mock_limit, mock_execute,
+                                  mock_copy):
+        mock_limit.side_effect = lambda path, name: 1
+        mock_execute.return_value = ('\0' * units.Mi, '')
+
+        volume_utils.clear_volume(1024, "volume_path", volume_clear='discard',
+                                  volume_clear_size=0)
+
+        self.assertEqual(
+            [mock.call('blkdiscard', '-o', '0', '-l', str(units.Gi),
+                       'volume_path', run_as_root=True),
+             mock.call('dd', 'if=volume_path', 'bs=1M', 'count=1', 'skip=0',
+                       'iflag=direct', run_as_root=True),
+             mock.call('dd', 'if=volume_path', 'bs=1M', 'count=1',
+                       'skip=512', 'iflag=direct', run_as_root=True),
+             mock.call('dd', 'if=volume_path', 'bs=1M', 'count=1',
+                       'skip=1023', 'iflag=direct', run_as_root=True)],
+            mock_execute.call_args_list)
+        self.assertFalse(mock_copy.called)
+        stats = volume_utils.get_clear_stats()
+        self.assertEqual(['discard'], stats.keys())
+        self.assertEqual(1, stats['discard']['count'])
+        self.assertEqual(1024, stats['discard']['mb'])
+
+    @mock.patch.dict(volume_utils._CLEAR_STATS, clear=True)
+    @mock.patch('cinder.volume.utils.copy_volume')
+    @mock.patch('cinder.utils.execute')
+    @mock.patch('cinder.volume.utils._get_block_queue_limit')
+    def test_clear_volume_discard_zeroout(self, mock_limit, mock_execute,
+                                          mock_copy):
+        limits = {'discard_max_bytes': 1, 'write_zeroes_max_bytes': 1}
+        mock_limit.side_effect = lambda path, name: limits.get(name, 0)
+        mock_execute.return_value = ('\0' * units.Mi, '')
+
+        volume_utils.clear_volume(1024, "volume_path", volume_clear='discard',
+                                  volume_clear_size=1)
+
+        self.assertEqual(
+            mock.call('blkdiscard', '-o', '0', '-l', str(units.Mi), '-z',
+                      'volume_path', run_as_root=True),
+            mock_execute.call_args_list[0])
+        self.assertEqual(2, mock_execute.call_count)
+        self.assertFalse(mock_copy.called)
+        self.assertEqual(['zeroout'], volume_utils.get_clear_stats().keys())
+
+    @mock.patch.dict(volume_utils._CLEAR_STATS, clear=True)
+    @mock.patch('cinder.volume.utils.copy_volume')
+    @mock.patch('cinder.utils.execute')
+    @mock.patch('cinder.volume.utils._get_block_queue_limit')
+    def test_clear_volume_discard_fallback(self, mock_limit, mock_execute,
+                                           mock_copy):
+        mock_limit.side_effect = lambda path, name: 1
+        clear_volume = functools.partial(
+            volume_utils.clear_volume, 1024, "volume_path",
+            volume_clear='discard', volume_clear_size=0,
+            volume_clear_ionice='-c3')
+
+        # Discarded blocks that don't read as zeros are written over.
+        mock_execute.return_value = ('\1' * units.Mi, '')
+        clear_volume()
+
+        # So is a device that fails to discard.
+        mock_execute.side_effect = processutils.ProcessExecutionError
+        clear_volume()
+
+        # And one that does not support discard at all.
+        mock_limit.side_effect = lambda path, name: 0
+        mock_execute.reset_mock()
+        clear_volume()
+        self.assertFalse(mock_execute.called)
+
+        copy_call = mock.call("/dev/zero", "volume_path", 1024,
+                              CONF.volume_dd_blocksize, sync=True,
+                              ionice='-c3', execute=utils.execute)
+        self.assertEqual([copy_call] * 3, mock_copy.call_args_list)
+        self.assertEqual(3, volume_utils.get_clear_stats()['zero']['count'])
+
     def test_clear_volume_lvm_snap(self):
         self.stubs.Set(os.path, 'exists', lambda x: True)
         CONF.volume_clear = 'zero'
@@ -204,6 +287,8 @@ class ClearVolumeTestCase(test.TestCase):
 class CopyVolumeTestCase(test.TestCase):
 
     def test_copy_volume_dd_iflag_and_oflag(self):
+        self.flags(volume_copy_engine='dd')
+
         def fake_utils_execute(*cmd, **kwargs):
             if 'if=/dev/zero' in cmd and 'iflag=direct' in cmd:
                 raise processutils.ProcessExecutionError()
@@ -216,6 +301,43 @@ class CopyVolumeTestCase(test.TestCase):
                                  CONF.volume_dd_blocksize, sync=True,
                                  ionice=None, execute=fake_utils_execute)
 
+    @mock.patch('cinder.volume.block_copy.can_copy', return_value=True)
+    @mock.patch('cinder.volume.block_copy.copy')
+    def test_copy_volume_native(self, mock_copy, mock_can_copy):
+        self.flags(volume_copy_bps_limit=100, volume_copy_workers=2)
+        execute = mock.Mock()
+
+        volume_utils.copy_volume('/dev/zero', '/dev/null', 1024, '1M',
+                                 sync=True, execute=execute)
+        volume_utils.copy_volume('/dev/zero', '/dev/null', 1024, '16M',
+                                 execute=execute)
+
+        mock_copy.assert_has_calls([
+            mock.call('/dev/zero', '/dev/null', units.Gi, 4 * units.Mi,
+                      workers=2, bps_limit=100, sync=True),
+            mock.call('/dev/zero', '/dev/null', units.Gi, 16 * units.Mi,
+                      workers=2, bps_limit=100, sync=False)])
+        self.assertFalse(execute.called)
+
+    @mock.patch('cinder.volume.block_copy.can_copy')
+    @mock.patch('cinder.volume.block_copy.copy')
+    def test_copy_volume_native_fallback(self, mock_copy, mock_can_copy):
+        def fake_execute(*cmd, **kwargs):
+            commands.append(cmd)
+
+        # Devices only root can open, a copy that fails and ionice are
+        # left to dd.
+        mock_can_copy.side_effect = [False, True, True]
+        mock_copy.side_effect = OSError(13, 'Permission denied')
+        commands = []
+        for ionice in (None, None, '-c3'):
+            volume_utils.copy_volume('/dev/zero', '/dev/null', 1, '1M',
+                                     execute=fake_execute, ionice=ionice)
+        self.assertEqual(1, mock_copy.call_count)
+        dd = [cmd for cmd in commands if 'count=1' in cmd]
+        self.assertEqual(3, len(dd))
+        self.assertEqual('ionice', dd[-1][0])
+
 
 class BlkioCgroupTestCase(test.TestCase):
 
@@ -22,6 +22,7 @@ import contextlib
 import datetime
 import hashlib
 import inspect
+import logging as stdlib_logging
 import os
 import pyclbr
 import re
@@ -29,9 +30,13 @@ import shutil
 import stat
 import sys
 import tempfile
+import time
 
 from Crypto.Random import random
+from eventlet import greenpool
+from eventlet import greenthread
 from eventlet import pools
+from eventlet import semaphore
 from oslo.config import cfg
 import paramiko
 import six
@@ -50,6 +55,11 @@ from cinder.openstack.common import log as logging
 from cinder.openstack.common import processutils
 from cinder.openstack.common import timeutils
 
+try:
+    from oslo.rootwrap import client as rootwrap_client
+except ImportError:
+    rootwrap_client = None
+
 
 CONF = cfg.CONF
 LOG = logging.getLogger(__name__)
@@ -131,12 +141,63 @@ def check_exclusive_options(**kwargs):
 
 
 def execute(*cmd, **kwargs):
-    """Convenience wrapper around oslo's execute() method."""
+    """Convenience wrapper around oslo's execute() method.
+
+    Commands run as root with cinder's own root helper go through the
+    rootwrap daemon if use_rootwrap_daemon is set.
+    """
     if 'run_as_root' in kwargs and not 'root_helper' in kwargs:
         kwargs['root_helper'] = get_root_helper()
+    if (kwargs.get('run_as_root') and CONF.use_rootwrap_daemon and
+            kwargs['root_helper'] == get_root_helper() and
+            not kwargs.get('shell') and os.geteuid() != 0):
+        return _execute_with_rootwrap_daemon(*cmd, **kwargs)
     return processutils.execute(*cmd, **kwargs)
 
 
+def _execute_with_rootwrap_daemon(*cmd, **kwargs):
+    """Run cmd through the rootwrap daemon, like processutils.execute()."""
+    process_input = kwargs.pop('process_input', None)
+    env_variables = kwargs.pop('env_variables', None)
+    check_exit_code = kwargs.pop('check_exit_code', [0])
+    ignore_exit_code = False
+    delay_on_retry = kwargs.pop('delay_on_retry', True)
+    attempts = kwargs.pop('attempts', 1)
+    loglevel = kwargs.pop('loglevel', stdlib_logging.DEBUG)
+    for key in ('run_as_root', 'root_helper', 'shell'):
+        kwargs.pop(key, None)
+
+    if isinstance(check_exit_code, bool):
+        ignore_exit_code = not check_exit_code
+        check_exit_code = [0]
+    elif isinstance(check_exit_code, int):
+        check_exit_code = [check_exit_code]
+
+    if kwargs:
+        raise processutils.UnknownArgumentError(
+            _('Got unknown keyword args to utils.execute: %r') % kwargs)
+
+    cmd = map(str, cmd)
+    daemon = get_rootwrap_daemon()
+    while attempts > 0:
+        attempts -= 1
+        LOG.log(loglevel, 'Running cmd (rootwrap daemon): %s',
+                logging.mask_password(' '.join(cmd)))
+        returncode, stdout, stderr = daemon.execute(cmd, env_variables,
+                                                    process_input)
+        LOG.log(loglevel, 'Result was %s' % returncode)
+        if ignore_exit_code or returncode in check_exit_code:
+            return stdout, stderr
+        if not attempts:
+            raise processutils.ProcessExecutionError(exit_code=returncode,
+                                                     stdout=stdout,
+                                                     stderr=stderr,
+                                                     cmd=' '.join(cmd))
+        LOG.log(loglevel, '%r failed. Retrying.', cmd)
+        if delay_on_retry:
+            greenthread.sleep(random.randint(20, 200) / 100.0)
+
+
 def check_ssh_injection(cmd_list):
     ssh_injection_pattern = ['`', '$', '|', '||', ';', '&', '&&', '>', '>>',
                              '<']
@@ -179,8 +240,19 @@ def create_channel(client, width, height):
     return channel
 
 
+# Limits on the connections in use to each SSH server, shared by pools.
+_SSH_SERVER_LIMITS = {}
+
+
 class SSHPool(pools.Pool):
-    """A simple eventlet pool to hold ssh connections."""
+    """A simple eventlet pool to hold ssh connections.
+
+    Besides the pool options, max_concurrent limits the connections in use
+    at once to ip and port by all the pools, so that backends sharing a
+    storage controller stay within its session limit; the first pool sets
+    it.  max_channels is the number of commands execute_batch runs at once
+    over a connection.
+    """
 
     def __init__(self, ip, port, conn_timeout, login, password=None,
                  privatekey=None, *args, **kwargs):
@@ -190,6 +262,16 @@ class SSHPool(pools.Pool):
         self.password = password
         self.conn_timeout = conn_timeout if conn_timeout else None
         self.privatekey = privatekey
+        self.creations = 0
+        self.failures = 0
+        self.waits = 0
+        self.wait_time = 0.0
+        max_concurrent = kwargs.pop('max_concurrent', 0)
+        self.limit = None
+        if max_concurrent:
+            self.limit = _SSH_SERVER_LIMITS.setdefault(
+                (ip, port), semaphore.Semaphore(max_concurrent))
+        self.max_channels = kwargs.pop('max_channels', 10)
         if 'missing_key_policy' in kwargs.keys():
             self.missing_key_policy = kwargs.pop('missing_key_policy')
         else:
@@ -237,8 +319,10 @@ class SSHPool(pools.Pool):
                 transport = ssh.get_transport()
                 transport.sock.settimeout(None)
                 transport.set_keepalive(self.conn_timeout)
+            self.creations += 1
             return ssh
         except Exception as e:
+            self.failures += 1
             msg = _("Error connecting via ssh: %s") % e
             LOG.error(msg)
             raise paramiko.SSHException(msg)
@@ -251,7 +335,11 @@ class SSHPool(pools.Pool):
 
         For dead connections create and return a new connection.
         """
+        start = time.time()
+        if not self.free_items and self.current_size >= self.max_size:
+            self.waits += 1
         conn = super(SSHPool, self).get()
+        self.wait_time += time.time() - start
         if conn:
             if conn.get_transport().is_active():
                 return conn
@@ -268,6 +356,57 @@ class SSHPool(pools.Pool):
         if self.current_size > 0:
             self.current_size -= 1
 
+    @contextlib.contextmanager
+    def item(self):
+        """Get a connection out of the pool, within max_concurrent."""
+        if self.limit is None:
+            with super(SSHPool, self).item() as ssh:
+                yield ssh
+            return
+        start = time.time()
+        if self.limit.locked():
+            self.waits += 1
+        with self.limit:
+            self.wait_time += time.time() - start
+            with super(SSHPool, self).item() as ssh:
+                yield ssh
+
+    def execute_batch(self, commands, check_exit_code=True):
+        """Run several commands over one connection, in one round-trip.
+
+        Every command runs in its own channel of the connection, at most
+        max_channels at once, so their requests and replies are pipelined.
+        Commands that change state should not be batched, as they do not
+        run in order.
+
+        :returns: a list of (stdout, stderr), in the order of commands
+        :raises: the first error of a command, once all of them are done
+        """
+        with self.item() as ssh:
+            pool = greenpool.GreenPool(self.max_channels)
+            threads = [pool.spawn(processutils.ssh_execute, ssh, command,
+                                  check_exit_code=check_exit_code)
+                       for command in commands]
+            results = []
+            error = None
+            for thread in threads:
+                try:
+                    results.append(thread.wait())
+                except Exception as e:
+                    error = error or e
+            if error is not None:
+                raise error
+            return results
+
+    def get_stats(self):
+        """Returns the size of the pool and how often it was waited for."""
+        return {'size': self.current_size,
+                'free': len(self.free_items),
+                'creations': self.creations,
+                'failures': self.failures,
+                'waits': self.waits,
+                'wait_time': self.wait_time}
+
 
 def cinderdir():
     import cinder
@@ -727,6 +866,28 @@ def get_root_helper():
     return 'sudo cinder-rootwrap %s' % CONF.rootwrap_config
 
 
+_ROOTWRAP_DAEMON = None
+
+
+@synchronized('rootwrap-daemon')
+def get_rootwrap_daemon():
+    """Return the client of this process' rootwrap daemon.
+
+    The daemon is started with sudo on the first command, loads the
+    rootwrap filters once and applies them to every command it is sent
+    over its UNIX socket.  It is restarted if it dies.
+    """
+    global _ROOTWRAP_DAEMON
+    if _ROOTWRAP_DAEMON is None:
+        if rootwrap_client is None:
+            raise exception.CinderException(
+                _('use_rootwrap_daemon requires oslo.rootwrap 1.3.0 or '
+                  'later'))
+        _ROOTWRAP_DAEMON = rootwrap_client.Client(
+            ['sudo', 'cinder-rootwrap-daemon', CONF.rootwrap_config])
+    return _ROOTWRAP_DAEMON
+
+
 def brick_get_connector_properties():
     """wrapper for the brick calls to automatically set
     the root_helper needed for cinder.
@@ -738,7 +899,7 @@ def brick_get_connector_properties():
 
 
 def brick_get_connector(protocol, driver=None,
-                        execute=processutils.execute,
+                        execute=execute,
                         use_multipath=False,
                         device_scan_attempts=3,
                         *args, **kwargs):
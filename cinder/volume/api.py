@@ -149,6 +149,16 @@ class API(base.Base):
             azs = self.availability_zones
         return tuple(azs)
 
+    def _get_valid_availability_zones(self):
+        # Determine the valid availability zones that the volume could be
+        # created in (a task in the flow will/can use this information to
+        # ensure that the availability zone requested is valid).
+        raw_zones = self.list_availability_zones(enable_cache=True)
+        availability_zones = set([az['name'] for az in raw_zones])
+        if CONF.storage_availability_zone:
+            availability_zones.add(CONF.storage_availability_zone)
+        return availability_zones
+
     def create(self, context, size, name, description, snapshot=None,
                image_id=None, volume_type=None, metadata=None,
                availability_zone=None, source_volume=None,
@@ -168,13 +178,7 @@ class API(base.Base):
                         "You should omit the argument.")
                 raise exception.InvalidInput(reason=msg)
 
-        # Determine the valid availability zones that the volume could be
-        # created in (a task in the flow will/can use this information to
-        # ensure that the availability zone requested is valid).
-        raw_zones = self.list_availability_zones(enable_cache=True)
-        availability_zones = set([az['name'] for az in raw_zones])
-        if CONF.storage_availability_zone:
-            availability_zones.add(CONF.storage_availability_zone)
+        availability_zones = self._get_valid_availability_zones()
 
         create_what = {
             'context': context,
@@ -211,6 +215,100 @@ class API(base.Base):
             flow_engine.run()
             return flow_engine.storage.fetch('volume')
 
+    def create_volumes(self, context, count, size, name, description,
+                       image_id=None, volume_type=None, metadata=None,
+                       availability_zone=None, scheduler_hints=None):
+        """Create several identical volumes with one scheduling request.
+
+        Every volume is validated, reserved against the quota and stored in
+        the database like create() does, but the volumes are then handed to
+        the scheduler as a single batch.  If any of the volumes can not be
+        created the ones created so far are deleted again.
+
+        :returns: the list of created volumes
+        """
+        if count < 1:
+            msg = _("Number of volumes to create must be at least 1.")
+            raise exception.InvalidInput(reason=msg)
+
+        availability_zones = self._get_valid_availability_zones()
+
+        volumes = []
+        request_spec = None
+        try:
+            for i in xrange(count):
+                create_what = {
+                    'context': context,
+                    'raw_size': size,
+                    'name': name,
+                    'description': description,
+                    'snapshot': None,
+                    'image_id': image_id,
+                    'raw_volume_type': volume_type,
+                    'metadata': metadata,
+                    'raw_availability_zone': availability_zone,
+                    'source_volume': None,
+                    'scheduler_hints': scheduler_hints,
+                    'key_manager': self.key_manager,
+                    'backup_source_volume': None,
+                    'optional_args': {'is_quota_committed': False}
+                }
+                try:
+                    flow_engine = create_volume.get_flow(
+                        self.scheduler_rpcapi,
+                        self.volume_rpcapi,
+                        self.db,
+                        self.image_service,
+                        availability_zones,
+                        create_what,
+                        cast_volume=False)
+                except Exception:
+                    LOG.exception(_("Failed to create api volume flow"))
+                    raise exception.CinderException(
+                        _("Failed to create api volume flow"))
+
+                with flow_utils.DynamicLogListener(flow_engine, logger=LOG):
+                    flow_engine.run()
+                    volumes.append(flow_engine.storage.fetch('volume'))
+
+                if request_spec is None:
+                    fetch = flow_engine.storage.fetch
+                    request_spec = {
+                        'volume_id': None,
+                        'snapshot_id': None,
+                        'source_volid': None,
+                        'image_id': image_id,
+                        'volume_type': fetch('volume_type'),
+                        'volume_properties': fetch('volume_properties'),
+                    }
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for volume in volumes:
+                    try:
+                        self.delete(context, volume)
+                    except Exception:
+                        LOG.exception(_("Failed to delete volume %s after "
+                                        "an unsuccessful batch create"),
+                                      volume['id'])
+
+        filter_properties = {}
+        if scheduler_hints:
+            filter_properties['scheduler_hints'] = scheduler_hints
+        volume_ids = [volume['id'] for volume in volumes]
+        try:
+            self.scheduler_rpcapi.create_volumes(
+                context,
+                CONF.volume_topic,
+                volume_ids,
+                request_spec=request_spec,
+                filter_properties=filter_properties)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                for volume_id in volume_ids:
+                    self.db.volume_update(context, volume_id,
+                                          {'status': 'error'})
+        return volumes
+
     @wrap_check_policy
     def delete(self, context, volume, force=False, unmanage_only=False):
         if context.is_admin and context.project_id != volume['project_id']:
@@ -290,7 +388,8 @@ class API(base.Base):
         return volume
 
     def get_all(self, context, marker=None, limit=None, sort_key='created_at',
-                sort_dir='desc', filters=None, viewable_admin_meta=False):
+                sort_dir='desc', filters=None, viewable_admin_meta=False,
+                columns=None):
         check_policy(context, 'get_all')
         if filters == None:
             filters = {}
@@ -319,7 +418,8 @@ class API(base.Base):
             # Need to remove all_tenants to pass the filtering below.
             del filters['all_tenants']
             volumes = self.db.volume_get_all(context, marker, limit, sort_key,
-                                             sort_dir, filters=filters)
+                                             sort_dir, filters=filters,
+                                             columns=columns)
         else:
             if viewable_admin_meta:
                 context = context.elevated()
@@ -327,7 +427,8 @@ class API(base.Base):
                                                         context.project_id,
                                                         marker, limit,
                                                         sort_key, sort_dir,
-                                                        filters=filters)
+                                                        filters=filters,
+                                                        columns=columns)
 
         return volumes
 
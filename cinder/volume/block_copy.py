@@ -0,0 +1,285 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Copy data between volumes, images and files in the volume service.
+
+Data is copied in large chunks with several chunks in flight, each read
+and written in a native thread, bypassing the page cache with O_DIRECT
+where the files support it.  Holes in sparse sources are found with
+SEEK_DATA and SEEK_HOLE and are not read; zeros are only written for
+them (and for chunks of zeros) if the destination cannot be left sparse.
+/dev/zero is taken as a source that is one hole.
+"""
+
+import errno
+import io
+import mmap
+import os
+import stat
+import time
+
+from eventlet import greenpool
+from eventlet import greenthread
+from eventlet import tpool
+
+from cinder.openstack.common.gettextutils import _
+from cinder.openstack.common import log as logging
+from cinder.openstack.common import units
+
+
+LOG = logging.getLogger(__name__)
+
+# O_DIRECT needs buffers, offsets and sizes aligned to the logical block
+# size of the device, which is at most the page size.
+ALIGNMENT = mmap.PAGESIZE
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+ZERO_DEVICE = '/dev/zero'
+
+
+def _open(path, flags, direct):
+    """Open path, with O_DIRECT if direct and the file supports it.
+
+    Returns the file descriptor and whether it was opened with O_DIRECT.
+    """
+    if direct and hasattr(os, 'O_DIRECT'):
+        try:
+            return os.open(path, flags | os.O_DIRECT), True
+        except OSError as e:
+            if e.errno != errno.EINVAL:
+                raise
+    return os.open(path, flags), False
+
+
+def _close(*fds):
+    for fd in fds:
+        if fd is not None:
+            os.close(fd)
+
+
+def _is_sparse_file(fd):
+    return stat.S_ISREG(os.fstat(fd).st_mode)
+
+
+def _size(fd):
+    """Returns the size of a regular file or block device, else None."""
+    mode = os.fstat(fd).st_mode
+    if stat.S_ISREG(mode) or stat.S_ISBLK(mode):
+        return os.lseek(fd, 0, os.SEEK_END)
+    return None
+
+
+def _extents(fd, length):
+    """Yields (offset, length, is_data) covering the first length bytes.
+
+    Offsets are aligned, rounding data out and holes in.  Files that do
+    not support SEEK_DATA are all data.
+    """
+    offset = 0
+    while offset < length:
+        try:
+            data = os.lseek(fd, offset, SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                # No data after offset
+                yield offset, length - offset, False
+                return
+            if e.errno != errno.EINVAL:
+                raise
+            yield offset, length - offset, True
+            return
+        data = min(data - data % ALIGNMENT, length)
+        if data > offset:
+            yield offset, data - offset, False
+        hole = os.lseek(fd, data, SEEK_HOLE)
+        hole = min(hole + -hole % ALIGNMENT, length)
+        yield data, hole - data, True
+        offset = hole
+
+
+def _read(fd, buf, offset, length):
+    """Reads up to length bytes at offset into buf, returns the count."""
+    os.lseek(fd, offset, os.SEEK_SET)
+    # Read a whole buffer, as O_DIRECT needs, without copying it.
+    count = io.FileIO(fd, closefd=False).readinto(buf)
+    while 0 < count < length:
+        data = os.read(fd, length - count)
+        if not data:
+            break
+        buf[count:count + len(data)] = data
+        count += len(data)
+    return min(count, length)
+
+
+def _write(fd, buf, offset, length):
+    os.lseek(fd, offset, os.SEEK_SET)
+    written = 0
+    while written < length:
+        written += os.write(fd, buffer(buf, written, length - written))
+
+
+class BlockCopy(object):
+    """Copies length bytes from src to dst.
+
+    :param src: path to read from
+    :param dst: path to write to, truncated first if it is a file
+    :param length: number of bytes to copy, fewer if src is shorter
+    :param chunk_size: size of each read and write
+    :param workers: number of chunks in flight
+    :param bps_limit: bytes per second to copy at most, 0 for no limit
+    :param sync: make sure the data is on disk before returning
+    """
+
+    def __init__(self, src, dst, length, chunk_size=4 * units.Mi, workers=4,
+                 bps_limit=0, sync=False):
+        self.src = src
+        self.dst = dst
+        self.length = length
+        self.chunk_size = max(chunk_size + -chunk_size % ALIGNMENT,
+                              ALIGNMENT)
+        self.workers = max(workers, 1)
+        self.bps_limit = bps_limit
+        self.sync = sync
+        self.copied = 0
+        self.written = 0
+        self._zero_source = os.path.realpath(src) == ZERO_DEVICE
+        self._started = None
+        self._next_progress = 0
+        self._failed = False
+
+    def _chunks(self, src_fd):
+        """Yields (offset, length, is_data) of every chunk to copy."""
+        if self._zero_source:
+            extents = [(0, self.length, False)]
+        elif _is_sparse_file(src_fd):
+            extents = _extents(src_fd, self.length)
+        else:
+            extents = [(0, self.length, True)]
+        for offset, length, is_data in extents:
+            end = offset + length
+            while offset < end:
+                size = min(self.chunk_size, end - offset)
+                yield offset, size, is_data
+                offset += size
+
+    def _account(self, count):
+        """Records progress, logs it and throttles the copy."""
+        self.copied += count
+        if self.copied >= self._next_progress:
+            LOG.debug('Copied %(copied)d of %(length)d bytes from %(src)s '
+                      'to %(dst)s' % {'copied': self.copied,
+                                      'length': self.length,
+                                      'src': self.src, 'dst': self.dst})
+            self._next_progress += max(self.length // 10, 1)
+        if self.bps_limit:
+            delay = (float(self.copied) / self.bps_limit -
+                     (time.time() - self._started))
+            if delay > 0:
+                greenthread.sleep(delay)
+
+    def _worker(self, chunks, src_direct, dst_direct, dst_sparse, zeros):
+        # Every worker has its own file descriptors to seek on.
+        src_fd = dst_fd = None
+        buf = mmap.mmap(-1, self.chunk_size)
+        try:
+            if not self._zero_source:
+                src_fd = _open(self.src, os.O_RDONLY, src_direct)[0]
+            dst_fd = _open(self.dst, os.O_WRONLY, dst_direct)[0]
+            for offset, length, is_data in chunks:
+                if self._failed:
+                    return
+                if is_data:
+                    count = tpool.execute(_read, src_fd, buf, offset, length)
+                    if count < length:
+                        # The source ended early, like dd we stop there.
+                        self.length = min(self.length, offset + count)
+                    if (dst_sparse and
+                            buffer(buf, 0, count) == buffer(zeros, 0, count)):
+                        count = 0
+                    data = buf
+                else:
+                    count = 0 if dst_sparse else length
+                    data = zeros
+                if count:
+                    tpool.execute(_write, dst_fd, data, offset, count)
+                    self.written += count
+                self._account(length)
+        except Exception:
+            self._failed = True
+            raise
+        finally:
+            buf.close()
+            _close(src_fd, dst_fd)
+
+    def run(self):
+        """Copies the data, raising OSError or IOError on failure."""
+        self._started = time.time()
+        src_fd = dst_fd = None
+        src_direct = False
+        zeros = mmap.mmap(-1, self.chunk_size)
+        try:
+            if not self._zero_source:
+                src_fd, src_direct = _open(self.src, os.O_RDONLY, True)
+                src_size = _size(src_fd)
+                if src_size is not None:
+                    self.length = min(self.length, src_size)
+            # A partial last block can't be written with O_DIRECT.
+            dst_fd, dst_direct = _open(self.dst, os.O_WRONLY,
+                                       self.length % ALIGNMENT == 0)
+            dst_sparse = _is_sparse_file(dst_fd)
+            if dst_sparse:
+                # Like dd, truncate the file.  Whatever is not written then
+                # reads as zeros.
+                os.ftruncate(dst_fd, 0)
+
+            chunks = self._chunks(src_fd)
+            pool = greenpool.GreenPool(self.workers)
+            threads = [pool.spawn(self._worker, chunks, src_direct,
+                                  dst_direct, dst_sparse, zeros)
+                       for i in range(self.workers)]
+            # Let every worker stop before the first error is raised.
+            error = None
+            for thread in threads:
+                try:
+                    thread.wait()
+                except Exception as e:
+                    error = error or e
+            if error is not None:
+                raise error
+
+            if dst_sparse:
+                os.ftruncate(dst_fd, self.length)
+            if self.sync:
+                os.fdatasync(dst_fd)
+        finally:
+            zeros.close()
+            _close(src_fd, dst_fd)
+        LOG.debug('Copied %(length)d bytes from %(src)s to %(dst)s, '
+                  'wrote %(written)d' % {'length': self.length,
+                                         'src': self.src, 'dst': self.dst,
+                                         'written': self.written})
+
+
+def can_copy(src, dst):
+    """Returns whether this process can copy from src to dst itself."""
+    return (os.access(src, os.R_OK) and os.access(dst, os.W_OK) and
+            not os.path.isdir(src) and not os.path.isdir(dst))
+
+
+def copy(src, dst, length, chunk_size, workers=4, bps_limit=0, sync=False):
+    """Copies length bytes from src to dst, see BlockCopy."""
+    BlockCopy(src, dst, length, chunk_size=chunk_size, workers=workers,
+              bps_limit=bps_limit, sync=sync).run()
+    LOG.info(_('Copied %(src)s to %(dst)s') % {'src': src, 'dst': dst})
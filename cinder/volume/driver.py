@@ -17,17 +17,21 @@
 Drivers for volumes.
 """
 
+import os
 import time
 
+from eventlet import greenpool
 from oslo.config import cfg
 
 from cinder import exception
+from cinder.image import cache as image_cache
 from cinder.image import image_utils
 from cinder.openstack.common import excutils
 from cinder.openstack.common import fileutils
 from cinder.openstack.common.gettextutils import _
 from cinder.openstack.common import log as logging
 from cinder.openstack.common import processutils
+from cinder.openstack.common import units
 from cinder import utils
 from cinder.volume import iscsi
 from cinder.volume import rpcapi as volume_rpcapi
@@ -69,7 +73,10 @@ volume_opts = [
     cfg.StrOpt('volume_clear',
                default='zero',
                help='Method used to wipe old volumes (valid options are: '
-                    'none, zero, shred)'),
+                    'none, zero, shred, discard). discard uses BLKDISCARD '
+                    'or BLKZEROOUT on devices that read discarded blocks '
+                    'as zeros or zero blocks themselves, and zero '
+                    'otherwise'),
     cfg.IntOpt('volume_clear_size',
                default=0,
                help='Size in MiB to wipe at start of old volumes. 0 => all'),
@@ -101,6 +108,12 @@ volume_opts = [
                      'to either perform blockio or fileio '
                      'optionally, auto can be set and Cinder '
                      'will autodetect type of backing device')),
+    cfg.IntOpt('ensure_export_workers',
+               default=1,
+               help='Number of volumes whose exports are recreated at the '
+                    'same time when the volume service starts. Only raise '
+                    'this for drivers that can recreate exports '
+                    'concurrently'),
     cfg.StrOpt('volume_dd_blocksize',
                default='1M',
                help='The default block size used when copying/clearing '
@@ -113,6 +126,25 @@ volume_opts = [
                default=0,
                help='The upper limit of bandwidth of volume copy. '
                     '0 => unlimited'),
+    cfg.StrOpt('volume_copy_engine',
+               default='native',
+               help='How volumes are copied and cleared: native copies '
+                    'within the volume service, skipping holes in sparse '
+                    'sources, if it can open both ends; dd always runs dd '
+                    'as root (valid options are: native, dd)'),
+    cfg.IntOpt('volume_copy_workers',
+               default=4,
+               help='Number of reads and writes in flight when copying '
+                    'volumes with the native copy engine'),
+    cfg.IntOpt('image_cache_size_gb',
+               default=0,
+               help='Disk space in GB used to cache images converted to raw '
+                    'when they are copied to volumes. 0 disables the cache'),
+    cfg.StrOpt('image_cache_dir',
+               default='$state_path/image-cache',
+               help='Directory to cache images in. Every backend caches its '
+                    'images in a subdirectory named after its configuration '
+                    'group'),
 ]
 
 # for backward compatibility
@@ -182,6 +214,7 @@ class VolumeDriver(object):
 
         self.set_execute(execute)
         self._stats = {}
+        self._image_cache = None
 
         # set True by manager after successful check_for_setup
         self._initialized = False
@@ -361,6 +394,32 @@ class VolumeDriver(object):
                                 properties, force=copy_error,
                                 remote=src_remote)
 
+    def _get_image_cache(self):
+        """Returns the image cache of this backend, None if it is disabled."""
+        if (self._image_cache is None and
+                self.configuration.image_cache_size_gb > 0):
+            self._image_cache = image_cache.ImageCache(
+                os.path.join(self.configuration.image_cache_dir,
+                             self.configuration.config_group or 'DEFAULT'),
+                self.configuration.image_cache_size_gb * units.Gi)
+        return self._image_cache
+
+    def _update_image_cache_stats(self, data):
+        """Adds the statistics of the image cache to the volume stats."""
+        if self._image_cache is not None:
+            data['image_cache_stats'] = self._image_cache.get_stats()
+
+    def _fetch_to_raw(self, context, image_service, image_id, dest,
+                      blocksize, size=None):
+        """Writes the image to dest in raw format, through the image cache."""
+        cache = self._get_image_cache()
+        if cache is not None:
+            fetch_to_raw = cache.fetch_to_raw
+        else:
+            fetch_to_raw = image_utils.fetch_to_raw
+        fetch_to_raw(context, image_service, image_id, dest, blocksize,
+                     size=size)
+
     def copy_image_to_volume(self, context, volume, image_service, image_id):
         """Fetch the image from image_service and write it to the volume."""
         LOG.debug(('copy_image_to_volume %s.') % volume['name'])
@@ -369,12 +428,12 @@ class VolumeDriver(object):
         attach_info = self._attach_volume(context, volume, properties)
 
         try:
-            image_utils.fetch_to_raw(context,
-                                     image_service,
-                                     image_id,
-                                     attach_info['device']['path'],
-                                     self.configuration.volume_dd_blocksize,
-                                     size=volume['size'])
+            self._fetch_to_raw(context,
+                               image_service,
+                               image_id,
+                               attach_info['device']['path'],
+                               self.configuration.volume_dd_blocksize,
+                               size=volume['size'])
         finally:
             self._detach_volume(context, attach_info, volume, properties)
 
@@ -634,6 +693,30 @@ class VolumeDriver(object):
         """Synchronously recreates an export for a volume."""
         raise NotImplementedError()
 
+    def ensure_exports(self, context, volumes):
+        """Synchronously recreates the exports of volumes.
+
+        Calls ensure_export() for up to ensure_export_workers volumes at a
+        time.  Returns a dict mapping the ids of the volumes whose export
+        could not be recreated to the exception raised.
+        """
+        workers = 1
+        if self.configuration:
+            workers = self.configuration.safe_get('ensure_export_workers')
+        failed = {}
+
+        def ensure(volume):
+            try:
+                self.ensure_export(context, volume)
+            except Exception as ex:
+                failed[volume['id']] = ex
+
+        pool = greenpool.GreenPool(max(workers, 1))
+        for volume in volumes:
+            pool.spawn_n(ensure, volume)
+        pool.waitall()
+        return failed
+
     def create_export(self, context, volume):
         """Exports the volume.
 
@@ -872,6 +955,7 @@ class ISCSIDriver(VolumeDriver):
         data['free_capacity_gb'] = 'infinite'
         data['reserved_percentage'] = 100
         data['QoS_support'] = False
+        self._update_image_cache_stats(data)
         self._stats = data
 
     def get_target_helper(self, db):
@@ -1030,6 +1114,7 @@ class ISERDriver(ISCSIDriver):
         data['free_capacity_gb'] = 'infinite'
         data['reserved_percentage'] = 100
         data['QoS_support'] = False
+        self._update_image_cache_stats(data)
         self._stats = data
 
     def get_target_helper(self, db):
@@ -53,6 +53,12 @@ volume_opts = [
     cfg.StrOpt('glusterfs_mount_point_base',
                default='$state_path/mnt',
                help='Base dir containing mount points for gluster shares.'),
+    cfg.IntOpt('glusterfs_allocation_refresh_interval',
+               default=3600,
+               help=('Seconds between reloads of the space allocated on the '
+                     'gluster shares from the database, which is tracked in '
+                     'between. 0 reloads it every time the space is '
+                     'needed.')),
 ]
 
 CONF = cfg.CONF
@@ -73,6 +79,7 @@ class GlusterfsDriver(nfs.RemoteFsDriver):
     driver_prefix = 'glusterfs'
     volume_backend_name = 'GlusterFS'
     VERSION = '1.1.1'
+    tracks_allocated_space = True
 
     def __init__(self, execute=processutils.execute, *args, **kwargs):
         self._remotefsclient = None
@@ -238,6 +245,7 @@ class GlusterfsDriver(nfs.RemoteFsDriver):
 
         finally:
             self._delete_snapshot(temp_snapshot)
+        self._allocate_space(src_vref['provider_location'], volume['size'])
 
         return {'provider_location': src_vref['provider_location']}
 
@@ -252,6 +260,7 @@ class GlusterfsDriver(nfs.RemoteFsDriver):
         LOG.info(_('casted to %s') % volume['provider_location'])
 
         self._do_create_volume(volume)
+        self._allocate_space(volume['provider_location'], volume['size'])
 
         return {'provider_location': volume['provider_location']}
 
@@ -275,6 +284,7 @@ class GlusterfsDriver(nfs.RemoteFsDriver):
         self._copy_volume_from_snapshot(snapshot,
                                         volume,
                                         snapshot['volume_size'])
+        self._allocate_space(volume['provider_location'], volume['size'])
 
         return {'provider_location': volume['provider_location']}
 
@@ -341,6 +351,7 @@ class GlusterfsDriver(nfs.RemoteFsDriver):
 
         info_path = self._local_path_volume_info(volume)
         fileutils.delete_if_exists(info_path)
+        self._allocate_space(volume['provider_location'], -volume['size'])
 
     @utils.synchronized('glusterfs', external=False)
     def create_snapshot(self, snapshot):
@@ -1062,6 +1073,8 @@ class GlusterfsDriver(nfs.RemoteFsDriver):
 
         # qemu-img can resize both raw and qcow2 files
         image_utils.resize_image(volume_path, size_gb)
+        self._allocate_space(volume['provider_location'],
+                             size_gb - volume['size'])
 
     def _do_create_volume(self, volume):
         """Create a volume on given glusterfs_share.
@@ -1149,26 +1162,33 @@ class GlusterfsDriver(nfs.RemoteFsDriver):
 
     def _find_share(self, volume_size_for):
         """Choose GlusterFS share among available ones for given volume size.
-        Current implementation looks for greatest capacity.
+
+        Of the shares with room for the volume, the one with the least space
+        allocated to volumes is chosen, then the one with the greatest
+        capacity.  Sparse volumes only use space as they are written, so
+        the allocated space spreads them better than the capacity does.
         :param volume_size_for: int size in GB
         """
 
         if not self._mounted_shares:
             raise exception.GlusterfsNoSharesMounted()
 
-        greatest_size = 0
-        greatest_share = None
+        best = None
+        best_share = None
 
         for glusterfs_share in self._mounted_shares:
             capacity = self._get_available_capacity(glusterfs_share)[0]
-            if capacity > greatest_size:
-                greatest_share = glusterfs_share
-                greatest_size = capacity
-
-        if volume_size_for * units.Gi > greatest_size:
+            if capacity < volume_size_for * units.Gi:
+                continue
+            key = (-self._get_allocated_space(glusterfs_share), capacity)
+            if best is None or key > best:
+                best = key
+                best_share = glusterfs_share
+
+        if best_share is None:
             raise exception.GlusterfsNoSuitableShareFound(
                 volume_size=volume_size_for)
-        return greatest_share
+        return best_share
 
     def _get_hash_str(self, base_str):
         """Return a string that represents hash of base_str
@@ -1199,7 +1219,7 @@ class GlusterfsDriver(nfs.RemoteFsDriver):
 
     def _get_capacity_info(self, glusterfs_share):
         available, size = self._get_available_capacity(glusterfs_share)
-        return size, available, size - available
+        return size, available, self._get_allocated_space(glusterfs_share)
 
     def _mount_glusterfs(self, glusterfs_share, mount_path, ensure=False):
         """Mount GlusterFS share to mount path."""
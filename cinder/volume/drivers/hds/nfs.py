@@ -131,6 +131,10 @@ class HDSNFSDriver(nfs.NfsDriver):
       Executes commands relating to Volumes.
     """
 
+    # Clones and extends go through HNAS, the shares are scanned for the
+    # allocated space.
+    tracks_allocated_space = False
+
     def __init__(self, *args, **kwargs):
         # NOTE(vish): db is set by Manager
         self._execute = None
@@ -59,6 +59,8 @@ class IBMNAS_NFSDriver(nfs.NfsDriver, san.SanDriver):
 
     driver_volume_type = 'nfs'
     VERSION = VERSION
+    # Snapshots and clones are made on the NAS over ssh.
+    tracks_allocated_space = False
 
     def __init__(self, execute=utils.execute, *args, **kwargs):
         self._context = None
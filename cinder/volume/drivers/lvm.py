@@ -22,6 +22,8 @@ import math
 import os
 import socket
 
+from eventlet import greenthread
+from eventlet import semaphore
 from oslo.config import cfg
 
 from cinder.brick import exception as brick_exception
@@ -50,8 +52,22 @@ volume_opts = [
     cfg.StrOpt('lvm_type',
                default='default',
                help='Type of LVM volumes to deploy; (default or thin)'),
+    cfg.IntOpt('volume_clear_workers',
+               default=0,
+               help='Number of deleted volumes cleared at the same time in '
+                    'the background. 0 clears each volume before its delete '
+                    'returns'),
+    cfg.IntOpt('volume_clear_queue_size',
+               default=16,
+               help='Maximum number of deleted volumes waiting to be cleared '
+                    'in the background. Volumes deleted while the queue is '
+                    'full are cleared before their delete returns'),
 ]
 
+# Volumes waiting to be cleared in the background are renamed with this
+# prefix, so that clears left over by a restart can be resumed.
+CLEAR_PREFIX = 'clear-'
+
 CONF = cfg.CONF
 CONF.register_opts(volume_opts)
 
@@ -69,6 +85,8 @@ class LVMVolumeDriver(driver.VolumeDriver):
         self.backend_name =\
             self.configuration.safe_get('volume_backend_name') or 'LVM'
         self.protocol = 'local'
+        self._pending_clears = set()
+        self._clear_semaphore = None
 
     def set_execute(self, execute):
         self._execute = execute
@@ -113,6 +131,8 @@ class LVMVolumeDriver(driver.VolumeDriver):
                                          % exc.stderr)
                     raise exception.VolumeBackendAPIException(
                         data=exception_message)
+        else:
+            self._resume_clears()
 
     def _sizestr(self, size_in_g):
         if int(size_in_g) == 0:
@@ -126,6 +146,8 @@ class LVMVolumeDriver(driver.VolumeDriver):
         """Deletes a logical volume."""
         if self.configuration.volume_clear != 'none' and \
                 self.configuration.lvm_type != 'thin':
+            if not is_snapshot and self._queue_clear(volume):
+                return
             self._clear_volume(volume, is_snapshot)
 
         name = volume['name']
@@ -171,6 +193,54 @@ class LVMVolumeDriver(driver.VolumeDriver):
             volume_clear=self.configuration.volume_clear,
             volume_clear_size=self.configuration.volume_clear_size)
 
+    def _queue_clear(self, volume):
+        """Clears and deletes the volume in the background if possible.
+
+        The volume is renamed first, so that its name can be reused.
+        Returns whether the volume was queued.
+        """
+        if (self.configuration.volume_clear_workers <= 0 or
+                len(self._pending_clears) >=
+                self.configuration.volume_clear_queue_size):
+            return False
+
+        name = CLEAR_PREFIX + volume['name']
+        self.vg.rename_volume(volume['name'], name)
+        self._spawn_clear(name, volume['size'])
+        return True
+
+    def _spawn_clear(self, name, size_in_g):
+        if self._clear_semaphore is None:
+            self._clear_semaphore = semaphore.Semaphore(
+                max(self.configuration.volume_clear_workers, 1))
+        self._pending_clears.add(name)
+        greenthread.spawn_n(self._clear_and_delete, name, size_in_g)
+
+    def _clear_and_delete(self, name, size_in_g):
+        try:
+            with self._clear_semaphore:
+                if self.configuration.volume_clear != 'none':
+                    volutils.clear_volume(
+                        size_in_g * units.Ki, self.local_path({'name': name}),
+                        volume_clear=self.configuration.volume_clear,
+                        volume_clear_size=self.configuration.volume_clear_size)
+                self.vg.delete(name)
+        except Exception:
+            # The volume is cleared again the next time the service starts.
+            LOG.exception(_('Failed to clear deleted volume %s'), name)
+        finally:
+            self._pending_clears.discard(name)
+
+    def _resume_clears(self):
+        """Queues the volumes that were deleted but not cleared yet."""
+        for lv in self.vg.get_volumes():
+            name = lv['name']
+            if (not name.startswith(CLEAR_PREFIX) or
+                    name in self._pending_clears):
+                continue
+            LOG.info(_('Resuming clear of deleted volume %s'), name)
+            self._spawn_clear(name, int(math.ceil(float(lv['size']))))
+
     def _escape_snapshot(self, snapshot_name):
         # Linux LVM reserves name that starts with snapshot, so that
         # such volume name can't be created. Mangle it.
@@ -262,12 +332,12 @@ class LVMVolumeDriver(driver.VolumeDriver):
 
     def copy_image_to_volume(self, context, volume, image_service, image_id):
         """Fetch the image from image_service and write it to the volume."""
-        image_utils.fetch_to_raw(context,
-                                 image_service,
-                                 image_id,
-                                 self.local_path(volume),
-                                 self.configuration.volume_dd_blocksize,
-                                 size=volume['size'])
+        self._fetch_to_raw(context,
+                           image_service,
+                           image_id,
+                           self.local_path(volume),
+                           self.configuration.volume_dd_blocksize,
+                           size=volume['size'])
 
     def copy_volume_to_image(self, context, volume, image_service, image_meta):
         """Copy the volume to the specified image."""
@@ -374,6 +444,9 @@ class LVMVolumeDriver(driver.VolumeDriver):
             data['free_capacity_gb'] = self.vg.vg_free_space
         data['reserved_percentage'] = self.configuration.reserved_percentage
         data['QoS_support'] = False
+        data['pending_volume_clears'] = len(self._pending_clears)
+        data['volume_clear_stats'] = volutils.get_clear_stats()
+        self._update_image_cache_stats(data)
         data['location_info'] =\
             ('LVMVolumeDriver:%(hostname)s:%(vg)s'
              ':%(lvm_type)s:%(lvm_mirrors)s' %
@@ -525,6 +598,21 @@ class LVMISCSIDriver(LVMVolumeDriver, driver.ISCSIDriver):
         if model_update:
             self.db.volume_update(context, volume['id'], model_update)
 
+    def ensure_exports(self, context, volumes):
+        # List the targets once instead of for every volume and leave out
+        # the volumes that are exported already.
+        try:
+            missing = self.target_helper.get_missing_exports(context,
+                                                             volumes)
+        except processutils.ProcessExecutionError as ex:
+            LOG.warning(_("Failed to list iSCSI targets, recreating all "
+                          "exports: %s") % ex)
+            missing = volumes
+        LOG.debug("%(exported)d of %(total)d volumes are exported already" %
+                  {'exported': len(volumes) - len(missing),
+                   'total': len(volumes)})
+        return super(LVMISCSIDriver, self).ensure_exports(context, missing)
+
     def create_export(self, context, volume):
         return self._create_export(context, volume)
 
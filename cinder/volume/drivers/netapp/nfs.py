@@ -59,6 +59,8 @@ class NetAppNFSDriver(nfs.NfsDriver):
     """
 
     VERSION = "1.0.0"
+    # Clones are made by the filer, outside of the allocated space ledger.
+    tracks_allocated_space = False
 
     def __init__(self, *args, **kwargs):
         # NOTE(vish): db is set by Manager
@@ -16,10 +16,12 @@
 import errno
 import os
 import re
+import time
 
 from oslo.config import cfg
 
 from cinder.brick.remotefs import remotefs
+from cinder import context
 from cinder import exception
 from cinder.image import image_utils
 from cinder.openstack.common.gettextutils import _
@@ -59,6 +61,11 @@ volume_opts = [
                default=None,
                help=('Mount options passed to the nfs client. See section '
                      'of the nfs man page for details.')),
+    cfg.IntOpt('nfs_allocation_refresh_interval',
+               default=3600,
+               help=('Seconds between scans of the space allocated on the '
+                     'nfs shares, which is tracked in between. 0 scans the '
+                     'shares every time the space is needed.')),
 ]
 
 nas_opts = [
@@ -90,10 +97,20 @@ class RemoteFsDriver(driver.VolumeDriver):
 
     VERSION = "0.0.0"
 
+    # Whether every path that creates, deletes or resizes volume files
+    # records it with _allocate_space.  The allocated space of drivers
+    # that do not is scanned every time it is needed.
+    tracks_allocated_space = False
+
     def __init__(self, *args, **kwargs):
         super(RemoteFsDriver, self).__init__(*args, **kwargs)
         self.shares = {}
         self._mounted_shares = []
+        # Space allocated to volumes on every share, see
+        # _get_allocated_space.
+        self._allocated = None
+        self._allocation_changes = {}
+        self._allocation_refreshed = {}
 
     def check_for_setup_error(self):
         """Just to override parent behavior."""
@@ -142,6 +159,7 @@ class RemoteFsDriver(driver.VolumeDriver):
         LOG.info(_('casted to %s') % volume['provider_location'])
 
         self._do_create_volume(volume)
+        self._allocate_space(volume['provider_location'], volume['size'])
 
         return {'provider_location': volume['provider_location']}
 
@@ -198,6 +216,7 @@ class RemoteFsDriver(driver.VolumeDriver):
         mounted_path = self.local_path(volume)
 
         self._execute('rm', '-f', mounted_path, run_as_root=True)
+        self._allocate_space(volume['provider_location'], -volume['size'])
 
     def ensure_export(self, ctx, volume):
         """Synchronously recreates an export for a logical volume."""
@@ -353,6 +372,7 @@ class RemoteFsDriver(driver.VolumeDriver):
         data['storage_protocol'] = self.driver_volume_type
 
         self._ensure_shares_mounted()
+        self._refresh_expired_allocations()
 
         global_capacity = 0
         global_free = 0
@@ -385,6 +405,85 @@ class RemoteFsDriver(driver.VolumeDriver):
     def _get_capacity_info(self, nfs_share):
         raise NotImplementedError()
 
+    def _get_allocation_refresh_interval(self):
+        if not self.tracks_allocated_space:
+            return 0
+        return getattr(self.configuration,
+                       self.driver_prefix + '_allocation_refresh_interval')
+
+    def _load_allocated_space(self):
+        """Sums up the sizes of the volumes of this backend by share."""
+        self._allocated = {}
+        if self.db is None:
+            # Every share is scanned when it is first used.
+            return
+        ctxt = context.get_admin_context()
+        for volume in self.db.volume_get_all_by_host(ctxt, self.host):
+            share = volume['provider_location']
+            if share:
+                self._allocated[share] = (self._allocated.get(share, 0) +
+                                          volume['size'] * units.Gi)
+        now = time.time()
+        for share in self._allocated:
+            self._allocation_refreshed[share] = now
+
+    def _scan_allocated_space(self, share):
+        """Returns the size of the volumes of this backend on share."""
+        if self.db is None:
+            return 0
+        ctxt = context.get_admin_context()
+        volumes = self.db.volume_get_all_by_host(ctxt, self.host)
+        return sum(volume['size'] * units.Gi for volume in volumes
+                   if volume['provider_location'] == share)
+
+    def _refresh_allocated_space(self, share):
+        changes = self._allocation_changes.get(share, 0)
+        allocated = self._scan_allocated_space(share)
+        # Volumes created or deleted during the scan may be missing from
+        # it, so they are counted again.
+        allocated += self._allocation_changes.get(share, 0) - changes
+        self._allocated[share] = max(allocated, 0)
+        self._allocation_refreshed[share] = time.time()
+
+    def _refresh_expired_allocations(self):
+        """Scans the shares whose allocated space was not scanned lately."""
+        interval = self._get_allocation_refresh_interval()
+        if self._allocated is None or not interval:
+            # Scanned when the space is needed anyway.
+            return
+        for share in self._mounted_shares:
+            refreshed = self._allocation_refreshed.get(share)
+            if refreshed is not None and time.time() - refreshed >= interval:
+                LOG.debug('Refreshing the space allocated on %s', share)
+                self._refresh_allocated_space(share)
+
+    def _get_allocated_space(self, share):
+        """Returns the space allocated to volumes on share, in bytes.
+
+        Scanning a share for it is slow on shares with many files, so the
+        space is tracked from the volumes of this backend and the volumes
+        created, deleted and extended since.  The shares are scanned again
+        now and then by _refresh_expired_allocations to catch other
+        changes.
+        """
+        if self._allocated is None:
+            self._load_allocated_space()
+        if (share not in self._allocated or
+                not self._get_allocation_refresh_interval()):
+            self._refresh_allocated_space(share)
+        return self._allocated[share]
+
+    def _allocate_space(self, share, size_gb):
+        """Records that size_gb more (or less) is allocated on share."""
+        if self._allocated is None or not self.tracks_allocated_space:
+            # Not tracked, the space is found when it is needed.
+            return
+        size = size_gb * units.Gi
+        self._allocation_changes[share] = (
+            self._allocation_changes.get(share, 0) + size)
+        if share in self._allocated:
+            self._allocated[share] = max(self._allocated[share] + size, 0)
+
     def _find_share(self, volume_size_in_gib):
         raise NotImplementedError()
 
@@ -401,6 +500,7 @@ class NfsDriver(RemoteFsDriver):
     driver_prefix = 'nfs'
     volume_backend_name = 'Generic_NFS'
     VERSION = VERSION
+    tracks_allocated_space = True
 
     def __init__(self, execute=putils.execute, *args, **kwargs):
         self._remotefsclient = None
@@ -486,10 +586,11 @@ class NfsDriver(RemoteFsDriver):
         target_share_reserved = 0
 
         for nfs_share in self._mounted_shares:
-            if not self._is_share_eligible(nfs_share, volume_size_in_gib):
+            capacity_info = self._get_capacity_info(nfs_share)
+            if not self._is_share_eligible(nfs_share, volume_size_in_gib,
+                                           capacity_info):
                 continue
-            total_size, total_available, total_allocated = \
-                self._get_capacity_info(nfs_share)
+            total_size, total_available, total_allocated = capacity_info
             if target_share is not None:
                 if target_share_reserved > total_allocated:
                     target_share = nfs_share
@@ -506,7 +607,8 @@ class NfsDriver(RemoteFsDriver):
 
         return target_share
 
-    def _is_share_eligible(self, nfs_share, volume_size_in_gib):
+    def _is_share_eligible(self, nfs_share, volume_size_in_gib,
+                           capacity_info=None):
         """Verifies NFS share is eligible to host volume with given size.
 
         First validation step: ratio of actual space (used_space / total_space)
@@ -518,14 +620,16 @@ class NfsDriver(RemoteFsDriver):
 
         :param nfs_share: nfs share
         :param volume_size_in_gib: int size in GB
+        :param capacity_info: _get_capacity_info of the share, if known
         """
 
         used_ratio = self.configuration.nfs_used_ratio
         oversub_ratio = self.configuration.nfs_oversub_ratio
         requested_volume_size = volume_size_in_gib * units.Gi
 
-        total_size, total_available, total_allocated = \
-            self._get_capacity_info(nfs_share)
+        if capacity_info is None:
+            capacity_info = self._get_capacity_info(nfs_share)
+        total_size, total_available, total_allocated = capacity_info
         apparent_size = max(0, total_size * oversub_ratio)
         apparent_available = max(0, apparent_size - total_allocated)
         used = (total_size - total_available) / total_size
@@ -564,10 +668,15 @@ class NfsDriver(RemoteFsDriver):
         total_available = block_size * blocks_avail
         total_size = block_size * blocks_total
 
+        total_allocated = float(self._get_allocated_space(nfs_share))
+        return total_size, total_available, total_allocated
+
+    def _scan_allocated_space(self, nfs_share):
+        """Returns the apparent size of the files on the NFS share."""
+        mount_point = self._get_mount_point_for_share(nfs_share)
         du, _ = self._execute('du', '-sb', '--apparent-size', '--exclude',
                               '*snapshot*', mount_point, run_as_root=True)
-        total_allocated = float(du.split()[0])
-        return total_size, total_available, total_allocated
+        return float(du.split()[0])
 
     def _get_mount_point_base(self):
         return self.base
@@ -587,6 +696,7 @@ class NfsDriver(RemoteFsDriver):
         if not self._is_file_size_equal(path, new_size):
             raise exception.ExtendVolumeError(
                 reason='Resizing image file failed.')
+        self._allocate_space(volume['provider_location'], extend_by)
 
     def _is_file_size_equal(self, path, size):
         """Checks if file size at path is equal to size."""
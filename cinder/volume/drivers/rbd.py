@@ -19,6 +19,8 @@ import json
 import math
 import os
 import tempfile
+import threading
+import time
 import urllib
 
 from oslo.config import cfg
@@ -77,7 +79,13 @@ rbd_opts = [
     cfg.IntOpt('rados_connect_timeout', default=-1,
                help=_('Timeout value (in seconds) used when connecting to '
                       'ceph cluster. If value < 0, no timeout is set and '
-                      'default librados value is used.'))
+                      'default librados value is used.')),
+    cfg.IntOpt('rados_connection_pool_size', default=4,
+               help=_('Number of idle connections to the ceph cluster kept '
+                      'for reuse. 0 connects for every operation.')),
+    cfg.IntOpt('rados_connection_idle_timeout', default=300,
+               help=_('Seconds after which an idle connection to the ceph '
+                      'cluster is closed.')),
 ]
 
 CONF = cfg.CONF
@@ -244,6 +252,89 @@ class RADOSClient(object):
         self.driver._disconnect_from_rados(self.cluster, self.ioctx)
 
 
+class RADOSConnectionPool(object):
+    """Connected RADOS cluster handles kept for reuse.
+
+    Each handle is borrowed by one user at a time, together with the
+    ioctxs it has opened, and is checked before it is lent again.  Handles
+    returned while max_idle handles are idle, or left idle for longer than
+    idle_timeout seconds, are shut down.
+
+    :param connect: function returning a new connected cluster handle
+    :param max_idle: number of idle handles kept
+    :param idle_timeout: seconds an idle handle is kept for
+    """
+
+    def __init__(self, connect, max_idle, idle_timeout):
+        self._connect = connect
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        # (cluster, ioctxs by pool name, time returned), oldest first.
+        self._idle = []
+        self._borrowed = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _close(cluster, ioctxs):
+        # closing an ioctx or shutting down cannot raise an exception
+        for ioctx in ioctxs.values():
+            ioctx.close()
+        cluster.shutdown()
+
+    def _take_idle(self):
+        """Returns a healthy idle handle and its ioctxs, or None."""
+        with self._lock:
+            expired = time.time() - self.idle_timeout
+            stale = [entry for entry in self._idle if entry[2] < expired]
+            self._idle = self._idle[len(stale):]
+            entry = self._idle.pop() if self._idle else None
+        for cluster, ioctxs, returned in stale:
+            self._close(cluster, ioctxs)
+        if entry is None:
+            return None
+        cluster, ioctxs, returned = entry
+        if cluster.state != 'connected':
+            LOG.debug('Discarding disconnected ceph cluster handle.')
+            self._close(cluster, ioctxs)
+            return self._take_idle()
+        return cluster, ioctxs
+
+    def get(self, pool):
+        """Returns a connected cluster handle and an ioctx for pool."""
+        entry = self._take_idle()
+        if entry is None:
+            cluster, ioctxs = self._connect(), {}
+        else:
+            cluster, ioctxs = entry
+        ioctx = ioctxs.get(pool)
+        if ioctx is None or ioctx.state != 'open':
+            try:
+                ioctx = ioctxs[pool] = cluster.open_ioctx(pool)
+            except Exception:
+                ioctxs.pop(pool, None)
+                self._close(cluster, ioctxs)
+                raise
+        with self._lock:
+            self._borrowed[cluster] = ioctxs
+        return cluster, ioctx
+
+    def put(self, cluster, ioctx):
+        """Returns a handle got from get(), shutting it down if not needed."""
+        with self._lock:
+            ioctxs = self._borrowed.pop(cluster, None)
+            if ioctxs is not None and len(self._idle) < self.max_idle:
+                self._idle.append((cluster, ioctxs, time.time()))
+                return
+        self._close(cluster, ioctxs or {None: ioctx})
+
+    def clear(self):
+        """Shuts down the idle handles."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for cluster, ioctxs, returned in idle:
+            self._close(cluster, ioctxs)
+
+
 class RBDDriver(driver.VolumeDriver):
     """Implements RADOS block device (RBD) volume commands."""
 
@@ -256,6 +347,7 @@ class RBDDriver(driver.VolumeDriver):
         # allow overrides for testing
         self.rados = kwargs.get('rados', rados)
         self.rbd = kwargs.get('rbd', rbd)
+        self._rados_pool = None
 
         # All string args used with librbd must be None or utf-8 otherwise
         # librbd will break.
@@ -285,35 +377,47 @@ class RBDDriver(driver.VolumeDriver):
             args.extend(['--conf', self.configuration.rbd_ceph_conf])
         return args
 
-    def _connect_to_rados(self, pool=None):
+    def _connect_cluster(self):
         LOG.debug("opening connection to ceph cluster (timeout=%s)." %
                   (self.configuration.rados_connect_timeout))
 
         client = self.rados.Rados(rados_id=self.configuration.rbd_user,
                                   conffile=self.configuration.rbd_ceph_conf)
-        if pool is not None:
-            pool = strutils.safe_encode(pool)
-        else:
-            pool = self.configuration.rbd_pool
-
         try:
             if self.configuration.rados_connect_timeout >= 0:
                 client.connect(timeout=
                                self.configuration.rados_connect_timeout)
             else:
                 client.connect()
-            ioctx = client.open_ioctx(pool)
-            return client, ioctx
+            return client
         except self.rados.Error as exc:
             LOG.error("error connecting to ceph cluster.")
             # shutdown cannot raise an exception
             client.shutdown()
             raise exception.VolumeBackendAPIException(data=str(exc))
 
+    def _get_rados_pool(self):
+        if self._rados_pool is None:
+            self._rados_pool = RADOSConnectionPool(
+                self._connect_cluster,
+                self.configuration.rados_connection_pool_size,
+                self.configuration.rados_connection_idle_timeout)
+        return self._rados_pool
+
+    def _connect_to_rados(self, pool=None):
+        if pool is not None:
+            pool = strutils.safe_encode(pool)
+        else:
+            pool = self.configuration.rbd_pool
+
+        try:
+            return self._get_rados_pool().get(pool)
+        except self.rados.Error as exc:
+            LOG.error("error opening pool %s." % pool)
+            raise exception.VolumeBackendAPIException(data=str(exc))
+
     def _disconnect_from_rados(self, client, ioctx):
-        # closing an ioctx cannot raise an exception
-        ioctx.close()
-        client.shutdown()
+        self._get_rados_pool().put(client, ioctx)
 
     def _get_backup_snaps(self, rbd_image):
         """Get list of any backup snapshots that exist on this volume.
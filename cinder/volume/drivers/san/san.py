@@ -70,6 +70,11 @@ san_opts = [
     cfg.IntOpt('ssh_max_pool_conn',
                default=5,
                help='Maximum ssh connections in the pool'),
+    cfg.IntOpt('ssh_max_concurrent_conn',
+               default=0,
+               help='Maximum ssh connections in use at once to the SAN '
+                    'controller by all the backends using it, 0 for no '
+                    'limit'),
 ]
 
 CONF = cfg.CONF
@@ -100,15 +105,13 @@ class SanDriver(driver.VolumeDriver):
             command = ' '.join(cmd)
             return self._run_ssh(command, check_exit_code)
 
-    def _run_ssh(self, cmd_list, check_exit_code=True, attempts=1):
-        utils.check_ssh_injection(cmd_list)
-        command = ' '. join(cmd_list)
-
+    def _create_sshpool(self):
         if not self.sshpool:
             password = self.configuration.san_password
             privatekey = self.configuration.san_private_key
             min_size = self.configuration.ssh_min_pool_conn
             max_size = self.configuration.ssh_max_pool_conn
+            max_concurrent = self.configuration.ssh_max_concurrent_conn
             self.sshpool = utils.SSHPool(self.configuration.san_ip,
                                          self.configuration.san_ssh_port,
                                          self.configuration.ssh_conn_timeout,
@@ -116,7 +119,14 @@ class SanDriver(driver.VolumeDriver):
                                          password=password,
                                          privatekey=privatekey,
                                          min_size=min_size,
-                                         max_size=max_size)
+                                         max_size=max_size,
+                                         max_concurrent=max_concurrent)
+
+    def _run_ssh(self, cmd_list, check_exit_code=True, attempts=1):
+        utils.check_ssh_injection(cmd_list)
+        command = ' '. join(cmd_list)
+
+        self._create_sshpool()
         last_exception = None
         try:
             with self.sshpool.item() as ssh:
@@ -148,6 +158,24 @@ class SanDriver(driver.VolumeDriver):
             with excutils.save_and_reraise_exception():
                 LOG.error(_("Error running SSH command: %s") % command)
 
+    def _run_ssh_batch(self, cmd_lists, check_exit_code=True):
+        """Run several read-only commands in one round-trip.
+
+        :returns: a list of (stdout, stderr), in the order of cmd_lists
+        """
+        for cmd_list in cmd_lists:
+            utils.check_ssh_injection(cmd_list)
+        commands = [' '.join(cmd_list) for cmd_list in cmd_lists]
+
+        self._create_sshpool()
+        try:
+            return self.sshpool.execute_batch(commands,
+                                              check_exit_code=check_exit_code)
+        except Exception:
+            with excutils.save_and_reraise_exception():
+                LOG.error(_("Error running SSH commands: %s") %
+                          '; '.join(commands))
+
     def ensure_export(self, context, volume):
         """Synchronously recreates an export for a logical volume."""
         pass
@@ -693,7 +693,7 @@ class VolumeCastTask(flow_utils.CinderTask):
 
 def get_flow(scheduler_rpcapi, volume_rpcapi, db_api,
              image_service_api, availability_zones,
-             create_what):
+             create_what, cast_volume=True):
     """Constructs and returns the api entrypoint flow.
 
     This flow will do the following:
@@ -703,7 +703,8 @@ def get_flow(scheduler_rpcapi, volume_rpcapi, db_api,
     3. Reserves the quota (reverts quota on any failures).
     4. Creates the database entry.
     5. Commits the quota.
-    6. Casts to volume manager or scheduler for further processing.
+    6. Casts to volume manager or scheduler for further processing, unless
+       cast_volume is False (the caller is then responsible for it).
     """
 
     flow_name = ACTION.replace(":", "_") + "_api"
@@ -719,9 +720,10 @@ def get_flow(scheduler_rpcapi, volume_rpcapi, db_api,
                  EntryCreateTask(db_api),
                  QuotaCommitTask())
 
-    # This will cast it out to either the scheduler or volume manager via
-    # the rpc apis provided.
-    api_flow.add(VolumeCastTask(scheduler_rpcapi, volume_rpcapi, db_api))
+    if cast_volume:
+        # This will cast it out to either the scheduler or volume manager via
+        # the rpc apis provided.
+        api_flow.add(VolumeCastTask(scheduler_rpcapi, volume_rpcapi, db_api))
 
     # Now load (but do not run) the flow using the provided initial data.
     return taskflow.engines.load(api_flow, store=create_what)
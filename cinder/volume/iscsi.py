@@ -108,6 +108,14 @@ class _ExportMixin(object):
                                  chap_auth, check_exit_code=False,
                                  old_name=old_name)
 
+    def get_missing_exports(self, context, volumes):
+        """Return the volumes that ensure_export() has work to do for.
+
+        Helpers that cannot tell which volumes are exported from a single
+        listing of their targets return all of them.
+        """
+        return list(volumes)
+
     def _ensure_iscsi_targets(self, context, host, max_targets):
         """Ensure that target ids have been created in datastore."""
         # NOTE(jdg): tgtadm doesn't use the iscsi_targets table
@@ -210,6 +218,21 @@ class TgtAdm(_ExportMixin, iscsi.TgtAdm):
     def _get_target_for_ensure_export(self, context, volume_id):
         return 1
 
+    def get_missing_exports(self, context, volumes):
+        targets = self.get_targets()
+        missing = []
+        for volume in volumes:
+            iqn = '%s%s' % (self.iscsi_target_prefix, volume['name'])
+            persist_file = os.path.join(self.volumes_dir, volume['name'])
+            # ensure_export() also fixes up volumes with an outdated
+            # provider_location, see _fix_id_migration().
+            if (1 not in targets.get(iqn, ()) or
+                    not os.path.exists(persist_file) or
+                    (volume['provider_location'] is not None and
+                     volume['name'] not in volume['provider_location'])):
+                missing.append(volume)
+        return missing
+
 
 class FakeIscsiHelper(_ExportMixin, iscsi.FakeIscsiHelper):
 
@@ -240,6 +263,12 @@ class LioAdm(_ExportMixin, iscsi.LioAdm):
 
         self.remove_iscsi_target(iscsi_target, 0, volume['id'], volume['name'])
 
+    def get_missing_exports(self, context, volumes):
+        targets = self.get_targets()
+        return [volume for volume in volumes
+                if '%s%s' % (self.iscsi_target_prefix,
+                             volume['name']) not in targets]
+
     def ensure_export(self, context, volume, iscsi_name, volume_path,
                       vg_name, old_name=None):
         try:
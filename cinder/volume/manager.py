@@ -218,22 +218,14 @@ class VolumeManager(manager.SchedulerDependentManager):
         LOG.debug("Re-exporting %s volumes", len(volumes))
 
         try:
-            sum = 0
-            self.stats.update({'allocated_capacity_gb': sum})
+            # calculate allocated capacity for driver
+            (count, gigabytes) = self.db.volume_data_get_for_host(
+                ctxt, self.host, statuses=['in-use'])
+            self.stats.update({'allocated_capacity_gb': gigabytes})
+            exports = []
             for volume in volumes:
                 if volume['status'] in ['in-use']:
-                    # calculate allocated capacity for driver
-                    sum += volume['size']
-                    self.stats['allocated_capacity_gb'] = sum
-                    try:
-                        self.driver.ensure_export(ctxt, volume)
-                    except Exception as export_ex:
-                        LOG.error(_("Failed to re-export volume %s: "
-                                    "setting to error state"), volume['id'])
-                        LOG.exception(export_ex)
-                        self.db.volume_update(ctxt,
-                                              volume['id'],
-                                              {'status': 'error'})
+                    exports.append(volume)
                 elif volume['status'] == 'downloading':
                     LOG.info(_("volume %s stuck in a downloading state"),
                              volume['id'])
@@ -243,6 +235,13 @@ class VolumeManager(manager.SchedulerDependentManager):
                                           {'status': 'error'})
                 else:
                     LOG.info(_("volume %s: skipping export"), volume['id'])
+
+            failed = self.driver.ensure_exports(ctxt, exports)
+            for volume_id, export_ex in failed.items():
+                LOG.error(_("Failed to re-export volume %(volume_id)s: "
+                            "%(error)s, setting to error state") %
+                          {'volume_id': volume_id, 'error': export_ex})
+                self.db.volume_update(ctxt, volume_id, {'status': 'error'})
         except Exception as ex:
             LOG.error(_("Error encountered during "
                         "re-exporting phase of driver initialization: "
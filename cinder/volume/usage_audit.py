@@ -0,0 +1,199 @@
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Usage notifications for the volumes and snapshots of an audit period.
+
+Volumes and snapshots active in the period are read a page at a time,
+loading only the columns the notifications need, and the notifications
+of a page are sent by a pool of green threads.  After every page the
+last id is written to a checkpoint file, so that an audit that was
+interrupted carries on from there when it is run again for the same
+period.
+"""
+
+import os
+import time
+
+from eventlet import greenpool
+
+from cinder import db
+from cinder.openstack.common import fileutils
+from cinder.openstack.common.gettextutils import _
+from cinder.openstack.common import jsonutils
+from cinder.openstack.common import log as logging
+from cinder.volume import utils as volume_utils
+
+
+LOG = logging.getLogger(__name__)
+
+VOLUME_COLUMNS = ('id', 'project_id', 'user_id', 'instance_uuid',
+                  'availability_zone', 'volume_type_id', 'display_name',
+                  'launched_at', 'created_at', 'deleted_at', 'status',
+                  'snapshot_id', 'size')
+SNAPSHOT_COLUMNS = ('id', 'project_id', 'user_id', 'volume_id',
+                    'volume_size', 'display_name', 'created_at',
+                    'deleted_at', 'status', 'deleted')
+
+
+class UsageAudit(object):
+    """Sends the usage notifications of an audit period.
+
+    :param context: admin context to read and notify with
+    :param begin: start of the audit period
+    :param end: end of the audit period
+    :param send_actions: also send the create and delete notifications
+                         of the period
+    :param batch_size: number of rows to read at a time
+    :param workers: number of notifications to send at a time
+    :param checkpoint_file: file to record progress in, or None
+    """
+
+    # Resources in the order they are audited.
+    KINDS = ('volumes', 'snapshots')
+
+    def __init__(self, context, begin, end, send_actions=False,
+                 batch_size=1000, workers=8, checkpoint_file=None):
+        self.context = context
+        self.begin = begin
+        self.end = end
+        self.send_actions = send_actions
+        self.batch_size = max(batch_size, 1)
+        self.workers = max(workers, 1)
+        self.checkpoint_file = checkpoint_file
+        self.counts = dict((kind, 0) for kind in self.KINDS)
+        self.sent = 0
+        self.failed = 0
+        self._started = None
+        self._extra_info = {
+            'audit_period_beginning': str(begin),
+            'audit_period_ending': str(end),
+        }
+
+    def _load_checkpoint(self):
+        """Returns the kind and marker to carry on from."""
+        if not self.checkpoint_file:
+            return self.KINDS[0], None
+        try:
+            with open(self.checkpoint_file) as f:
+                checkpoint = jsonutils.loads(f.read())
+        except IOError:
+            return self.KINDS[0], None
+        except ValueError:
+            LOG.warn(_('Ignoring unreadable checkpoint %s') %
+                     self.checkpoint_file)
+            return self.KINDS[0], None
+        if (checkpoint.get('begin') != str(self.begin) or
+                checkpoint.get('end') != str(self.end) or
+                checkpoint.get('kind') not in self.KINDS):
+            # Left by the audit of another period.
+            return self.KINDS[0], None
+        LOG.info(_('Resuming the audit of %(kind)s after %(marker)s') %
+                 checkpoint)
+        return checkpoint['kind'], checkpoint.get('marker')
+
+    def _save_checkpoint(self, kind, marker):
+        if not self.checkpoint_file:
+            return
+        checkpoint = {'begin': str(self.begin), 'end': str(self.end),
+                      'kind': kind, 'marker': marker}
+        tmp = self.checkpoint_file + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(jsonutils.dumps(checkpoint))
+        os.rename(tmp, self.checkpoint_file)
+
+    def _pages(self, kind, marker):
+        """Yields the pages of volumes or snapshots after marker."""
+        if kind == 'volumes':
+            get_page, columns = (db.volume_get_active_by_window,
+                                 VOLUME_COLUMNS)
+        else:
+            get_page, columns = (db.snapshot_get_active_by_window,
+                                 SNAPSHOT_COLUMNS)
+        while True:
+            page = get_page(self.context, self.begin, self.end,
+                            marker=marker, limit=self.batch_size,
+                            columns=columns)
+            if not page:
+                return
+            yield page
+            if len(page) < self.batch_size:
+                return
+            marker = page[-1]['id']
+
+    def _in_period(self, moment):
+        return moment is not None and self.begin < moment < self.end
+
+    def _notify(self, kind, ref):
+        """Sends the notifications of a volume or snapshot."""
+        if kind == 'volumes':
+            notify = volume_utils.notify_about_volume_usage
+        else:
+            notify = volume_utils.notify_about_snapshot_usage
+        events = [('exists', self._extra_info)]
+        if self.send_actions:
+            for action, moment in (('create', ref['created_at']),
+                                   ('delete', ref['deleted_at'])):
+                if self._in_period(moment):
+                    extra_info = {'audit_period_beginning': str(moment),
+                                  'audit_period_ending': str(moment)}
+                    events.append(('%s.start' % action, extra_info))
+                    events.append(('%s.end' % action, extra_info))
+        for event_suffix, extra_info in events:
+            try:
+                notify(self.context, ref, event_suffix,
+                       extra_usage_info=extra_info)
+                self.sent += 1
+            except Exception:
+                self.failed += 1
+                LOG.exception(_('Failed to send %(event)s notification for '
+                                '%(kind)s %(id)s.') %
+                              {'event': event_suffix, 'kind': kind[:-1],
+                               'id': ref['id']})
+
+    def _audit(self, kind, marker):
+        pool = greenpool.GreenPool(self.workers)
+        for page in self._pages(kind, marker):
+            for ref in page:
+                pool.spawn_n(self._notify, kind, ref)
+            pool.waitall()
+            self.counts[kind] += len(page)
+            self._save_checkpoint(kind, page[-1]['id'])
+            stats = self.get_stats(time.time() - self._started)
+            LOG.info(_('Audited %(count)d %(kind)s, %(rate).1f volumes and '
+                       'snapshots per second') %
+                     {'count': self.counts[kind], 'kind': kind,
+                      'rate': stats['rows_per_second']})
+
+    def run(self):
+        """Sends the notifications, returns the audit statistics."""
+        self._started = started = time.time()
+        kind, marker = self._load_checkpoint()
+        for kind in self.KINDS[self.KINDS.index(kind):]:
+            self._audit(kind, marker)
+            marker = None
+        if self.checkpoint_file:
+            fileutils.delete_if_exists(self.checkpoint_file)
+        return self.get_stats(time.time() - started)
+
+    def get_stats(self, elapsed):
+        """Returns the rows audited and notifications sent and per second."""
+        elapsed = max(elapsed, 0.001)
+        stats = dict(self.counts)
+        stats.update({'sent': self.sent,
+                      'failed': self.failed,
+                      'seconds': elapsed,
+                      'rows_per_second': sum(self.counts.values()) / elapsed,
+                      'notifications_per_second': self.sent / elapsed})
+        return stats
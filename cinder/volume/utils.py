@@ -16,6 +16,8 @@
 
 
 import math
+import os
+import time
 
 from oslo.config import cfg
 
@@ -28,12 +30,19 @@ from cinder.openstack.common import strutils
 from cinder.openstack.common import units
 from cinder import rpc
 from cinder import utils
+from cinder.volume import block_copy
 
 
 CONF = cfg.CONF
 
 LOG = logging.getLogger(__name__)
 
+# The native copy engine reads and writes at least this much at a time.
+_MIN_COPY_CHUNK_SIZE = 4 * units.Mi
+
+# Number of volumes, MiB and seconds spent clearing them, by method.
+_CLEAR_STATS = {}
+
 
 def null_safe_str(s):
     return str(s) if s else ''
@@ -178,6 +187,29 @@ def _calculate_count(size_in_m, blocksize):
 
 def copy_volume(srcstr, deststr, size_in_m, blocksize, sync=False,
                 execute=utils.execute, ionice=None):
+    # The native copy engine can't change the I/O priority, so dd is used
+    # for that as well as for devices only root can open.
+    if (CONF.volume_copy_engine == 'native' and ionice is None and
+            block_copy.can_copy(srcstr, deststr)):
+        blocksize, count = _calculate_count(size_in_m, blocksize)
+        chunk_size = max(strutils.string_to_bytes('%sB' % blocksize),
+                         _MIN_COPY_CHUNK_SIZE)
+        try:
+            block_copy.copy(srcstr, deststr, size_in_m * units.Mi,
+                            chunk_size, workers=CONF.volume_copy_workers,
+                            bps_limit=CONF.volume_copy_bps_limit, sync=sync)
+            return
+        except (IOError, OSError) as e:
+            LOG.warn(_('Failed to copy %(src)s to %(dst)s, retrying with '
+                       'dd: %(error)s') %
+                     {'src': srcstr, 'dst': deststr, 'error': e})
+
+    _copy_volume_with_dd(srcstr, deststr, size_in_m, blocksize, sync=sync,
+                         execute=execute, ionice=ionice)
+
+
+def _copy_volume_with_dd(srcstr, deststr, size_in_m, blocksize, sync=False,
+                         execute=utils.execute, ionice=None):
     # Use O_DIRECT to avoid thrashing the system buffer cache
     extra_flags = []
     # Check whether O_DIRECT is supported to iflag and oflag separately
@@ -212,6 +244,96 @@ def copy_volume(srcstr, deststr, size_in_m, blocksize, sync=False,
     execute(*cmd, run_as_root=True)
 
 
+def _get_block_queue_limit(volume_path, name):
+    """Returns a limit of the request queue of a block device, 0 if unset."""
+    device = os.path.basename(os.path.realpath(volume_path))
+    try:
+        with open(os.path.join('/sys/class/block', device, 'queue',
+                               name)) as f:
+            return int(f.read().strip())
+    except (IOError, ValueError):
+        return 0
+
+
+def get_discard_method(volume_path):
+    """Returns how volume_path can be cleared without writing zeros to it.
+
+    'discard' if the device reads discarded blocks back as zeros,
+    'zeroout' if the device zeroes blocks itself, or None.
+    """
+    if (_get_block_queue_limit(volume_path, 'discard_max_bytes') and
+            _get_block_queue_limit(volume_path, 'discard_zeroes_data')):
+        return 'discard'
+    if _get_block_queue_limit(volume_path, 'write_zeroes_max_bytes'):
+        return 'zeroout'
+    return None
+
+
+def _reads_zeros(volume_path, volume_clear_size):
+    """Checks that the first, middle and last MiB cleared read as zeros."""
+    zeros = '\0' * units.Mi
+    for skip in sorted(set([0, volume_clear_size // 2,
+                            volume_clear_size - 1])):
+        out, _err = utils.execute('dd', 'if=%s' % volume_path, 'bs=1M',
+                                  'count=1', 'skip=%d' % skip,
+                                  'iflag=direct', run_as_root=True)
+        if out != zeros:
+            return False
+    return True
+
+
+def _clear_volume_with_discard(volume_clear_size, volume_path):
+    """Clears the volume with BLKDISCARD or BLKZEROOUT.
+
+    Returns the method used, or None if the device does not support one
+    or the volume did not read back as zeros.
+    """
+    method = get_discard_method(volume_path)
+    if method is None:
+        LOG.info(_("%s does not support clearing by discard") % volume_path)
+        return None
+
+    cmd = ['blkdiscard', '-o', '0', '-l', str(volume_clear_size * units.Mi)]
+    if method == 'zeroout':
+        cmd.append('-z')
+    cmd.append(volume_path)
+    try:
+        utils.execute(*cmd, run_as_root=True)
+        if _reads_zeros(volume_path, volume_clear_size):
+            return method
+        LOG.warning(_("%s does not read as zeros after discard") %
+                    volume_path)
+    except processutils.ProcessExecutionError as ex:
+        LOG.warning(_("Failed to discard %(path)s: %(err)s") %
+                    {'path': volume_path, 'err': ex})
+    return None
+
+
+def _record_clear(method, volume_clear_size, seconds):
+    stats = _CLEAR_STATS.setdefault(method, {'count': 0, 'mb': 0,
+                                             'seconds': 0.0})
+    stats['count'] += 1
+    stats['mb'] += volume_clear_size
+    stats['seconds'] += seconds
+    LOG.info(_("Cleared %(size)d MiB by %(method)s in %(seconds).2f s") %
+             {'size': volume_clear_size, 'method': method,
+              'seconds': seconds})
+
+
+def get_clear_stats():
+    """Returns what this process has cleared so far, by method.
+
+    For each method used there are the number of volumes cleared, the
+    MiB cleared, the seconds spent and the throughput in MiB/s.
+    """
+    result = {}
+    for method, stats in _CLEAR_STATS.items():
+        result[method] = dict(stats)
+        result[method]['mb_per_second'] = (
+            stats['mb'] / stats['seconds'] if stats['seconds'] else 0.0)
+    return result
+
+
 def clear_volume(volume_size, volume_path, volume_clear=None,
                  volume_clear_size=None, volume_clear_ionice=None):
     """Unprovision old volumes to prevent data leaking between users."""
@@ -227,24 +349,35 @@ def clear_volume(volume_size, volume_path, volume_clear=None,
     if volume_clear_ionice is None:
         volume_clear_ionice = CONF.volume_clear_ionice
 
+    if volume_clear not in ('zero', 'shred', 'discard'):
+        raise exception.InvalidConfigurationValue(
+            option='volume_clear',
+            value=volume_clear)
+
     LOG.info(_("Performing secure delete on volume: %s") % volume_path)
+    start = time.time()
+
+    if volume_clear == 'discard':
+        method = _clear_volume_with_discard(volume_clear_size, volume_path)
+        if method is not None:
+            _record_clear(method, volume_clear_size, time.time() - start)
+            return
+        LOG.info(_("Clearing %s with zeros instead") % volume_path)
+        volume_clear = 'zero'
 
     if volume_clear == 'zero':
-        return copy_volume('/dev/zero', volume_path, volume_clear_size,
-                           CONF.volume_dd_blocksize,
-                           sync=True, execute=utils.execute,
-                           ionice=volume_clear_ionice)
-    elif volume_clear == 'shred':
+        copy_volume('/dev/zero', volume_path, volume_clear_size,
+                    CONF.volume_dd_blocksize,
+                    sync=True, execute=utils.execute,
+                    ionice=volume_clear_ionice)
+    else:
         clear_cmd = ['shred', '-n3']
         if volume_clear_size:
             clear_cmd.append('-s%dMiB' % volume_clear_size)
-    else:
-        raise exception.InvalidConfigurationValue(
-            option='volume_clear',
-            value=volume_clear)
-
-    clear_cmd.append(volume_path)
-    utils.execute(*clear_cmd, run_as_root=True)
+        clear_cmd.append(volume_path)
+        utils.execute(*clear_cmd, run_as_root=True)
+    _record_clear(volume_clear, volume_clear_size or volume_size,
+                  time.time() - start)
 
 
 def supports_thin_provisioning():
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure backup compression throughput over synthetic volume data.
+
+The data mixes incompressible (random), compressible (repeated text) and
+all-zero chunks. Every available compressor is run single threaded and
+with a thread per chunk in flight, and the number of chunks the adaptive
+mode (backup_compression_min_ratio) would store uncompressed is reported.
+
+Usage: python tools/benchmarks/backup_compression.py [size_mb] [chunk_mb]
+                                                     [threads] [min_ratio]
+"""
+
+from __future__ import print_function
+
+from multiprocessing.pool import ThreadPool
+import os
+import random
+import sys
+import time
+
+from cinder.backup import compression
+
+
+ALGORITHMS = ('zlib', 'bz2', 'lz4', 'zstd')
+
+
+def make_chunks(size_mb, chunk_mb):
+    chunk_size = chunk_mb * 1024 * 1024
+    text = ''.join(random.choice('abcdefghij \n') for i in range(4096))
+    chunks = []
+    for i in range(size_mb // chunk_mb):
+        kind = i % 3
+        if kind == 0:
+            chunks.append(os.urandom(chunk_size))
+        elif kind == 1:
+            chunks.append((text * (chunk_size // len(text) + 1))[:chunk_size])
+        else:
+            chunks.append('\0' * chunk_size)
+    return chunks
+
+
+def run(compressor, chunks, threads, min_ratio):
+    pool = ThreadPool(threads) if threads > 1 else None
+    start = time.time()
+    if pool:
+        results = pool.map(compressor.compress, chunks)
+        pool.close()
+    else:
+        results = map(compressor.compress, chunks)
+    elapsed = time.time() - start
+    stored = 0
+    raw = 0
+    for data, compressed in zip(chunks, results):
+        if len(data) < len(compressed) * min_ratio:
+            raw += 1
+            stored += len(data)
+        else:
+            stored += len(compressed)
+    return elapsed, stored, raw
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 192
+    chunk_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    threads = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    min_ratio = float(sys.argv[4]) if len(sys.argv) > 4 else 1.0
+    chunks = make_chunks(size_mb, chunk_mb)
+    total = sum(len(chunk) for chunk in chunks)
+    print('%d MB in %d chunks of %d MB, min ratio %.2f' %
+          (total // 2 ** 20, len(chunks), chunk_mb, min_ratio))
+    print('%-6s %8s %14s %14s %6s' %
+          ('codec', 'ratio', '1 thread MB/s',
+           '%d threads MB/s' % threads, 'raw'))
+    for algorithm in ALGORITHMS:
+        try:
+            compressor = compression.get_compressor(algorithm)
+        except ValueError:
+            print('%-6s not installed' % algorithm)
+            continue
+        single, stored, raw = run(compressor, chunks, 1, min_ratio)
+        multi = run(compressor, chunks, threads, min_ratio)[0]
+        print('%-6s %8.2f %14.1f %14.1f %6d' %
+              (algorithm, float(total) / stored,
+               total / single / 2 ** 20, total / multi / 2 ** 20, raw))
+
+
+if __name__ == '__main__':
+    main()
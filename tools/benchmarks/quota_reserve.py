@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure concurrent quota reservations for a single project.
+
+Every thread reserves one volume and 10 GB for the same project, like
+concurrent volume creates do. Reservations are run once through the
+locked path only and once with the unlocked conditional UPDATE first.
+
+Usage: python tools/benchmarks/quota_reserve.py [connection] [threads]
+                                                [reservations]
+
+connection defaults to a SQLite database in a temporary directory; pass
+a MySQL URL to measure row locking contention.
+"""
+
+from __future__ import print_function
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from oslo.config import cfg
+
+from cinder import context
+from cinder import db
+from cinder.db import migration
+from cinder.db.sqlalchemy import api as sqlalchemy_api
+from cinder.openstack.common.db import exception as db_exc
+from cinder.quota import ReservableResource
+
+
+CONF = cfg.CONF
+CONF.import_opt('no_snapshot_gb_quota', 'cinder.common.config')
+
+RESOURCES = {'volumes': ReservableResource('volumes', '_sync_volumes'),
+             'gigabytes': ReservableResource('gigabytes', '_sync_gigabytes')}
+QUOTAS = {'volumes': -1, 'gigabytes': -1}
+DELTAS = {'volumes': 1, 'gigabytes': 10}
+
+
+def reserve(ctxt, count, errors):
+    expire = datetime.datetime.utcnow() + datetime.timedelta(days=1)
+    for i in range(count):
+        while True:
+            try:
+                db.quota_reserve(ctxt, RESOURCES, QUOTAS, DELTAS, expire,
+                                 0, 0, project_id='bench')
+                break
+            except db_exc.DBError:
+                # SQLite gives up on a locked database instead of waiting.
+                errors.append(1)
+
+
+def run(threads, count):
+    ctxt = context.get_admin_context()
+    # Create the usages before measuring.
+    reserve(ctxt, 1, [])
+    errors = []
+    workers = [threading.Thread(target=reserve, args=(ctxt, count, errors))
+               for i in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+    usage = db.quota_usage_get(ctxt, 'bench', 'volumes')
+    return elapsed, usage.reserved, len(errors)
+
+
+def main():
+    tmpdir = None
+    if len(sys.argv) > 1 and sys.argv[1] != '-':
+        connection = sys.argv[1]
+    else:
+        tmpdir = tempfile.mkdtemp()
+        connection = 'sqlite:///%s' % os.path.join(tmpdir, 'cinder.sqlite')
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    CONF([], project='cinder')
+    CONF.set_override('connection', connection, 'database')
+    try:
+        migration.db_sync()
+        unlocked = sqlalchemy_api._quota_reserve_unlocked
+        for name, path in (('locked', lambda *args: None),
+                           ('conditional update', unlocked)):
+            sqlalchemy_api._quota_reserve_unlocked = path
+            db.quota_destroy_all_by_project(context.get_admin_context(),
+                                            'bench')
+            elapsed, reserved, retries = run(threads, count)
+            total = threads * count
+            print('%-20s %d threads x %d: %7.1f reservations/s, '
+                  'reserved %d, %d retries' %
+                  (name, threads, count, total / elapsed, reserved,
+                   retries))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the expiry of stale quota reservations.
+
+Expired reservations of volumes and gigabytes are spread over a number
+of projects, as an outage leaves them, and are expired once with a loop
+over the reservations and their usages in the ORM, like
+reservation_expire() used to, and once with reservation_expire().
+
+Usage: python tools/benchmarks/reservation_expire.py [connection]
+                                                     [reservations]
+                                                     [projects]
+
+connection defaults to a SQLite database in a temporary directory.
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+from oslo.config import cfg
+
+from cinder import context
+from cinder import db
+from cinder.db import migration
+from cinder.db.sqlalchemy import api as sqlalchemy_api
+from cinder.db.sqlalchemy import models
+from cinder.openstack.common import timeutils
+
+
+CONF = cfg.CONF
+
+RESOURCES = (('volumes', 1), ('gigabytes', 10))
+
+
+def setup(count, projects):
+    """Creates count expired reservations spread over projects."""
+    engine = sqlalchemy_api.get_engine()
+    engine.execute(models.Reservation.__table__.delete())
+    engine.execute(models.QuotaUsage.__table__.delete())
+    now = timeutils.utcnow()
+    per_usage = count // (projects * len(RESOURCES))
+    usages = []
+    for project in range(projects):
+        for resource, delta in RESOURCES:
+            usages.append({'id': len(usages) + 1,
+                           'project_id': 'project%d' % project,
+                           'resource': resource, 'in_use': 0,
+                           'reserved': per_usage * delta,
+                           'created_at': now, 'deleted': False})
+    engine.execute(models.QuotaUsage.__table__.insert(), usages)
+    reservations = []
+    for usage in usages:
+        delta = dict(RESOURCES)[usage['resource']]
+        for i in range(per_usage):
+            reservations.append({'uuid': str(uuid.uuid4()),
+                                 'usage_id': usage['id'],
+                                 'project_id': usage['project_id'],
+                                 'resource': usage['resource'],
+                                 'delta': delta, 'expire': now,
+                                 'created_at': now, 'deleted': False})
+    for i in range(0, len(reservations), 10000):
+        engine.execute(models.Reservation.__table__.insert(),
+                       reservations[i:i + 10000])
+    return len(reservations)
+
+
+def orm_expire(ctxt):
+    """Expires the reservations one at a time, as was done before."""
+    session = sqlalchemy_api.get_session()
+    with session.begin():
+        results = sqlalchemy_api.model_query(
+            ctxt, models.Reservation, session=session,
+            read_deleted="no").\
+            filter(models.Reservation.expire < timeutils.utcnow()).\
+            all()
+        for reservation in results:
+            if reservation.delta >= 0:
+                reservation.usage.reserved -= reservation.delta
+                reservation.usage.save(session=session)
+            reservation.delete(session=session)
+
+
+def main():
+    tmpdir = None
+    if len(sys.argv) > 1 and sys.argv[1] != '-':
+        connection = sys.argv[1]
+    else:
+        tmpdir = tempfile.mkdtemp()
+        connection = 'sqlite:///%s' % os.path.join(tmpdir, 'cinder.sqlite')
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    projects = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+    CONF([], project='cinder')
+    CONF.set_override('connection', connection, 'database')
+    try:
+        migration.db_sync()
+        ctxt = context.get_admin_context()
+        for name, expire in (('per reservation', orm_expire),
+                             ('set based', db.reservation_expire)):
+            total = setup(count, projects)
+            start = time.time()
+            expire(ctxt)
+            elapsed = time.time() - start
+            reserved = sum(usage.reserved for usage in
+                           sqlalchemy_api.model_query(ctxt,
+                                                      models.QuotaUsage))
+            print('%-16s %d reservations of %d projects: %6.1f s, '
+                  '%8.1f reservations/s, %d left reserved' %
+                  (name, total, projects, elapsed, total / elapsed,
+                   reserved))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
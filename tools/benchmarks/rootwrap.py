@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the overhead of running commands through rootwrap.
+
+The same command is run directly, through a new cinder-rootwrap process
+per command (as use_rootwrap_daemon=False does) and through a single
+rootwrap daemon (use_rootwrap_daemon=True), with the filters shipped in
+etc/cinder/rootwrap.d.  sudo is left out; it adds its own cost to every
+command in the per-command case and only to the daemon's start otherwise.
+
+Usage: python tools/benchmarks/rootwrap.py [commands] [command...]
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from oslo.rootwrap import client
+
+
+FILTERS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, os.pardir,
+                           'etc', 'cinder', 'rootwrap.d')
+ROOTWRAP = 'from oslo.rootwrap import cmd; cmd.main()'
+ROOTWRAP_DAEMON = 'from oslo.rootwrap import cmd; cmd.daemon()'
+
+
+def write_config(tmpdir, command):
+    filters_path = os.path.join(tmpdir, 'rootwrap.d')
+    shutil.copytree(FILTERS_DIR, filters_path)
+    with open(os.path.join(filters_path, 'benchmark.filters'), 'w') as f:
+        f.write('[Filters]\n%s: CommandFilter, %s, root\n' %
+                (os.path.basename(command[0]), command[0]))
+    config = os.path.join(tmpdir, 'rootwrap.conf')
+    with open(config, 'w') as f:
+        f.write('[DEFAULT]\nfilters_path=%s\n'
+                'exec_dirs=/sbin,/usr/sbin,/bin,/usr/bin\n'
+                'use_syslog=False\n' % filters_path)
+    return config
+
+
+def direct(config, command):
+    subprocess.check_call(command)
+
+
+def per_command(config, command):
+    subprocess.check_call([sys.executable, '-c', ROOTWRAP, config] + command)
+
+
+def make_daemon():
+    daemon = []
+
+    def run(config, command):
+        if not daemon:
+            daemon.append(client.Client([sys.executable, '-c',
+                                         ROOTWRAP_DAEMON, config]))
+        returncode = daemon[0].execute(command)[0]
+        if returncode:
+            raise subprocess.CalledProcessError(returncode, command)
+    return run
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    command = sys.argv[2:] or ['true']
+    tmpdir = tempfile.mkdtemp()
+    try:
+        config = write_config(tmpdir, command)
+        results = []
+        for name, func in (('direct', direct),
+                           ('per command', per_command),
+                           ('daemon', make_daemon())):
+            start = time.time()
+            for i in range(count):
+                func(config, command)
+            results.append((name, (time.time() - start) / count))
+        base = results[0][1]
+        for name, elapsed in results:
+            print('%-12s %d x %s: %7.2f ms/command, %7.2f ms overhead' %
+                  (name, count, ' '.join(command), elapsed * 1000,
+                   (elapsed - base) * 1000))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare per-host and columnar evaluation of the capacity filter/weigher.
+
+Usage: python tools/benchmarks/scheduler_columnar.py [hosts] [iterations]
+"""
+
+from __future__ import print_function
+
+import random
+import sys
+import time
+
+from oslo.config import cfg
+
+from cinder.openstack.common.scheduler import weights
+from cinder.scheduler import columnar
+from cinder.scheduler.filters import capacity_filter
+from cinder.scheduler import host_manager
+from cinder.scheduler.weights import capacity
+
+
+CONF = cfg.CONF
+
+
+def make_hosts(count):
+    """Build host states tracked by a columnar store, like HostManager."""
+    columns = columnar.CapacityColumns()
+    hosts = []
+    for i in range(count):
+        host = host_manager.HostState('host%d' % i)
+        host.total_capacity_gb = 10240
+        host.free_capacity_gb = random.randint(0, 10240)
+        host.allocated_capacity_gb = 10240 - host.free_capacity_gb
+        host.reserved_percentage = random.choice([0, 5, 10])
+        columns.add(host)
+        hosts.append(host)
+    return hosts
+
+
+def run(hosts, iterations):
+    filter_handler = host_manager.filters.HostFilterHandler(
+        'cinder.scheduler.filters')
+    weight_handler = weights.HostWeightHandler('cinder.scheduler.weights')
+    filter_properties = {'size': 100}
+    start = time.time()
+    for i in range(iterations):
+        passed = filter_handler.get_filtered_objects(
+            [capacity_filter.CapacityFilter], hosts, filter_properties)
+        weighed = weight_handler.get_weighed_objects(
+            [capacity.CapacityWeigher], passed, filter_properties)
+    return (time.time() - start) / iterations, weighed[0].obj.host
+
+
+def main():
+    if columnar.numpy is None:
+        print('NumPy is not installed, nothing to compare.')
+        return 1
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    CONF([], project='cinder')
+    hosts = make_hosts(count)
+
+    CONF.set_override('scheduler_columnar_evaluation', False)
+    per_host, per_host_top = run(hosts, iterations)
+    CONF.set_override('scheduler_columnar_evaluation', True)
+    batched, batched_top = run(hosts, iterations)
+
+    print('hosts: %d, iterations: %d' % (count, iterations))
+    print('per-host: %.3f ms/request' % (per_host * 1000))
+    print('columnar: %.3f ms/request' % (batched * 1000))
+    print('speedup:  %.1fx' % (per_host / batched))
+    if per_host_top != batched_top:
+        print('top hosts differ: %s != %s' % (per_host_top, batched_top))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
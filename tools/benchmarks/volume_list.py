@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# Copyright (c) 2014 OpenStack Foundation
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure paging through all volumes like the volume list API does.
+
+Pages are read with joined loads of the metadata and a separate marker
+lookup (as volume listing used to), with batched metadata loads and the
+marker resolved in the page query (detail), and with only the columns
+the summary view needs (summary).
+
+Usage: python tools/benchmarks/volume_list.py [volumes] [page_size]
+                                              [connection]
+"""
+
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from cinder.common import sqlalchemyutils
+from cinder import context
+from cinder import db
+from cinder.db import migration
+from cinder.db.sqlalchemy import api as sqlalchemy_api
+from cinder.db.sqlalchemy import models
+
+
+CONF = cfg.CONF
+SORT_KEYS = ['created_at', 'created_at', 'id']
+METADATA = dict(('key%d' % i, 'value%d' % i) for i in range(5))
+ADMIN_METADATA = {'readonly': 'False', 'attached_mode': 'rw'}
+
+
+def joined(ctxt, marker, limit):
+    session = sqlalchemy_api.get_session()
+    with session.begin():
+        query = sqlalchemy_api._volume_get_query(ctxt, session=session)
+        marker_volume = None
+        if marker is not None:
+            marker_volume = sqlalchemy_api._volume_get(ctxt, marker, session)
+        query = sqlalchemyutils.paginate_query(query, models.Volume, limit,
+                                               SORT_KEYS,
+                                               marker=marker_volume,
+                                               sort_dir='desc')
+        return query.all()
+
+
+def detail(ctxt, marker, limit):
+    return db.volume_get_all(ctxt, marker, limit, 'created_at', 'desc')
+
+
+def summary(ctxt, marker, limit):
+    return db.volume_get_all(ctxt, marker, limit, 'created_at', 'desc',
+                             columns=('id', 'display_name'))
+
+
+def page_through(func, ctxt, page_size):
+    count = 0
+    marker = None
+    start = time.time()
+    while True:
+        volumes = func(ctxt, marker, page_size)
+        if not volumes:
+            break
+        count += len(volumes)
+        marker = volumes[-1]['id']
+    return count, time.time() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    tmpdir = None
+    if len(sys.argv) > 3:
+        connection = sys.argv[3]
+    else:
+        tmpdir = tempfile.mkdtemp()
+        connection = 'sqlite:///%s' % os.path.join(tmpdir, 'cinder.sqlite')
+    CONF([], project='cinder')
+    CONF.set_override('connection', connection, 'database')
+    try:
+        migration.db_sync()
+        ctxt = context.get_admin_context()
+        for i in range(count):
+            db.volume_create(ctxt, {'display_name': 'vol%d' % i,
+                                    'metadata': METADATA,
+                                    'admin_metadata': ADMIN_METADATA})
+        for name, func in (('joined', joined), ('detail', detail),
+                           ('summary', summary)):
+            listed, elapsed = page_through(func, ctxt, page_size)
+            print('%-8s %d volumes in pages of %d: %.2fs' %
+                  (name, listed, page_size, elapsed))
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()